@@ -0,0 +1,59 @@
+"""Convert product tags and scenes to JSONB with GIN indexes
+
+Revision ID: 20261017100000
+Revises: 20251207144318
+Create Date: 2026-10-17 10:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '20261017100000'
+down_revision = '20251207144318'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # JSON -> JSONB，支持 ?| / @> 等操作符及GIN索引
+    op.alter_column(
+        'products', 'tags',
+        type_=postgresql.JSONB(astext_type=sa.Text()),
+        existing_type=postgresql.JSON(astext_type=sa.Text()),
+        existing_nullable=True,
+        postgresql_using='tags::jsonb',
+    )
+    op.alter_column(
+        'products', 'suitable_scenes',
+        type_=postgresql.JSONB(astext_type=sa.Text()),
+        existing_type=postgresql.JSON(astext_type=sa.Text()),
+        existing_nullable=True,
+        postgresql_using='suitable_scenes::jsonb',
+    )
+    
+    # 默认 jsonb_ops 操作符类同时支持 ?|（任一元素）和 @>（包含）
+    op.create_index('ix_products_tags_gin', 'products', ['tags'], unique=False, postgresql_using='gin')
+    op.create_index('ix_products_suitable_scenes_gin', 'products', ['suitable_scenes'], unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_products_suitable_scenes_gin', table_name='products')
+    op.drop_index('ix_products_tags_gin', table_name='products')
+    
+    op.alter_column(
+        'products', 'suitable_scenes',
+        type_=postgresql.JSON(astext_type=sa.Text()),
+        existing_type=postgresql.JSONB(astext_type=sa.Text()),
+        existing_nullable=True,
+        postgresql_using='suitable_scenes::json',
+    )
+    op.alter_column(
+        'products', 'tags',
+        type_=postgresql.JSON(astext_type=sa.Text()),
+        existing_type=postgresql.JSONB(astext_type=sa.Text()),
+        existing_nullable=True,
+        postgresql_using='tags::json',
+    )
@@ -0,0 +1,90 @@
+"""Add composite, partial and covering indexes for recommendation queries
+
+Revision ID: 20261017110000
+Revises: 20261017100000
+Create Date: 2026-10-17 11:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20261017110000'
+down_revision = '20261017100000'
+branch_labels = None
+depends_on = None
+
+
+# 推荐查询的筛选列，放进 INCLUDE 后筛选可以直接在索引上完成（仅索引扫描）
+FILTER_COLUMNS = ['id', 'price', 'category_id', 'suitable_gender', 'suitable_age_range', 'style']
+
+# 默认排序：rating DESC NULLS LAST, sales_count DESC NULLS LAST, created_at DESC
+RANK_COLUMNS = [
+    sa.text('rating DESC NULLS LAST'),
+    sa.text('sales_count DESC NULLS LAST'),
+    sa.text('created_at DESC'),
+]
+
+INDEXES = [
+    # 默认排序 / 评分排序：按索引顺序扫描，找到10个满足条件的商品即停止，不需要排序
+    dict(
+        index_name='ix_products_rank',
+        columns=RANK_COLUMNS,
+        postgresql_include=FILTER_COLUMNS,
+    ),
+    # 限定分类时先按分类定位，再按默认排序取前10
+    dict(
+        index_name='ix_products_category_rank',
+        columns=['category_id'] + RANK_COLUMNS,
+        postgresql_include=[c for c in FILTER_COLUMNS if c != 'category_id'],
+    ),
+    # 价格区间 / 价格排序；价格区间条件隐含 price IS NOT NULL，无价格的商品不进索引
+    dict(
+        index_name='ix_products_price',
+        columns=['price'],
+        postgresql_include=[c for c in FILTER_COLUMNS if c != 'price'],
+        postgresql_where=sa.text('price IS NOT NULL'),
+    ),
+    # 销量排序
+    dict(
+        index_name='ix_products_sales',
+        columns=[sa.text('sales_count DESC NULLS LAST')],
+        postgresql_include=FILTER_COLUMNS,
+    ),
+    # 回退推荐：rating DESC NULLS LAST, created_at DESC，按预算和风格筛选
+    dict(
+        index_name='ix_products_fallback_rank',
+        columns=[sa.text('rating DESC NULLS LAST'), sa.text('created_at DESC')],
+        postgresql_include=['id', 'price', 'style'],
+    ),
+]
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY 不能在事务中执行，建索引期间不阻塞商品表写入
+    with op.get_context().autocommit_block():
+        for index in INDEXES:
+            op.create_index(
+                index['index_name'],
+                'products',
+                index['columns'],
+                unique=False,
+                postgresql_include=index['postgresql_include'],
+                postgresql_where=index.get('postgresql_where'),
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+        # 更新统计信息和可见性映射，仅索引扫描才能少回表
+        op.execute('VACUUM ANALYZE products')
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for index in reversed(INDEXES):
+            op.drop_index(
+                index['index_name'],
+                table_name='products',
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
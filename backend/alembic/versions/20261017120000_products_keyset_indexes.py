@@ -0,0 +1,38 @@
+"""Add keyset pagination indexes for product listing filters
+
+Revision ID: 20261017120000
+Revises: 20261017110000
+Create Date: 2026-10-17 12:00:00
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '20261017120000'
+down_revision = '20261017110000'
+branch_labels = None
+depends_on = None
+
+
+# 商品列表按 id 游标分页：筛选列在前、id 在后，WHERE 筛选 AND id > 游标 ORDER BY id 是一次索引范围扫描
+# 不带筛选条件时直接使用主键索引
+INDEXES = [
+    ('ix_products_category_id_id', ['category_id', 'id']),
+    ('ix_products_platform_id', ['platform', 'id']),
+]
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES:
+            op.create_index(
+                name, 'products', columns, unique=False,
+                postgresql_concurrently=True, if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, _ in reversed(INDEXES):
+            op.drop_index(name, table_name='products', postgresql_concurrently=True, if_exists=True)
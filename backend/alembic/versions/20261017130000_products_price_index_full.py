@@ -0,0 +1,47 @@
+"""Make the products price index non-partial
+
+Revision ID: 20261017130000
+Revises: 20261017120000
+Create Date: 2026-10-17 13:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20261017130000'
+down_revision = '20261017120000'
+branch_labels = None
+depends_on = None
+
+
+# ix_products_price 原为部分索引（WHERE price IS NOT NULL），只有带价格区间的查询能用；
+# 不带价格区间按价格排序时规划器无法使用它，只能对整个筛选结果排序。
+# 改为完整索引：price ASC 的 NULL 在最后、反向扫描的 NULL 在最前，与 ORDER BY price ASC / DESC 一致
+INCLUDE = ['id', 'category_id', 'suitable_gender', 'suitable_age_range', 'style']
+
+
+def _rebuild(where) -> None:
+    # 先并发建好新索引再替换旧索引，期间价格查询始终有索引可用
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_products_price_new',
+            'products',
+            ['price'],
+            unique=False,
+            postgresql_include=INCLUDE,
+            postgresql_where=where,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.drop_index('ix_products_price', table_name='products', postgresql_concurrently=True, if_exists=True)
+        op.execute('ALTER INDEX ix_products_price_new RENAME TO ix_products_price')
+
+
+def upgrade() -> None:
+    _rebuild(None)
+
+
+def downgrade() -> None:
+    _rebuild(sa.text('price IS NOT NULL'))
@@ -3,8 +3,9 @@
 """
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from app.core.database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.database import AsyncSessionLocal, get_db
 from app.core.security import verify_password, get_password_hash, create_access_token, decode_access_token
 from app.schemas.user import UserCreate, UserLogin, UserResponse, Token
 from app.models.user import User, UserRole
@@ -13,10 +14,16 @@ from typing import Optional
 router = APIRouter(prefix="/auth", tags=["auth"])
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login")
+oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login", auto_error=False)
 
-def get_current_user(
+async def _get_user(db: AsyncSession, condition) -> Optional[User]:
+    """按条件查询单个用户"""
+    result = await db.execute(select(User).where(condition))
+    return result.scalars().first()
+
+async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> User:
     """获取当前登录用户"""
     payload = decode_access_token(token)
@@ -33,7 +40,7 @@ def get_current_user(
             detail="无效的token",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    user = db.query(User).filter(User.username == username).first()
+    user = await _get_user(db, User.username == username)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -42,11 +49,27 @@ def get_current_user(
         )
     return user
 
+async def get_optional_user(
+    token: Optional[str] = Depends(oauth2_scheme_optional)
+) -> Optional[User]:
+    """
+    获取当前登录用户（可选），未登录或token无效时返回None
+
+    查询使用独立的短会话，查完即归还连接：推荐接口在等待LLM期间不占用数据库连接。
+    """
+    if not token:
+        return None
+    payload = decode_access_token(token)
+    if payload is None or payload.get("sub") is None:
+        return None
+    async with AsyncSessionLocal() as db:
+        return await _get_user(db, User.username == payload["sub"])
+
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def register(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
     """用户注册"""
     # 检查用户名是否已存在
-    db_user = db.query(User).filter(User.username == user_data.username).first()
+    db_user = await _get_user(db, User.username == user_data.username)
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -55,7 +78,7 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
     
     # 检查邮箱是否已存在（如果提供了邮箱）
     if user_data.email:
-        db_user = db.query(User).filter(User.email == user_data.email).first()
+        db_user = await _get_user(db, User.email == user_data.email)
         if db_user:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -72,18 +95,18 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
         is_active="true"
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
 @router.post("/login", response_model=Token)
 async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """用户登录"""
     # 查找用户
-    user = db.query(User).filter(User.username == form_data.username).first()
+    user = await _get_user(db, User.username == form_data.username)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -116,10 +139,10 @@ async def login(
     )
 
 @router.post("/login-json", response_model=Token)
-async def login_json(user_data: UserLogin, db: Session = Depends(get_db)):
+async def login_json(user_data: UserLogin, db: AsyncSession = Depends(get_db)):
     """用户登录（JSON格式，方便前端调用）"""
     # 查找用户
-    user = db.query(User).filter(User.username == user_data.username).first()
+    user = await _get_user(db, User.username == user_data.username)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -1,31 +1,40 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
+import orjson
+from app.core.config import settings
 from app.core.database import get_db
+from app.core.http_cache import cached_response, content_etag
 from app.models.category import Category
 from app.schemas.category import Category as CategorySchema, CategoryCreate
+from app.services.category_cache import category_cache
 
 router = APIRouter(prefix="/categories", tags=["categories"])
 
+CACHE_CONTROL = f"public, max-age={settings.CATEGORY_HTTP_MAX_AGE}"
+
 @router.get("/", response_model=List[CategorySchema])
-async def get_categories(db: Session = Depends(get_db)):
-    """获取所有礼品分类"""
-    categories = db.query(Category).all()
-    return categories
+async def get_categories(request: Request):
+    """获取所有礼品分类（进程内缓存，支持 If-None-Match）"""
+    snapshot = await category_cache.get()
+    return cached_response(request, snapshot.body, snapshot.etag, CACHE_CONTROL)
 
 @router.get("/{category_id}", response_model=CategorySchema)
-async def get_category(category_id: int, db: Session = Depends(get_db)):
+async def get_category(category_id: int, request: Request):
     """获取单个分类详情"""
-    category = db.query(Category).filter(Category.id == category_id).first()
+    snapshot = await category_cache.get()
+    category = snapshot.by_id.get(category_id)
     if not category:
         raise HTTPException(status_code=404, detail="Category not found")
-    return category
+    body = orjson.dumps(category)
+    return cached_response(request, body, content_etag(body), CACHE_CONTROL)
 
 @router.post("/", response_model=CategorySchema)
-async def create_category(category: CategoryCreate, db: Session = Depends(get_db)):
+async def create_category(category: CategoryCreate, db: AsyncSession = Depends(get_db)):
     """创建礼品分类"""
     db_category = Category(**category.model_dump())
     db.add(db_category)
-    db.commit()
-    db.refresh(db_category)
+    await db.commit()
+    await db.refresh(db_category)
+    category_cache.invalidate()
     return db_category
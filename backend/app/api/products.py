@@ -1,44 +1,153 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+import base64
+import binascii
+import json
+from app.core.config import settings
 from app.core.database import get_db
+from app.core.http_cache import not_modified
 from app.models.product import Product
-from app.schemas.product import ProductResponse, ProductCreate
+from app.schemas.product import ProductResponse, ProductCreate, ProductPage
+from app.services.facet_index import product_facet_index
+from app.services.product_rows import fetch_rows, fetch_rows_by_ids, parse_fields, select_products
+from app.services.search_index import SNIPPET_CHARS, highlight, product_search_index, tokenize
 
 router = APIRouter(prefix="/products", tags=["products"])
 
-@router.get("/", response_model=List[ProductResponse])
+DETAIL_CACHE_CONTROL = f"public, max-age={settings.PRODUCT_HTTP_MAX_AGE}"
+
+
+def _encode_cursor(last_id: int) -> str:
+    """游标只记录上一页最后一个商品的ID，对客户端不透明"""
+    raw = json.dumps({"id": last_id}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> int:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        last_id = json.loads(raw)["id"]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(last_id, int):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return last_id
+
+
+@router.get("/", response_model=ProductPage)
 async def get_products(
-    skip: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
     limit: int = Query(100, ge=1, le=100),
     category_id: Optional[int] = None,
     platform: Optional[str] = None,
-    db: Session = Depends(get_db)
+    fields: Optional[str] = Query(None, description="只返回这些字段，逗号分隔，如 id,name,price,image_url"),
+    db: AsyncSession = Depends(get_db)
 ):
-    """获取商品列表"""
-    query = db.query(Product)
-    
+    """
+    获取商品列表（按ID游标分页）
+
+    翻页时把上一页返回的 next_cursor 原样传回，筛选条件保持不变；
+    每页都是一次索引范围扫描，与翻到第几页无关。
+    列表直接取行映射并用 orjson 序列化，不构建ORM对象、不做逐行校验。
+    """
+    try:
+        columns = parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    query = select_products(columns)
+
     if category_id:
-        query = query.filter(Product.category_id == category_id)
+        query = query.where(Product.category_id == category_id)
     if platform:
-        query = query.filter(Product.platform == platform)
-    
-    products = query.offset(skip).limit(limit).all()
-    return products
+        query = query.where(Product.platform == platform)
+    if cursor:
+        query = query.where(Product.id > _decode_cursor(cursor))
+
+    # 多取一条用于判断是否还有下一页
+    rows = await fetch_rows(db, query.order_by(Product.id).limit(limit + 1))
+    next_cursor = _encode_cursor(rows[limit - 1]["id"]) if len(rows) > limit else None
+    return ORJSONResponse({"items": rows[:limit], "next_cursor": next_cursor})
+
+@router.get("/search")
+async def search_products(
+    q: str = Query(..., min_length=1, max_length=100, description="搜索词，匹配名称、品牌、标签和描述"),
+    limit: int = Query(20, ge=1, le=50),
+    category_id: Optional[int] = None,
+    platform: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="只返回这些字段，逗号分隔，如 id,name,price,image_url"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    商品全文搜索（按相关度排序）
+
+    搜索索引就绪时在内存倒排索引中按 BM25 打分，只按ID回表取结果商品；
+    单字查询匹配包含该字的词；索引尚未加载时退化为名称和描述的子串查询（ILIKE）。
+    每个结果附带 score 和 highlight（name / description 中命中部分用 <em> 标出）。
+    """
+    try:
+        columns = parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not tokenize(q):
+        return ORJSONResponse({"items": [], "total": 0, "source": "none"})
+
+    if product_search_index.loaded:
+        hits, total = product_search_index.search(q, limit, category_id, platform)
+        scores = dict(hits)
+        source = "index"
+    else:
+        pattern = "%" + q.strip().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        query = select(Product.id).where(
+            or_(Product.name.ilike(pattern), Product.description.ilike(pattern))
+        )
+        if category_id:
+            query = query.where(Product.category_id == category_id)
+        if platform:
+            query = query.where(Product.platform == platform)
+        result = await db.execute(query.order_by(Product.id).limit(limit))
+        scores = dict.fromkeys(result.scalars().all(), 0.0)
+        total = len(scores)
+        source = "sql"
+
+    rows = await fetch_rows_by_ids(db, scores, columns)
+    for row in rows:
+        row["score"] = round(scores[row["id"]], 4)
+        row["highlight"] = {
+            "name": highlight(row.get("name"), q),
+            "description": highlight(row.get("description"), q, SNIPPET_CHARS),
+        }
+    return ORJSONResponse({"items": rows, "total": total, "source": source})
+
+def _product_etag(row) -> str:
+    """商品详情的弱 ETag：商品ID + 最后修改时间（从未修改时用创建时间）"""
+    modified = row["updated_at"] or row["created_at"]
+    stamp = int(modified.timestamp() * 1_000_000) if modified else 0
+    return f'W/"{row["id"]}-{stamp}"'
+
 
 @router.get("/{product_id}", response_model=ProductResponse)
-async def get_product(product_id: int, db: Session = Depends(get_db)):
-    """获取单个商品详情"""
-    product = db.query(Product).filter(Product.id == product_id).first()
-    if not product:
+async def get_product(product_id: int, request: Request, db: AsyncSession = Depends(get_db)):
+    """获取单个商品详情（支持 If-None-Match，未修改时返回304且不序列化响应体）"""
+    rows = await fetch_rows_by_ids(db, [product_id])
+    if not rows:
         raise HTTPException(status_code=404, detail="Product not found")
-    return product
+    row = rows[0]
+    etag = _product_etag(row)
+    cached = not_modified(request, etag, DETAIL_CACHE_CONTROL)
+    if cached is not None:
+        return cached
+    return ORJSONResponse(row, headers={"ETag": etag, "Cache-Control": DETAIL_CACHE_CONTROL})
 
 @router.post("/", response_model=ProductResponse)
-async def create_product(product: ProductCreate, db: Session = Depends(get_db)):
+async def create_product(product: ProductCreate, db: AsyncSession = Depends(get_db)):
     """创建商品"""
     db_product = Product(**product.model_dump())
     db.add(db_product)
-    db.commit()
-    db.refresh(db_product)
+    await db.commit()
+    await db.refresh(db_product)
+    product_facet_index.upsert(db_product)
+    product_search_index.upsert(db_product)
     return db_product
@@ -1,229 +1,689 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import or_, and_
-from app.core.database import get_db
-from app.schemas.recommendation import RecommendationRequest, RecommendationResponse
-from app.schemas.product import ProductResponse
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from sqlalchemy import Select, or_, Text, func, literal, select, union_all
+from sqlalchemy.dialects.postgresql import array
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.schemas.recommendation import (
+    RecommendationRequest,
+    RecommendationResponse,
+    BatchRecommendationRequest,
+    BatchRecommendationResponse,
+)
 from app.models.product import Product
-from app.models.category import Category
 from app.services.ollama_service import ollama_service
-from typing import List, Dict, Any
+from app.services.facet_index import product_facet_index
+from app.services.category_matcher import category_matcher
+from app.services.llm_cache import request_signature
+from app.services.singleflight import SingleFlight
+from app.services.rule_filters import compile_filters
+from app.services.product_rows import (
+    fetch_rows,
+    fetch_rows_by_ids,
+    parse_fields,
+    project,
+    select_products,
+    to_models,
+)
+from app.services.llm_scheduler import (
+    LLMOverloadedError,
+    PRIORITY_BATCH,
+    PRIORITY_LANES,
+    PRIORITY_USER,
+    priority_for_user,
+)
+from app.api.auth import get_optional_user
+from app.models.user import User
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple
+from contextlib import aclosing
+import asyncio
 import logging
+import orjson
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/recommendations", tags=["recommendations"])
 
+NO_PRODUCTS_REASONING = "抱歉，没有找到符合您条件的商品，建议您调整筛选条件。"
+
+# 相同请求的并发推荐合并执行
+recommendation_flight = SingleFlight("recommendation")
+
+FIELDS_QUERY = Query(None, description="商品只返回这些字段，逗号分隔，如 id,name,price,image_url")
+
+
+def _parse_fields(fields: Optional[str]):
+    try:
+        return parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _render(response: RecommendationResponse, fields) -> Dict[str, Any]:
+    """序列化推荐结果并按稀疏字段集裁剪商品（合并执行的结果是共享的，不能原地修改）"""
+    data = response.model_dump()
+    data["products"] = project(data["products"], fields)
+    return data
+
+
 @router.post("/", response_model=RecommendationResponse)
 async def get_recommendations(
     request: RecommendationRequest,
-    db: Session = Depends(get_db)
+    fields: Optional[str] = FIELDS_QUERY,
+    current_user: Optional[User] = Depends(get_optional_user)
 ):
-    """根据筛选条件获取礼品推荐（使用AI模型分析）"""
+    """
+    根据筛选条件获取礼品推荐（使用AI模型分析）
     
-    try:
-        # 1. 使用AI模型分析用户请求，获取筛选条件和排序建议
-        ai_analysis = ollama_service.analyze_user_request(
-            recipient_type=request.recipient_type,
-            age_range=request.age_range,
-            gender=request.gender,
-            relationship=request.relationship,
-            occasion=request.occasion,
-            budget_min=request.budget_min,
-            budget_max=request.budget_max,
-            style=request.style,
-            mbti=request.mbti,
-            zodiac=request.zodiac,
-            interests=request.interests,
-            user_query=request.user_query
+    请求签名相同的并发请求合并为一次执行（分析、查询、推荐理由），共享同一结果。
+    LLM调用按用户角色排队，VIP用户优先；合并只在同一优先级内进行，
+    高优先级请求不会等待低优先级通道里的执行。
+    商品按行映射读取，响应直接用 orjson 序列化，不再经过 response_model 校验。
+    """
+    columns = _parse_fields(fields)
+    priority = priority_for_user(current_user)
+    key = f"{PRIORITY_LANES[priority]}:{request_signature(request.model_dump(), bucket_budget=False)}"
+    result = await recommendation_flight.do(key, lambda: _recommend(request, priority))
+    return ORJSONResponse(_render(result, columns))
+
+
+@router.post("/batch", response_model=BatchRecommendationResponse)
+async def get_batch_recommendations(
+    batch: BatchRecommendationRequest,
+    fields: Optional[str] = FIELDS_QUERY
+):
+    """
+    批量获取礼品推荐（用于营销任务等批量生成场景）
+    
+    相同的用户画像只计算一次；AI调用并发数受限；商品在分面索引中筛选后
+    一次性回表查询（索引未就绪时各组条件合并为一条SQL）。结果顺序与请求顺序一致。
+    数据库查询集中在一个短会话中，分析和生成推荐理由期间不占用连接。
+    """
+    columns = _parse_fields(fields)
+    if len(batch.requests) > settings.BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"单次批量请求最多 {settings.BATCH_MAX_SIZE} 个"
         )
-        
-        filters = ai_analysis.get("filters", {})
-        sort_by = ai_analysis.get("sort_by", "relevance")
-        ai_reasoning = ai_analysis.get("reasoning", "")
-        
-        logger.info(f"AI分析结果: {ai_analysis}")
-        
-        # 2. 根据AI返回的筛选条件查询商品
-        query = db.query(Product)
-        
-        # 价格筛选
-        if filters.get("price_min"):
-            query = query.filter(Product.price >= filters["price_min"])
-        elif request.budget_min:  # 如果没有AI建议，使用用户输入
-            query = query.filter(Product.price >= request.budget_min)
-        
-        if filters.get("price_max"):
-            query = query.filter(Product.price <= filters["price_max"])
-        elif request.budget_max:  # 如果没有AI建议，使用用户输入
-            query = query.filter(Product.price <= request.budget_max)
-        
-        # 适用性别筛选
-        if filters.get("suitable_gender"):
-            query = query.filter(
-                or_(
-                    Product.suitable_gender == filters["suitable_gender"],
-                    Product.suitable_gender == "unisex",
-                    Product.suitable_gender.is_(None)
-                )
-            )
-        
-        # 适用年龄段筛选
-        if filters.get("suitable_age_range"):
-            query = query.filter(
-                or_(
-                    Product.suitable_age_range == filters["suitable_age_range"],
-                    Product.suitable_age_range.is_(None)
-                )
+    
+    # 1. 按请求签名去重
+    keys = [request_signature(r.model_dump(), bucket_budget=False) for r in batch.requests]
+    unique: Dict[str, RecommendationRequest] = {}
+    for key, req in zip(keys, batch.requests):
+        unique.setdefault(key, req)
+    
+    semaphore = asyncio.Semaphore(settings.BATCH_LLM_CONCURRENCY)
+    
+    async def analyze(req: RecommendationRequest) -> Optional[Dict[str, Any]]:
+        async with semaphore:
+            try:
+                return await _analyze_request(req, PRIORITY_BATCH)
+            except LLMOverloadedError as e:
+                logger.warning(f"批量推荐LLM过载，降级为规则推荐: {e}")
+                return None
+    
+    # 2. 并发分析（有界并发，批量任务走最低优先级通道）
+    analyses = dict(zip(unique, await asyncio.gather(*[analyze(r) for r in unique.values()])))
+    
+    # 3. 商品查询：分面索引就绪时内存筛选，全部商品一条SQL回表
+    criteria_by_key: Dict[str, Tuple[Dict[str, Any], List[str]]] = {}
+    products_by_key: Dict[str, List[Dict[str, Any]]] = {}
+    failed = {key for key, analysis in analyses.items() if analysis is None}
+    for key, req in unique.items():
+        if key in failed:
+            continue
+        try:
+            criteria_by_key[key] = await _build_criteria(req, analyses[key])
+        except Exception as e:
+            logger.error(f"批量推荐构建查询条件失败: {e}", exc_info=True)
+            failed.add(key)
+    
+    async with AsyncSessionLocal() as db:
+        if product_facet_index.loaded:
+            ids_by_key = {
+                key: product_facet_index.search(limit=10, **criteria)
+                for key, (criteria, _) in criteria_by_key.items()
+            }
+        else:
+            ids_by_key = await _search_ids_sql_batch(
+                {key: criteria for key, (criteria, _) in criteria_by_key.items()}, db
             )
+        all_ids = {pid for ids in ids_by_key.values() for pid in ids}
+        rows = await fetch_rows(db, select_products().where(Product.id.in_(all_ids))) if all_ids else []
+        by_id = {row["id"]: row for row in rows}
+        for key, ids in ids_by_key.items():
+            products_by_key[key] = [by_id[pid] for pid in ids if pid in by_id]
         
-        # 风格筛选
-        if filters.get("style"):
-            query = query.filter(
-                or_(
-                    Product.style == filters["style"],
-                    Product.style.is_(None)
-                )
+        # 同一个数据库会话不能并发使用，回退推荐在生成理由之前依次查询
+        fallbacks = {key: await _fallback_recommendations(unique[key], db) for key in failed}
+    
+    # 4. 推荐理由（有界并发）
+    async def build(key: str) -> RecommendationResponse:
+        req = unique[key]
+        if key in failed:
+            return fallbacks[key]
+        products = products_by_key[key]
+        reasoning_source = "template"
+        if not products:
+            reasoning = NO_PRODUCTS_REASONING
+        elif batch.include_reasoning:
+            async with semaphore:
+                try:
+                    reasoning = await ollama_service.generate_recommendation_reasoning(
+                        _build_products_data(products),
+                        _build_user_request_data(req),
+                        priority=PRIORITY_BATCH
+                    )
+                    reasoning_source = "llm"
+                except LLMOverloadedError:
+                    reasoning = analyses[key].get("reasoning") or ""
+        else:
+            reasoning = analyses[key].get("reasoning") or ""
+        return RecommendationResponse(
+            categories=criteria_by_key[key][1],
+            products=to_models(products),
+            reasoning=reasoning,
+            path="rules" if analyses[key].get("source") in ("rules", "default") else "llm",
+            reasoning_source=reasoning_source
+        )
+    
+    responses = dict(zip(unique, await asyncio.gather(*[build(k) for k in unique])))
+    return ORJSONResponse({
+        "results": [_render(responses[key], columns) for key in keys],
+        "unique_profiles": len(unique),
+    })
+
+
+async def _recommend(
+    request: RecommendationRequest,
+    priority: int = PRIORITY_USER
+) -> RecommendationResponse:
+    """
+    推荐主流程（带端到端延迟预算）
+    
+    1. AI分析与规则条件的商品查询并发进行，规则查询结果作为对冲
+    2. 在预算内（预留推荐理由时间）等到AI分析则按AI条件查询，否则使用规则查询结果
+    3. 剩余预算内生成AI推荐理由，来不及时使用模板理由
+    
+    响应的 path / reasoning_source 字段标明实际走的路径。
+    每次查询使用独立的短会话（合并执行的结果不依赖发起请求的会话），
+    等待AI分析和生成推荐理由期间不占用数据库连接。
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.RECOMMENDATION_LATENCY_BUDGET
+    analysis_task = asyncio.create_task(_analyze_request(request, priority))
+    
+    # 1. 规则查询（与AI分析并发）
+    try:
+        async with AsyncSessionLocal() as db:
+            rules_result = await _query_products(request, compile_filters(request.model_dump()), db)
+    except Exception as e:
+        logger.error(f"规则查询失败: {e}", exc_info=True)
+        rules_result = None
+    
+    # 2. 在预算内等待AI分析
+    ai_analysis = None
+    try:
+        ai_analysis = await asyncio.wait_for(
+            analysis_task,
+            timeout=max(0.0, deadline - settings.RECOMMENDATION_REASONING_RESERVE - loop.time())
+        )
+    except asyncio.TimeoutError:
+        logger.warning("AI分析超出延迟预算，使用规则查询结果")
+    except LLMOverloadedError as e:
+        logger.warning(f"LLM过载，使用规则查询结果: {e}")
+    except Exception as e:
+        logger.error(f"AI分析失败: {e}", exc_info=True)
+    
+    path = "rules"
+    result = rules_result
+    # 规则快速路径和默认条件与规则查询等价，不再重复查询
+    if ai_analysis is not None and ai_analysis.get("source") not in ("rules", "default"):
+        try:
+            async with AsyncSessionLocal() as db:
+                result = await _query_products(request, ai_analysis, db)
+            path = "llm"
+        except Exception as e:
+            logger.error(f"按AI条件查询商品失败: {e}", exc_info=True)
+    
+    if result is None:
+        async with AsyncSessionLocal() as db:
+            return await _fallback_recommendations(request, db)
+    products, categories = result
+    
+    # 3. 推荐理由（剩余预算不足时使用模板）
+    reasoning = None
+    reasoning_source = "template"
+    remaining = deadline - loop.time()
+    if not products:
+        reasoning = NO_PRODUCTS_REASONING
+    elif remaining >= settings.RECOMMENDATION_MIN_REASONING_TIME:
+        try:
+            reasoning = await asyncio.wait_for(
+                ollama_service.generate_recommendation_reasoning(
+                    _build_products_data(products),
+                    _build_user_request_data(request),
+                    priority=priority
+                ),
+                timeout=remaining
             )
-        elif request.style:  # 如果没有AI建议，使用用户输入
-            query = query.filter(
-                or_(
-                    Product.style == request.style,
-                    Product.style.is_(None)
-                )
+            reasoning_source = "llm"
+        except asyncio.TimeoutError:
+            logger.warning("推荐理由超出延迟预算，使用模板理由")
+        except LLMOverloadedError as e:
+            logger.warning(f"LLM过载，使用模板理由: {e}")
+    
+    return RecommendationResponse(
+        categories=categories,
+        products=to_models(products),
+        reasoning=reasoning or _template_reasoning(request),
+        path=path,
+        reasoning_source=reasoning_source
+    )
+
+
+@router.post("/stream")
+async def stream_recommendations(
+    request: RecommendationRequest,
+    current_user: Optional[User] = Depends(get_optional_user)
+):
+    """
+    流式获取礼品推荐（Server-Sent Events）
+    
+    商品查询完成后立即推送 products 事件，随后以 reasoning 事件逐段推送
+    推荐理由，最后推送 done 事件。查询使用短会话，推送推荐理由期间不占用数据库连接。
+    """
+    priority = priority_for_user(current_user)
+    try:
+        ai_analysis = await _analyze_request(request, priority)
+        async with AsyncSessionLocal() as db:
+            products, categories = await _query_products(request, ai_analysis, db)
+    except Exception as e:
+        logger.error(f"流式推荐API错误: {e}", exc_info=True)
+        async with AsyncSessionLocal() as db:
+            fallback = await _fallback_recommendations(request, db)
+        categories = fallback.categories
+        product_items = [p.model_dump() for p in fallback.products]
+        reasoning_chunks = _single_chunk(fallback.reasoning)
+    else:
+        product_items = products
+        if products:
+            reasoning_chunks = ollama_service.stream_recommendation_reasoning(
+                _build_products_data(products),
+                _build_user_request_data(request),
+                priority=priority
             )
-        
-        # 标签筛选（JSON字段，需要特殊处理）
-        if filters.get("tags") and isinstance(filters["tags"], list):
-            # 对于PostgreSQL的JSON字段，使用JSONB操作符
-            # 这里简化处理，如果有标签匹配需求，可以进一步优化
-            pass  # 暂时跳过标签筛选，因为需要更复杂的JSON查询
-        
-        # 适用场景筛选
-        if filters.get("suitable_scenes") and isinstance(filters["suitable_scenes"], list):
-            # 对于JSON字段的场景筛选，暂时跳过
-            pass
-        
-        # 分类关键词匹配
-        categories = []
-        if filters.get("category_keywords") and isinstance(filters["category_keywords"], list):
-            # 根据关键词查找分类
-            category_query = db.query(Category).filter(
-                or_(*[Category.name.like(f"%{keyword}%") for keyword in filters["category_keywords"]])
+        else:
+            reasoning_chunks = _single_chunk(NO_PRODUCTS_REASONING)
+    
+    async def event_stream() -> AsyncIterator[str]:
+        yield _sse_event("products", {"categories": categories, "products": product_items})
+        # 客户端断开时随响应流一起关闭推荐理由生成器
+        async with aclosing(reasoning_chunks) as chunks:
+            async for chunk in chunks:
+                yield _sse_event("reasoning", {"delta": chunk})
+        yield _sse_event("done", {})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _sse_event(event: str, data: Dict[str, Any]) -> str:
+    """格式化一条SSE事件"""
+    return f"event: {event}\ndata: {orjson.dumps(data).decode()}\n\n"
+
+
+async def _single_chunk(text: str) -> AsyncIterator[str]:
+    """将完整文本包装为只有一段的异步迭代器"""
+    yield text
+
+
+async def _analyze_request(request: RecommendationRequest, priority: int = PRIORITY_USER) -> Dict[str, Any]:
+    """调用AI模型分析用户请求"""
+    ai_analysis = await ollama_service.analyze_user_request(
+        recipient_type=request.recipient_type,
+        age_range=request.age_range,
+        gender=request.gender,
+        relationship=request.relationship,
+        occasion=request.occasion,
+        budget_min=request.budget_min,
+        budget_max=request.budget_max,
+        style=request.style,
+        mbti=request.mbti,
+        zodiac=request.zodiac,
+        interests=request.interests,
+        user_query=request.user_query,
+        priority=priority
+    )
+    logger.info(f"AI分析结果: {ai_analysis}")
+    return ai_analysis
+
+
+async def _query_products(
+    request: RecommendationRequest,
+    ai_analysis: Dict[str, Any],
+    db: AsyncSession
+) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """根据AI返回的筛选条件查询商品，返回（商品列表, 匹配的分类名）"""
+    criteria, categories = await _build_criteria(request, ai_analysis)
+    
+    # 分面索引已加载时在内存中完成筛选和排序，只按ID回表取商品
+    if product_facet_index.loaded:
+        product_ids = product_facet_index.search(limit=10, **criteria)
+        products = await fetch_rows_by_ids(db, product_ids)
+    else:
+        products = await _search_products_sql(criteria, db)
+    
+    return products, categories
+
+
+async def _build_criteria(
+    request: RecommendationRequest,
+    ai_analysis: Dict[str, Any]
+) -> Tuple[Dict[str, Any], List[str]]:
+    """将AI分析结果和用户输入合并为查询条件，返回（查询条件, 匹配的分类名）"""
+    filters = ai_analysis.get("filters", {})
+    
+    # AI没有给出的条件使用用户输入
+    criteria = {
+        "price_min": _as_number(filters.get("price_min")) or request.budget_min or None,
+        "price_max": _as_number(filters.get("price_max")) or request.budget_max or None,
+        "gender": filters.get("suitable_gender") or None,
+        "age_range": filters.get("suitable_age_range") or None,
+        "style": filters.get("style") or request.style or None,
+        "tags": _as_str_list(filters.get("tags")),
+        "scenes": _as_str_list(filters.get("suitable_scenes")),
+        "category_ids": None,
+        "sort_by": ai_analysis.get("sort_by", "relevance"),
+    }
+    
+    # 分类关键词匹配
+    categories = []
+    if filters.get("category_keywords") and isinstance(filters["category_keywords"], list):
+        # 根据关键词查找分类（进程内索引，不访问数据库）
+        matched_categories = await category_matcher.match(filters["category_keywords"])
+        if matched_categories:
+            criteria["category_ids"] = [cid for cid, _ in matched_categories]
+            categories = [name for _, name in matched_categories]
+    
+    # 如果没有匹配的分类，使用默认分类
+    if not categories:
+        categories = ["通用礼品"]
+    
+    return criteria, categories
+
+
+def _build_search_query(criteria: Dict[str, Any]) -> Tuple[Select, List[Any]]:
+    """
+    按筛选条件构造商品ID查询（不含 LIMIT）
+
+    只查商品ID：筛选列和排序列都在覆盖索引中，可以走仅索引扫描并在取满所需数量后停止。
+
+    Returns:
+        （查询, 标签/场景条件）；标签/场景是偏好条件，由调用方决定是否放宽
+    """
+    query = select(Product.id)
+    
+    # 价格筛选
+    if criteria["price_min"]:
+        query = query.where(Product.price >= criteria["price_min"])
+    if criteria["price_max"]:
+        query = query.where(Product.price <= criteria["price_max"])
+    
+    # 适用性别筛选
+    if criteria["gender"]:
+        query = query.where(
+            or_(
+                Product.suitable_gender == criteria["gender"],
+                Product.suitable_gender == "unisex",
+                Product.suitable_gender.is_(None)
             )
-            matched_categories = category_query.all()
-            if matched_categories:
-                category_ids = [cat.id for cat in matched_categories]
-                query = query.filter(Product.category_id.in_(category_ids))
-                categories = [cat.name for cat in matched_categories]
-        
-        # 3. 排序
-        if sort_by == "price_asc":
-            query = query.order_by(Product.price.asc())
-        elif sort_by == "price_desc":
-            query = query.order_by(Product.price.desc())
-        elif sort_by == "rating_desc":
-            query = query.order_by(Product.rating.desc().nulls_last())
-        elif sort_by == "sales_desc":
-            query = query.order_by(Product.sales_count.desc().nulls_last())
-        else:  # relevance 或其他
-            # 默认排序：优先显示有评分和销量的商品
-            query = query.order_by(
-                Product.rating.desc().nulls_last(),
-                Product.sales_count.desc().nulls_last(),
-                Product.created_at.desc()
+        )
+    
+    # 适用年龄段筛选
+    if criteria["age_range"]:
+        query = query.where(
+            or_(
+                Product.suitable_age_range == criteria["age_range"],
+                Product.suitable_age_range.is_(None)
             )
-        
-        # 4. 获取推荐商品（取前10个）
-        products = query.limit(10).all()
-        
-        # 5. 使用AI生成推荐理由
-        if products:
-            # 准备商品数据用于AI生成理由
-            products_data = []
-            for p in products:
-                products_data.append({
-                    "name": p.name,
-                    "price": p.price,
-                    "style": p.style,
-                    "description": p.description or ""
-                })
-            
-            # 准备用户请求数据
-            user_request_data = {
-                "user_query": request.user_query,
-                "recipient_type": request.recipient_type,
-                "age_range": request.age_range,
-                "gender": request.gender,
-                "relationship": request.relationship,
-                "occasion": request.occasion,
-                "budget_min": request.budget_min,
-                "budget_max": request.budget_max,
-                "style": request.style,
-                "mbti": request.mbti,
-                "zodiac": request.zodiac,
-                "interests": request.interests
-            }
-            
-            reasoning = ollama_service.generate_recommendation_reasoning(
-                products_data,
-                user_request_data
+        )
+    
+    # 风格筛选
+    if criteria["style"]:
+        query = query.where(
+            or_(
+                Product.style == criteria["style"],
+                Product.style.is_(None)
             )
-        else:
-            reasoning = "抱歉，没有找到符合您条件的商品，建议您调整筛选条件。"
-        
-        # 如果没有匹配的分类，使用默认分类
-        if not categories:
-            categories = ["通用礼品"]
-        
-        return RecommendationResponse(
-            categories=categories,
-            products=[ProductResponse.model_validate(p) for p in products],
-            reasoning=reasoning
         )
-        
-    except Exception as e:
-        logger.error(f"推荐API错误: {e}", exc_info=True)
-        # 如果AI服务失败，回退到简单规则
-        return await _fallback_recommendations(request, db)
+    
+    # 标签/场景筛选（JSONB数组，?| 匹配任一元素，走GIN索引）
+    json_filters = []
+    if criteria["tags"]:
+        json_filters.append(Product.tags.has_any(array(criteria["tags"], type_=Text)))
+    if criteria["scenes"]:
+        json_filters.append(Product.suitable_scenes.has_any(array(criteria["scenes"], type_=Text)))
+    
+    if criteria["category_ids"] is not None:
+        query = query.where(Product.category_id.in_(criteria["category_ids"]))
+    
+    # 排序
+    query = query.order_by(*_sort_order(criteria["sort_by"], Product))
+    
+    return query, json_filters
+
+
+def _sort_order(sort_by: str, columns: Any) -> List[Any]:
+    """
+    排序方式对应的 ORDER BY
+
+    Args:
+        sort_by: 排序方式
+        columns: 按属性名取列的对象（Product 或子查询的 .c）
+    """
+    if sort_by == "price_asc":
+        return [columns.price.asc()]
+    if sort_by == "price_desc":
+        return [columns.price.desc()]
+    if sort_by == "rating_desc":
+        return [columns.rating.desc().nulls_last()]
+    if sort_by == "sales_desc":
+        return [columns.sales_count.desc().nulls_last()]
+    # relevance 或其他，默认排序：优先显示有评分和销量的商品
+    return [columns.rating.desc().nulls_last(), columns.sales_count.desc().nulls_last(), columns.created_at.desc()]
+
+
+def _sort_columns(sort_by: str) -> List[Any]:
+    """_sort_order 用到的商品列（均在对应排序索引中，不影响仅索引扫描）"""
+    if sort_by in ("price_asc", "price_desc"):
+        return [Product.price]
+    if sort_by == "rating_desc":
+        return [Product.rating]
+    if sort_by == "sales_desc":
+        return [Product.sales_count]
+    return [Product.rating, Product.sales_count, Product.created_at]
+
+
+async def _search_products_sql(criteria: Dict[str, Any], db: AsyncSession) -> List[Dict[str, Any]]:
+    """直接在数据库中按筛选条件查询商品（分面索引未就绪时使用），先取前10个ID再回表"""
+    query, json_filters = _build_search_query(criteria)
+    product_ids = (await db.execute(query.where(*json_filters).limit(10))).scalars().all()
+    if not product_ids and json_filters:
+        # 标签/场景是偏好条件，没有命中时放宽后重试
+        product_ids = (await db.execute(query.limit(10))).scalars().all()
+    return await fetch_rows_by_ids(db, product_ids)
+
+
+def _top_ids_union_query(queries: Dict[int, Tuple[Select, str]]) -> Select:
+    """
+    多个商品ID查询各取前10个，合并为一条 UNION ALL
+
+    Args:
+        queries: 分支编号 -> (_build_search_query 构造的查询, 排序方式)
+
+    每个分支仍是独立的有序索引扫描；子查询输出顺序没有保证，分支内的 rank
+    按该分支的排序列重新编号（只对取出的10行排序）。
+    """
+    branches = []
+    for n, (query, sort_by) in queries.items():
+        top = query.add_columns(*_sort_columns(sort_by)).limit(10).subquery()
+        rank = func.row_number().over(order_by=_sort_order(sort_by, top.c))
+        branches.append(select(literal(n).label("n"), top.c.id, rank.label("rank")))
+    return union_all(*branches) if len(branches) > 1 else branches[0]
+
+
+async def _top_ids_union(queries: Dict[int, Tuple[Select, str]], db: AsyncSession) -> Dict[int, List[int]]:
+    """执行 _top_ids_union_query，按分支编号返回各自的商品ID列表"""
+    result = await db.execute(_top_ids_union_query(queries))
+    ids: Dict[int, List[int]] = {n: [] for n in queries}
+    for n, product_id, _ in sorted(result.all(), key=lambda row: (row.n, row.rank)):
+        ids[n].append(product_id)
+    return ids
+
+
+async def _search_ids_sql_batch(
+    criteria_by_key: Dict[str, Dict[str, Any]],
+    db: AsyncSession
+) -> Dict[str, List[int]]:
+    """
+    批量版 _search_products_sql（分面索引未就绪时使用），只返回商品ID
+
+    相同的筛选条件只查一次；所有条件合并为一条查询，标签/场景没有命中的条件
+    放宽后再合并查询一次，共至多两次数据库往返。
+    """
+    # 不同画像经AI分析后常得到相同的筛选条件
+    groups: Dict[str, List[str]] = {}
+    distinct: List[Dict[str, Any]] = []
+    for key, criteria in criteria_by_key.items():
+        signature = orjson.dumps(criteria, option=orjson.OPT_SORT_KEYS).decode()
+        if signature not in groups:
+            groups[signature] = []
+            distinct.append(criteria)
+        groups[signature].append(key)
+    if not distinct:
+        return {}
+
+    built = [_build_search_query(criteria) for criteria in distinct]
+    sorts = [criteria["sort_by"] for criteria in distinct]
+    found = await _top_ids_union(
+        {n: (query.where(*json_filters), sorts[n]) for n, (query, json_filters) in enumerate(built)}, db
+    )
+    # 标签/场景是偏好条件，没有命中时放宽后重试
+    relaxed = {
+        n: (query, sorts[n]) for n, (query, json_filters) in enumerate(built)
+        if json_filters and not found[n]
+    }
+    if relaxed:
+        found.update(await _top_ids_union(relaxed, db))
+
+    return {key: found[n] for n, keys in enumerate(groups.values()) for key in keys}
+
+
+def _as_number(value: Any) -> Optional[float]:
+    """AI返回的数字可能是字符串，统一转为float"""
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _as_str_list(value: Any) -> Optional[List[str]]:
+    """AI返回的标签/场景列表只保留字符串元素"""
+    if not isinstance(value, list):
+        return None
+    items = [v for v in value if isinstance(v, str) and v]
+    return items or None
+
+
+def _build_products_data(products: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """准备商品数据用于AI生成理由"""
+    return [
+        {
+            "id": p["id"],
+            "name": p["name"],
+            "price": p["price"],
+            "style": p["style"],
+            "description": p["description"] or ""
+        }
+        for p in products
+    ]
+
+
+def _build_user_request_data(request: RecommendationRequest) -> Dict[str, Any]:
+    """准备用户请求数据用于AI生成理由"""
+    return {
+        "user_query": request.user_query,
+        "recipient_type": request.recipient_type,
+        "age_range": request.age_range,
+        "gender": request.gender,
+        "relationship": request.relationship,
+        "occasion": request.occasion,
+        "budget_min": request.budget_min,
+        "budget_max": request.budget_max,
+        "style": request.style,
+        "mbti": request.mbti,
+        "zodiac": request.zodiac,
+        "interests": request.interests
+    }
 
 
 async def _fallback_recommendations(
     request: RecommendationRequest,
-    db: Session
+    db: AsyncSession
 ) -> RecommendationResponse:
     """回退推荐逻辑（当AI服务不可用时使用）"""
-    query = db.query(Product)
+    products = await fetch_rows(db, _fallback_query(request))
+    categories = FALLBACK_STYLE_CATEGORIES.get(request.style, []) if request.style else []
+    
+    return RecommendationResponse(
+        categories=categories if categories else ["通用礼品"],
+        products=to_models(products),
+        reasoning=_template_reasoning(request),
+        path="fallback",
+        reasoning_source="template"
+    )
+
+
+# 回退推荐按风格给出的品类
+FALLBACK_STYLE_CATEGORIES = {
+    "实用型": ["电子产品", "家居用品", "健康设备"],
+    "创意型": ["手办", "艺术品", "DIY工具"],
+    "浪漫型": ["香水", "首饰", "花束"],
+}
+
+
+def _fallback_query(request: RecommendationRequest) -> Select:
+    """回退推荐查询：按预算和风格筛选，评分和上架时间排序取前10"""
+    query = select_products()
     
     # 根据预算筛选
     if request.budget_min:
-        query = query.filter(Product.price >= request.budget_min)
+        query = query.where(Product.price >= request.budget_min)
     if request.budget_max:
-        query = query.filter(Product.price <= request.budget_max)
+        query = query.where(Product.price <= request.budget_max)
     
     # 根据风格筛选
-    categories = []
     if request.style:
-        category_map = {
-            "实用型": ["电子产品", "家居用品", "健康设备"],
-            "创意型": ["手办", "艺术品", "DIY工具"],
-            "浪漫型": ["香水", "首饰", "花束"],
-        }
-        categories = category_map.get(request.style, [])
-        query = query.filter(
+        query = query.where(
             or_(
                 Product.style == request.style,
                 Product.style.is_(None)
             )
         )
     
-    # 排序并获取商品
-    products = query.order_by(
+    return query.order_by(
         Product.rating.desc().nulls_last(),
         Product.created_at.desc()
-    ).limit(10).all()
-    
-    # 生成简单推荐理由
+    ).limit(10)
+
+
+def _template_reasoning(request: RecommendationRequest) -> str:
+    """按用户筛选条件生成简单推荐理由"""
     reasoning = f"根据您的筛选条件（"
     if request.recipient_type:
         reasoning += f"收礼人：{request.recipient_type}，"
@@ -233,10 +693,4 @@ async def _fallback_recommendations(
         reasoning += f"预算：{request.budget_min}-{request.budget_max}元，"
     if request.style:
         reasoning += f"风格：{request.style}，"
-    reasoning = reasoning.rstrip("，") + "），为您推荐以下礼品。"
-    
-    return RecommendationResponse(
-        categories=categories if categories else ["通用礼品"],
-        products=[ProductResponse.model_validate(p) for p in products],
-        reasoning=reasoning
-    )
+    return reasoning.rstrip("，") + "），为您推荐以下礼品。"
@@ -1,20 +1,68 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from app.core.config import settings
+from app.core.db_metrics import PoolMetrics
 
+# 连接池参数（两个引擎共用）；SQL语句不再逐条打印，由 PoolMetrics 抽样记录耗时
+_POOL_OPTIONS = dict(
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=True,
+    echo=settings.DB_ECHO,
+)
+
+sync_pool_metrics = PoolMetrics("sync")
+async_pool_metrics = PoolMetrics("async")
+
+# 同步引擎：爬虫、维护脚本和后台线程（分面索引刷新等）使用
 engine = create_engine(
     settings.DATABASE_URL,
-    pool_pre_ping=True,
-    echo=settings.DEBUG,
+    poolclass=sync_pool_metrics.pool_class(QueuePool),
+    **_POOL_OPTIONS,
 )
+sync_pool_metrics.attach(engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+def _async_database_url(url: str) -> str:
+    """把 postgresql:// / postgresql+psycopg2:// 地址转换为 asyncpg 驱动地址"""
+    return make_url(url).set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+
+
+# 异步引擎：API路由使用，数据库等待期间不阻塞事件循环
+async_engine = create_async_engine(
+    _async_database_url(settings.DATABASE_URL),
+    poolclass=async_pool_metrics.pool_class(AsyncAdaptedQueuePool),
+    **_POOL_OPTIONS,
+)
+async_pool_metrics.attach(async_engine.sync_engine)
+
+# expire_on_commit=False：提交后仍可直接读取对象属性（异步会话不支持隐式懒加载）
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
-def get_db():
-    """数据库依赖注入"""
+def get_pool_stats():
+    """两个引擎的连接池与SQL计时指标"""
+    return {
+        "async": async_pool_metrics.get_stats(),
+        "sync": sync_pool_metrics.get_stats(),
+    }
+
+async def get_db():
+    """数据库依赖注入（异步会话）"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def get_sync_db():
+    """同步数据库会话（脚本和后台线程使用）"""
     db = SessionLocal()
     try:
         yield db
@@ -0,0 +1,151 @@
+"""
+数据库连接池指标 - 通过连接池事件统计借出/归还/等待，并对SQL执行做抽样计时
+替代 echo=True 的逐条SQL日志：慢查询一定记录，其余按比例抽样
+"""
+from typing import Any, Dict, Type
+import logging
+import random
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PoolMetrics:
+    """单个引擎的连接池与SQL计时统计"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.engine: Engine = None
+        self.stats = {
+            "connects": 0,
+            "checkouts": 0,
+            "checkins": 0,
+            "invalidations": 0,
+            "wait_total": 0.0,
+            "wait_max": 0.0,
+            "slow_waits": 0,  # 等待超过 DB_POOL_WARN_WAIT 的借出次数
+            "timeouts": 0,  # 等待超过 DB_POOL_TIMEOUT 而失败的次数
+            "hold_total": 0.0,
+            "hold_max": 0.0,
+            "queries": 0,
+            "query_total": 0.0,
+            "query_max": 0.0,
+            "slow_queries": 0,
+        }
+
+    def pool_class(self, base: Type[Pool]) -> Type[Pool]:
+        """
+        生成记录借出等待时间的连接池类
+
+        连接池事件只在拿到连接之后触发，等待时间需要包住 _do_get 才能测到；
+        dispose() 重建连接池时沿用同一个类，统计不会丢失。
+        """
+        metrics = self
+
+        class TimedPool(base):
+            def _do_get(self):
+                start = time.perf_counter()
+                try:
+                    return super()._do_get()
+                except exc.TimeoutError:
+                    metrics.stats["timeouts"] += 1
+                    logger.error(f"数据库连接池[{metrics.name}]借出超时: {metrics.pool_status()}")
+                    raise
+                finally:
+                    metrics.record_wait(time.perf_counter() - start)
+
+        TimedPool.__name__ = f"Timed{base.__name__}"
+        return TimedPool
+
+    def attach(self, engine: Engine) -> None:
+        """注册连接池和执行事件（异步引擎传入 async_engine.sync_engine）"""
+        self.engine = engine
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+        event.listen(engine, "invalidate", self._on_invalidate)
+        event.listen(engine, "before_cursor_execute", self._before_execute)
+        event.listen(engine, "after_cursor_execute", self._after_execute)
+
+    def record_wait(self, seconds: float) -> None:
+        stats = self.stats
+        stats["wait_total"] += seconds
+        stats["wait_max"] = max(stats["wait_max"], seconds)
+        if seconds >= settings.DB_POOL_WARN_WAIT:
+            stats["slow_waits"] += 1
+            logger.warning(
+                f"数据库连接池[{self.name}]借出等待 {seconds * 1000:.0f}ms: {self.pool_status()}"
+            )
+
+    def _on_connect(self, dbapi_connection, connection_record) -> None:
+        self.stats["connects"] += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy) -> None:
+        self.stats["checkouts"] += 1
+        connection_record.info["checkout_at"] = time.perf_counter()
+
+    def _on_checkin(self, dbapi_connection, connection_record) -> None:
+        self.stats["checkins"] += 1
+        started = connection_record.info.pop("checkout_at", None)
+        if started is not None:
+            held = time.perf_counter() - started
+            self.stats["hold_total"] += held
+            self.stats["hold_max"] = max(self.stats["hold_max"], held)
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception) -> None:
+        self.stats["invalidations"] += 1
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        starts = conn.info.get("query_start")
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        stats = self.stats
+        stats["queries"] += 1
+        stats["query_total"] += elapsed
+        stats["query_max"] = max(stats["query_max"], elapsed)
+        if elapsed >= settings.DB_SLOW_QUERY:
+            stats["slow_queries"] += 1
+            logger.warning(f"慢查询[{self.name}] {elapsed * 1000:.0f}ms: {_short(statement)}")
+        elif random.random() < settings.DB_QUERY_LOG_SAMPLE_RATE:
+            logger.info(f"SQL[{self.name}] {elapsed * 1000:.1f}ms: {_short(statement)}")
+
+    def pool_status(self) -> Dict[str, int]:
+        """连接池实时状态：容量、借出数、溢出数"""
+        if self.engine is None:
+            return {}
+        pool = self.engine.pool
+        if not hasattr(pool, "checkedout"):
+            return {}
+        return {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+            "max_overflow": settings.DB_MAX_OVERFLOW,
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = self.stats
+        checkouts, checkins, queries = stats["checkouts"], stats["checkins"], stats["queries"]
+        return {
+            "pool": self.pool_status(),
+            **{k: round(v, 4) if isinstance(v, float) else v for k, v in stats.items()},
+            "avg_wait_ms": round(stats["wait_total"] / checkouts * 1000, 2) if checkouts else 0.0,
+            "avg_hold_ms": round(stats["hold_total"] / checkins * 1000, 2) if checkins else 0.0,
+            "avg_query_ms": round(stats["query_total"] / queries * 1000, 2) if queries else 0.0,
+        }
+
+
+def _short(statement: str, limit: int = 200) -> str:
+    statement = " ".join(statement.split())
+    return statement if len(statement) <= limit else statement[:limit] + "…"
@@ -0,0 +1,53 @@
+"""
+HTTP条件请求 - ETag / If-None-Match / Cache-Control
+内容未变化时返回 304，不传输响应体
+"""
+from typing import Optional
+import hashlib
+
+from fastapi import Request, Response
+
+
+def content_etag(body: bytes) -> str:
+    """按响应体内容生成强 ETag"""
+    return '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 使用弱比较：忽略 W/ 前缀，支持逗号分隔的多个值和 *"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    target = _opaque(etag)
+    return any(_opaque(tag) == target for tag in if_none_match.split(","))
+
+
+def not_modified(request: Request, etag: str, cache_control: str) -> Optional[Response]:
+    """客户端缓存仍然有效时返回 304 响应，否则返回 None"""
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+    return None
+
+
+def cached_response(
+    request: Request,
+    body: bytes,
+    etag: str,
+    cache_control: str,
+    media_type: str = "application/json",
+) -> Response:
+    """带 ETag 和 Cache-Control 的响应，If-None-Match 命中时返回 304"""
+    cached = not_modified(request, etag, cache_control)
+    if cached is not None:
+        return cached
+    return Response(
+        content=body,
+        media_type=media_type,
+        headers={"ETag": etag, "Cache-Control": cache_control},
+    )
@@ -1,12 +1,45 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+import asyncio
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
+from app.core.database import async_engine, get_pool_stats
 from app.api import products, categories, recommendations, auth
+from app.services.ollama_service import ollama_service
+from app.services.facet_index import product_facet_index, run_refresh_loop
+from app.services.search_index import product_search_index, run_refresh_loop as run_search_refresh_loop
+from app.services.category_matcher import category_matcher
+from app.services.category_cache import category_cache
+from app.services.llm_scheduler import llm_scheduler
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动后台任务，关闭时取消"""
+    tasks = []
+    # Ollama连接发现与模型预热在后台进行，不阻塞启动
+    ollama_service.start()
+    if settings.FACET_INDEX_ENABLED:
+        tasks.append(asyncio.create_task(
+            run_refresh_loop(product_facet_index, settings.FACET_INDEX_REFRESH_INTERVAL)
+        ))
+    if settings.SEARCH_INDEX_ENABLED:
+        tasks.append(asyncio.create_task(
+            run_search_refresh_loop(product_search_index, settings.SEARCH_INDEX_REFRESH_INTERVAL)
+        ))
+    yield
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await ollama_service.stop()
+    await async_engine.dispose()
+
 
 app = FastAPI(
     title="AI礼品推荐系统 API",
     description="基于AI的智能礼品推荐平台后端API",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 # 配置CORS
@@ -31,3 +64,29 @@ async def root():
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
+
+@app.get("/ready")
+async def readiness_check(response: Response):
+    """就绪检查：Ollama 仍在连接或预热时返回503；连接失败时以降级模式就绪"""
+    starting = ollama_service.state in ("connecting", "warming")
+    if starting:
+        response.status_code = 503
+    return {
+        "ready": not starting,
+        "ollama": ollama_service.state,
+        "facet_index": product_facet_index.loaded,
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """运行指标：缓存命中率、LLM服务状态等"""
+    return {
+        "llm": ollama_service.get_stats(),
+        "llm_scheduler": llm_scheduler.get_stats(),
+        "facet_index": product_facet_index.get_stats(),
+        "search_index": product_search_index.get_stats(),
+        "category_matcher": category_matcher.get_stats(),
+        "category_cache": category_cache.get_stats(),
+        "recommendation_flight": recommendations.recommendation_flight.get_stats(),
+        "database": get_pool_stats(),
+    }
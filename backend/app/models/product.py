@@ -1,10 +1,46 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Text, ARRAY, JSON
-from sqlalchemy.sql import func
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Text, Index
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.sql import func, text
 from sqlalchemy.orm import relationship
 from app.core.database import Base
 
+# 推荐查询用到的筛选列
+_FILTER_COLUMNS = ["id", "price", "category_id", "suitable_gender", "suitable_age_range", "style"]
+
 class Product(Base):
     __tablename__ = "products"
+    __table_args__ = (
+        # JSONB数组字段的GIN索引，支撑标签/场景的 ?| 和 @> 查询
+        Index("ix_products_tags_gin", "tags", postgresql_using="gin"),
+        Index("ix_products_suitable_scenes_gin", "suitable_scenes", postgresql_using="gin"),
+        # 推荐查询的排序/筛选索引，筛选列放在 INCLUDE 中支持仅索引扫描（迁移 20261017110000）
+        Index(
+            "ix_products_rank",
+            text("rating DESC NULLS LAST"), text("sales_count DESC NULLS LAST"), text("created_at DESC"),
+            postgresql_include=_FILTER_COLUMNS,
+        ),
+        Index(
+            "ix_products_category_rank",
+            "category_id",
+            text("rating DESC NULLS LAST"), text("sales_count DESC NULLS LAST"), text("created_at DESC"),
+            postgresql_include=[c for c in _FILTER_COLUMNS if c != "category_id"],
+        ),
+        # 价格区间 / 价格排序；不设部分索引条件，没有价格区间的价格排序也能按索引顺序扫描（迁移 20261017130000）
+        Index(
+            "ix_products_price",
+            "price",
+            postgresql_include=[c for c in _FILTER_COLUMNS if c != "price"],
+        ),
+        Index("ix_products_sales", text("sales_count DESC NULLS LAST"), postgresql_include=_FILTER_COLUMNS),
+        Index(
+            "ix_products_fallback_rank",
+            text("rating DESC NULLS LAST"), text("created_at DESC"),
+            postgresql_include=["id", "price", "style"],
+        ),
+        # 商品列表按ID游标分页（迁移 20261017120000）
+        Index("ix_products_category_id_id", "category_id", "id"),
+        Index("ix_products_platform_id", "platform", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False, index=True)
@@ -18,8 +54,8 @@ class Product(Base):
     # 扩展的商品属性字段
     brand = Column(String, nullable=True, index=True)  # 品牌
     material = Column(String, nullable=True)  # 材质
-    suitable_scenes = Column(JSON, nullable=True)  # 适用场景，JSON数组格式，如["生日", "情人节", "纪念日"]
-    tags = Column(JSON, nullable=True)  # 标签，JSON数组格式，如["实用", "创意", "浪漫"]
+    suitable_scenes = Column(JSONB, nullable=True)  # 适用场景，JSON数组格式，如["生日", "情人节", "纪念日"]
+    tags = Column(JSONB, nullable=True)  # 标签，JSON数组格式，如["实用", "创意", "浪漫"]
     suitable_gender = Column(String, nullable=True)  # 适用性别：male, female, unisex
     suitable_age_range = Column(String, nullable=True)  # 适用年龄段：如"18-25", "25-35", "35+"
     style = Column(String, nullable=True, index=True)  # 风格：实用型、创意型、浪漫型等
@@ -17,4 +17,4 @@ class Rating(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # 关系
-    product = relationship("Product", backref="rating")
+    product = relationship("Product", backref="grade")  # Product.rating 已是评分列，反向引用用 grade
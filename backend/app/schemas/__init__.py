@@ -1,12 +1,23 @@
-from app.schemas.product import ProductCreate, ProductResponse
+from app.schemas.product import ProductCreate, ProductResponse, ProductPage
 from app.schemas.category import Category, CategoryCreate
-from app.schemas.recommendation import RecommendationRequest, RecommendationResponse
+from app.schemas.recommendation import (
+    RecommendationRequest,
+    RecommendationResponse,
+    BatchRecommendationRequest,
+    BatchRecommendationResponse,
+)
+from app.schemas.analysis import AnalysisFilters, AnalysisResult
 
 __all__ = [
     "ProductCreate",
     "ProductResponse",
+    "ProductPage",
     "Category",
     "CategoryCreate",
     "RecommendationRequest",
     "RecommendationResponse",
+    "BatchRecommendationRequest",
+    "BatchRecommendationResponse",
+    "AnalysisFilters",
+    "AnalysisResult",
 ]
@@ -0,0 +1,83 @@
+from pydantic import BaseModel, Field, field_validator
+from typing import Any, List, Literal, Optional
+import re
+
+# 模型需求分析结果的结构定义
+# 同时用作 Ollama 结构化输出的 JSON Schema（format 参数），约束模型只能生成合法结构
+
+SortBy = Literal["price_asc", "price_desc", "rating_desc", "sales_desc", "relevance"]
+Gender = Literal["male", "female", "unisex"]
+
+_NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+
+
+class AnalysisFilters(BaseModel):
+    price_min: Optional[float] = None  # 最低价格
+    price_max: Optional[float] = None  # 最高价格
+    suitable_gender: Optional[Gender] = None  # 适用性别
+    suitable_age_range: Optional[str] = None  # 适用年龄段，如"18-25"、"25-35"、"35+"
+    style: Optional[str] = None  # 风格，如"实用型"、"创意型"、"浪漫型"
+    tags: Optional[List[str]] = None  # 标签列表
+    suitable_scenes: Optional[List[str]] = None  # 适用场景列表
+    category_keywords: Optional[List[str]] = None  # 分类关键词列表
+
+    @field_validator("price_min", "price_max", mode="before")
+    @classmethod
+    def _coerce_price(cls, value: Any) -> Any:
+        # 兼容 "500元"、"约300" 等写法；无法识别时视为未指定
+        if isinstance(value, str):
+            match = _NUMBER.search(value.replace(",", ""))
+            return float(match.group()) if match else None
+        return value
+
+    @field_validator("suitable_gender", mode="before")
+    @classmethod
+    def _coerce_gender(cls, value: Any) -> Any:
+        if isinstance(value, str):
+            value = {"男": "male", "女": "female", "通用": "unisex"}.get(value.strip(), value.strip().lower())
+            return value if value in ("male", "female", "unisex") else None
+        return value
+
+    @field_validator("suitable_age_range", "style", mode="before")
+    @classmethod
+    def _blank_to_none(cls, value: Any) -> Any:
+        if isinstance(value, str):
+            return value.strip() or None
+        return value
+
+    @field_validator("tags", "suitable_scenes", "category_keywords", mode="before")
+    @classmethod
+    def _coerce_list(cls, value: Any) -> Any:
+        # 单个字符串当作只有一个元素的列表，丢弃空项和非字符串项
+        if isinstance(value, str):
+            value = [value]
+        if isinstance(value, list):
+            items = [v.strip() for v in value if isinstance(v, str) and v.strip()]
+            return items or None
+        return value
+
+
+class AnalysisResult(BaseModel):
+    filters: AnalysisFilters = Field(default_factory=AnalysisFilters)  # 筛选条件
+    sort_by: SortBy = "relevance"  # 排序方式
+    reasoning: str = "根据您的需求进行了商品筛选"  # 筛选逻辑说明
+
+    @field_validator("sort_by", mode="before")
+    @classmethod
+    def _coerce_sort_by(cls, value: Any) -> Any:
+        if value in ("price_asc", "price_desc", "rating_desc", "sales_desc", "relevance"):
+            return value
+        return "relevance"
+
+    @field_validator("reasoning", mode="before")
+    @classmethod
+    def _coerce_reasoning(cls, value: Any) -> Any:
+        return value if isinstance(value, str) and value.strip() else "根据您的需求进行了商品筛选"
+
+    def to_dict(self) -> dict:
+        """转换为推荐流程使用的字典结构（省略未指定的筛选条件）"""
+        return {
+            "filters": self.filters.model_dump(exclude_none=True),
+            "sort_by": self.sort_by,
+            "reasoning": self.reasoning,
+        }
@@ -33,3 +33,8 @@ class ProductResponse(ProductBase):
 
     class Config:
         from_attributes = True
+
+class ProductPage(BaseModel):
+    """商品列表分页结果；next_cursor 为空表示没有下一页"""
+    items: List[ProductResponse]
+    next_cursor: Optional[str] = None
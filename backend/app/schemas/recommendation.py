@@ -31,3 +31,13 @@ class RecommendationResponse(BaseModel):
     categories: List[str]  # 推荐的品类列表
     products: List[ProductResponse]  # 推荐的商品列表
     reasoning: str  # 推荐理由
+    path: Optional[str] = None  # 商品筛选路径：llm（AI分析）/ rules（规则对冲）/ fallback（回退）
+    reasoning_source: Optional[str] = None  # 推荐理由来源：llm / template
+
+class BatchRecommendationRequest(BaseModel):
+    requests: List[RecommendationRequest]  # 多个收礼人画像
+    include_reasoning: bool = True  # 是否为每个画像生成AI推荐理由
+
+class BatchRecommendationResponse(BaseModel):
+    results: List[RecommendationResponse]  # 与请求顺序一致的推荐结果
+    unique_profiles: int  # 去重后实际计算的画像数
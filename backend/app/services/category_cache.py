@@ -0,0 +1,98 @@
+"""
+分类列表缓存 - 进程内缓存序列化好的分类列表及其 ETag
+分类几乎不变，页面加载时不再每次查询数据库；新增分类时递增版本并失效。
+分类接口和分类关键词匹配共用同一份快照
+"""
+from typing import Any, Dict, List, Optional
+import logging
+import time
+
+import orjson
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.http_cache import content_etag
+from app.models.category import Category
+from app.schemas.category import Category as CategorySchema
+from app.services.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+_COLUMNS = [Category.__table__.c[name] for name in CategorySchema.model_fields]
+
+
+class CategorySnapshot:
+    """某一版本的分类列表：行数据、按ID索引、序列化结果和 ETag"""
+
+    def __init__(self, version: int, rows: List[Dict[str, Any]]):
+        self.version = version
+        self.rows = rows
+        self.by_id = {row["id"]: row for row in rows}
+        self.body = orjson.dumps(rows)
+        self.etag = content_etag(self.body)
+        self.loaded_at = time.monotonic()
+
+
+class CategoryCache:
+    """
+    带版本号的分类缓存
+
+    invalidate() 递增版本号，下一次读取重新加载；ttl 兜底多进程部署时其他进程的变更。
+    ETag 按内容计算，各进程加载到相同数据时 ETag 一致。
+    """
+
+    def __init__(self, ttl: float = 300):
+        self.ttl = ttl
+        self.version = 0
+        self._snapshot: Optional[CategorySnapshot] = None
+        self._flight = SingleFlight("category_cache")
+        self.stats = {"hits": 0, "loads": 0, "invalidations": 0}
+
+    def invalidate(self) -> None:
+        """分类变更后调用"""
+        self.version += 1
+        self._snapshot = None
+        self.stats["invalidations"] += 1
+
+    def _is_fresh(self, snapshot: Optional[CategorySnapshot]) -> bool:
+        return (
+            snapshot is not None
+            and snapshot.version == self.version
+            and time.monotonic() - snapshot.loaded_at < self.ttl
+        )
+
+    async def get(self) -> CategorySnapshot:
+        """返回当前版本的分类列表，过期时重新加载（并发加载合并为一次查询）"""
+        snapshot = self._snapshot
+        if self._is_fresh(snapshot):
+            self.stats["hits"] += 1
+            return snapshot
+        return await self._flight.do(str(self.version), self._load)
+
+    async def _load(self) -> CategorySnapshot:
+        version = self.version
+        # 使用独立会话：合并执行的结果由多个请求共享，不依赖发起请求的会话
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(*_COLUMNS).order_by(Category.id))
+            rows = [dict(row) for row in result.mappings()]
+        snapshot = CategorySnapshot(version, rows)
+        # 加载期间又发生了变更时不覆盖，下次读取会按新版本重新加载
+        if version == self.version:
+            self._snapshot = snapshot
+        self.stats["loads"] += 1
+        logger.info(f"分类缓存已加载 {len(rows)} 个分类（版本 {version}）")
+        return snapshot
+
+    def get_stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            **self.stats,
+            "version": self.version,
+            "categories": len(snapshot.rows) if snapshot else 0,
+            "etag": snapshot.etag if snapshot else None,
+        }
+
+
+# 创建全局实例
+category_cache = CategoryCache(ttl=settings.CATEGORY_CACHE_TTL)
@@ -0,0 +1,214 @@
+"""
+分类关键词匹配 - 基于分类缓存的快照建立索引
+替代 Category.name LIKE '%kw%' 的全表扫描，匹配过程不访问数据库
+"""
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import logging
+import re
+import threading
+
+from app.services.category_cache import CategoryCache, CategorySnapshot, category_cache
+
+logger = logging.getLogger(__name__)
+
+# 常见商品词 -> 分类名 的同义词表（分类描述中列举的商品词会自动加入）
+CATEGORY_SYNONYMS: Dict[str, List[str]] = {
+    "电子产品": ["数码", "电子", "手机", "耳机", "智能手表", "手环", "音箱", "平板", "相机", "键盘"],
+    "美妆护肤": ["美妆", "化妆品", "护肤", "口红", "香水", "面膜", "精华", "彩妆"],
+    "服饰配饰": ["服饰", "服装", "配饰", "首饰", "项链", "手链", "耳环", "戒指", "包包", "围巾", "手表"],
+    "家居用品": ["家居", "香薰", "摆件", "装饰", "台灯", "抱枕", "杯子", "餐具"],
+    "食品饮料": ["食品", "零食", "饮料", "巧克力", "茶叶", "酒", "咖啡", "糕点"],
+}
+
+# 分类描述按这些分隔符拆出商品词
+_DESCRIPTION_SPLIT = re.compile(r"[、，,；;。\s]+")
+
+# 模糊匹配的最低相似度（字符二元组 Dice 系数）
+FUZZY_THRESHOLD = 0.5
+
+
+def _bigrams(text: str) -> Set[str]:
+    """字符二元组；单字返回自身"""
+    if len(text) < 2:
+        return {text} if text else set()
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+class _AhoCorasick:
+    """Aho-Corasick 自动机，一次扫描找出文本中出现的全部词"""
+
+    def __init__(self, words: Iterable[str]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[str]] = [[]]
+        for word in words:
+            self._add(word)
+        self._build()
+
+    def _add(self, word: str) -> None:
+        node = 0
+        for ch in word:
+            nxt = self.goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[node][ch] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            node = nxt
+        self.output[node].append(word)
+
+    def _build(self) -> None:
+        queue = list(self.goto[0].values())
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for ch, nxt in self.goto[node].items():
+                queue.append(nxt)
+                state = self.fail[node]
+                while state and ch not in self.goto[state]:
+                    state = self.fail[state]
+                target = self.goto[state].get(ch, 0)
+                # 根节点的子节点失败指针指向根节点
+                self.fail[nxt] = target if target != nxt else 0
+                self.output[nxt].extend(self.output[self.fail[nxt]])
+
+    def find_all(self, text: str) -> Set[str]:
+        found: Set[str] = set()
+        node = 0
+        for ch in text:
+            while node and ch not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(ch, 0)
+            found.update(self.output[node])
+        return found
+
+
+class CategoryMatcher:
+    """
+    分类匹配器
+
+    - 关键词是分类名的子串（原 LIKE 语义）：字符二元组倒排索引求交后校验
+    - 关键词中包含分类名或同义词：Aho-Corasick 自动机一次扫描
+    - 模糊模式：以上都没有命中时按二元组相似度匹配
+
+    分类数据、过期和失效都由分类缓存管理，快照更换后重建索引。
+    """
+
+    def __init__(self, cache: CategoryCache):
+        """
+        Args:
+            cache: 分类缓存，索引基于其当前快照构建
+        """
+        self.cache = cache
+        self._lock = threading.Lock()
+        self._snapshot: Optional[CategorySnapshot] = None
+        self._categories: Dict[int, str] = {}
+        self._name_grams: Dict[str, Set[int]] = {}
+        self._alias_to_ids: Dict[str, Set[int]] = {}
+        self._alias_grams: Dict[str, Set[str]] = {}
+        self._automaton: Optional[_AhoCorasick] = None
+        self.stats = {"builds": 0, "lookups": 0, "exact_hits": 0, "fuzzy_hits": 0, "misses": 0}
+
+    def build(self, snapshot: CategorySnapshot) -> None:
+        """按分类快照重建索引"""
+        categories: Dict[int, str] = {}
+        name_grams: Dict[str, Set[int]] = {}
+        alias_to_ids: Dict[str, Set[int]] = {}
+        for row in snapshot.rows:
+            cid, name, description = row["id"], row["name"], row["description"]
+            categories[cid] = name
+            for gram in _bigrams(name):
+                name_grams.setdefault(gram, set()).add(cid)
+            aliases = {name, *CATEGORY_SYNONYMS.get(name, [])}
+            if description:
+                aliases.update(t.rstrip("等") for t in _DESCRIPTION_SPLIT.split(description))
+            for alias in aliases:
+                if alias:
+                    alias_to_ids.setdefault(alias, set()).add(cid)
+
+        with self._lock:
+            self._categories = categories
+            self._name_grams = name_grams
+            self._alias_to_ids = alias_to_ids
+            self._alias_grams = {alias: _bigrams(alias) for alias in alias_to_ids}
+            self._automaton = _AhoCorasick(alias_to_ids)
+            self._snapshot = snapshot
+        self.stats["builds"] += 1
+        logger.info(f"分类匹配器已建立索引: {len(categories)} 个分类, {len(alias_to_ids)} 个别名（版本 {snapshot.version}）")
+
+    def _match_substring(self, keyword: str) -> Set[int]:
+        """关键词是分类名子串的分类"""
+        if len(keyword) == 1:
+            # 单字无法用二元组索引，直接扫描（分类数量很少）
+            return {cid for cid, name in self._categories.items() if keyword in name}
+        grams = _bigrams(keyword)
+        candidates: Optional[Set[int]] = None
+        for gram in grams:
+            ids = self._name_grams.get(gram)
+            if not ids:
+                return set()
+            candidates = set(ids) if candidates is None else candidates & ids
+        return {cid for cid in candidates or () if keyword in self._categories[cid]}
+
+    def _match_fuzzy(self, keyword: str) -> Set[int]:
+        """按二元组 Dice 系数匹配最相近的别名"""
+        grams = _bigrams(keyword)
+        if not grams:
+            return set()
+        best_score, best_ids = 0.0, set()
+        for alias, alias_grams in self._alias_grams.items():
+            overlap = len(grams & alias_grams)
+            if not overlap:
+                continue
+            score = 2 * overlap / (len(grams) + len(alias_grams))
+            if score > best_score:
+                best_score, best_ids = score, set(self._alias_to_ids[alias])
+            elif score == best_score:
+                best_ids |= self._alias_to_ids[alias]
+        return best_ids if best_score >= FUZZY_THRESHOLD else set()
+
+    async def match(self, keywords: Iterable[str], fuzzy: bool = True) -> List[Tuple[int, str]]:
+        """
+        匹配关键词对应的分类
+
+        Args:
+            keywords: 分类关键词
+            fuzzy: 精确匹配不到时是否进行模糊匹配
+
+        Returns:
+            (分类ID, 分类名) 列表，按分类ID排序
+        """
+        snapshot = await self.cache.get()
+        if snapshot is not self._snapshot:
+            self.build(snapshot)
+
+        self.stats["lookups"] += 1
+        matched: Set[int] = set()
+        for keyword in keywords:
+            if not isinstance(keyword, str):
+                continue
+            keyword = keyword.strip()
+            if not keyword:
+                continue
+            ids = self._match_substring(keyword)
+            for alias in self._automaton.find_all(keyword):
+                ids |= self._alias_to_ids[alias]
+            if ids:
+                self.stats["exact_hits"] += 1
+            elif fuzzy:
+                ids = self._match_fuzzy(keyword)
+                if ids:
+                    self.stats["fuzzy_hits"] += 1
+            if not ids:
+                self.stats["misses"] += 1
+            matched |= ids
+        return [(cid, self._categories[cid]) for cid in sorted(matched)]
+
+    def get_stats(self) -> Dict[str, int]:
+        return {**self.stats, "categories": len(self._categories), "aliases": len(self._alias_to_ids)}
+
+
+# 创建全局实例
+category_matcher = CategoryMatcher(category_cache)
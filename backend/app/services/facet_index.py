@@ -0,0 +1,591 @@
+"""
+商品分面索引 - 将商品目录一次性加载为内存中的紧凑数组和位图
+推荐筛选通过位图的与/或运算完成，排序使用预先排好的序列，无需访问数据库
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set
+import asyncio
+import heapq
+import logging
+import re
+import threading
+import time
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.product import Product
+
+logger = logging.getLogger(__name__)
+
+# 单值分面（每个商品至多一个取值）与多值分面（JSONB数组）
+SINGLE_FACETS = ("gender", "age_range", "style", "category", "platform")
+MULTI_FACETS = ("tags", "scenes")
+
+# 与推荐接口 sort_by 保持一致
+SORT_MODES = ("relevance", "price_asc", "price_desc", "rating_desc", "sales_desc")
+
+# 取结果的两种方式：直接取出全部候选做堆排序（代价约与候选数成正比），
+# 或沿预排序序列扫描（代价约与 limit * 总数 / 候选数 成正比）。
+# 该系数为两者单位代价之比，用于选择更便宜的方式
+WALK_COST_RATIO = 0.2
+
+PRICE_BUCKETS = 32
+
+_NONZERO_BYTE = re.compile(rb"[^\x00]")
+
+_NAN = float("nan")
+_INF = float("inf")
+
+# 从数据库加载的列
+_INDEX_COLUMNS = (
+    Product.id,
+    Product.price,
+    Product.rating,
+    Product.sales_count,
+    Product.created_at,
+    Product.updated_at,
+    Product.suitable_gender,
+    Product.suitable_age_range,
+    Product.style,
+    Product.category_id,
+    Product.platform,
+    Product.tags,
+    Product.suitable_scenes,
+)
+
+
+def _bits_from_slots(slots: Iterable[int], size: int) -> int:
+    """由槽位列表构造位图（批量构造，避免大整数逐位或运算）"""
+    buf = bytearray((size + 7) // 8)
+    for slot in slots:
+        buf[slot >> 3] |= 1 << (slot & 7)
+    return int.from_bytes(buf, "little")
+
+
+def _iter_bits(mask: int, size: int) -> Iterator[int]:
+    """按从低到高的顺序遍历位图中的置位槽位"""
+    data = mask.to_bytes((size + 7) // 8 or 1, "little")
+    for match in _NONZERO_BYTE.finditer(data):
+        base = match.start() * 8
+        byte = data[match.start()]
+        while byte:
+            low = byte & -byte
+            yield base + low.bit_length() - 1
+            byte ^= low
+
+
+def _sort_key(sort_by: str, price: array, rating: array, sales: array, created: array) -> Callable[[int], tuple]:
+    """排序键，与推荐接口SQL的 ORDER BY 语义一致，最后以槽位号保证稳定"""
+
+    def desc_nulls_last(col: array, slot: int) -> tuple:
+        v = col[slot]
+        return (True, 0.0) if v != v else (False, -v)
+
+    if sort_by == "price_asc":
+        return lambda s: (price[s] != price[s], 0.0 if price[s] != price[s] else price[s], s)
+    if sort_by == "price_desc":
+        # 与 PostgreSQL 的 ORDER BY price DESC 一致：NULL 排在最前
+        return lambda s: (price[s] == price[s], 0.0 if price[s] != price[s] else -price[s], s)
+    if sort_by == "rating_desc":
+        return lambda s: desc_nulls_last(rating, s) + (s,)
+    if sort_by == "sales_desc":
+        return lambda s: desc_nulls_last(sales, s) + (s,)
+    return lambda s: (
+        desc_nulls_last(rating, s)
+        + desc_nulls_last(sales, s)
+        + (-(created[s] if created[s] == created[s] else 0.0), s)
+    )
+
+
+def _as_float(value: Optional[float]) -> float:
+    return _NAN if value is None else float(value)
+
+
+def _as_list(value: Any) -> tuple:
+    """JSONB数组字段转为元组，忽略非字符串元素"""
+    if not isinstance(value, list):
+        return ()
+    return tuple(v for v in value if isinstance(v, str))
+
+
+class _FacetState:
+    """索引数据：按槽位存储的列数组 + 每个分面取值的位图"""
+
+    def __init__(self):
+        self.ids = array("q")
+        self.slot_of: Dict[int, int] = {}
+        self.price = array("d")
+        self.rating = array("d")
+        self.sales = array("d")
+        self.created = array("d")
+        # 每个槽位的分面取值，更新时用于清除旧的位
+        self.values: Dict[str, list] = {f: [] for f in SINGLE_FACETS + MULTI_FACETS}
+        self.bits: Dict[str, Dict[Any, int]] = {f: {} for f in SINGLE_FACETS + MULTI_FACETS}
+        self.live = 0
+        # 价格分桶边界及累积位图（price_cum[b] 为价格落在 0..b 号桶内的商品）
+        self.price_edges: List[float] = []
+        self.price_cum: List[int] = []
+        # 构建价格分桶时的槽位数，目录增长一倍后按新的价格分布重建
+        self.price_bucketed = 0
+        # 各排序方式下的槽位序列，以及尚未反映到序列中的槽位
+        self.orders: Dict[str, array] = {mode: array("i") for mode in SORT_MODES}
+        # 价格排序序列对应的（单调递增）价格值，用于二分定位扫描起点
+        self.order_prices: Dict[str, array] = {"price_asc": array("d"), "price_desc": array("d")}
+        self.dirty: Set[int] = set()
+        self.rebuilding: Set[int] = set()
+
+    @property
+    def size(self) -> int:
+        return len(self.ids)
+
+    # ---- 排序键 ----
+
+    def sort_key(self, sort_by: str) -> Callable[[int], tuple]:
+        return _sort_key(sort_by, self.price, self.rating, self.sales, self.created)
+
+    # ---- 写入 ----
+
+    def _price_bucket(self, price: float) -> Optional[int]:
+        if price != price or not self.price_edges:
+            return None
+        return max(bisect_right(self.price_edges, price) - 1, 0)
+
+    def append(self, row: Any) -> int:
+        """追加新槽位（不设置位图）"""
+        slot = self.size
+        self.ids.append(row.id)
+        self.slot_of[row.id] = slot
+        self.price.append(_NAN)
+        self.rating.append(_NAN)
+        self.sales.append(_NAN)
+        self.created.append(_NAN)
+        for facet in self.values:
+            self.values[facet].append(None)
+        return slot
+
+    def write_columns(self, slot: int, row: Any) -> None:
+        """写入排序列和分面取值（不设置位图）"""
+        self.price[slot] = _as_float(row.price)
+        self.rating[slot] = _as_float(row.rating)
+        self.sales[slot] = _as_float(row.sales_count)
+        self.created[slot] = row.created_at.timestamp() if row.created_at else _NAN
+        self.values["gender"][slot] = row.suitable_gender
+        self.values["age_range"][slot] = row.suitable_age_range
+        self.values["style"][slot] = row.style
+        self.values["category"][slot] = row.category_id
+        self.values["platform"][slot] = row.platform
+        self.values["tags"][slot] = _as_list(row.tags)
+        self.values["scenes"][slot] = _as_list(row.suitable_scenes)
+
+    def _toggle_bits(self, slot: int, on: bool) -> None:
+        bit = 1 << slot
+        for facet in SINGLE_FACETS + MULTI_FACETS:
+            value = self.values[facet][slot]
+            keys = value if facet in MULTI_FACETS else (value,)
+            table = self.bits[facet]
+            for key in keys:
+                if on:
+                    table[key] = table.get(key, 0) | bit
+                else:
+                    table[key] = table.get(key, 0) & ~bit
+        if on and not self.price_edges and self.price[slot] == self.price[slot]:
+            # 加载时目录为空（或都没有价格）：第一个有价格的商品写入时再建分桶
+            self.build_price_buckets()
+        bucket = self._price_bucket(self.price[slot])
+        if bucket is not None:
+            for b in range(bucket, len(self.price_cum)):
+                if on:
+                    self.price_cum[b] |= bit
+                else:
+                    self.price_cum[b] &= ~bit
+        self.live = self.live | bit if on else self.live & ~bit
+
+    def upsert(self, row: Any) -> None:
+        """插入或更新单个商品"""
+        slot = self.slot_of.get(row.id)
+        if slot is None:
+            slot = self.append(row)
+        else:
+            self._toggle_bits(slot, on=False)
+        self.write_columns(slot, row)
+        self._toggle_bits(slot, on=True)
+        self.dirty.add(slot)
+
+    def remove(self, product_id: int) -> None:
+        """从索引中移除商品（槽位保留，只清除位图）"""
+        slot = self.slot_of.get(product_id)
+        if slot is not None:
+            self._toggle_bits(slot, on=False)
+
+    # ---- 批量构建 ----
+
+    def build_bitmaps(self) -> None:
+        """根据列数据批量构建全部位图和价格分桶"""
+        size = self.size
+        for facet in SINGLE_FACETS + MULTI_FACETS:
+            groups: Dict[Any, List[int]] = {}
+            multi = facet in MULTI_FACETS
+            for slot, value in enumerate(self.values[facet]):
+                for key in (value if multi else (value,)):
+                    groups.setdefault(key, []).append(slot)
+            self.bits[facet] = {key: _bits_from_slots(slots, size) for key, slots in groups.items()}
+        self.build_price_buckets()
+        self.live = _bits_from_slots(range(size), size)
+
+    def price_buckets_stale(self) -> bool:
+        """分桶是在小得多的目录上建的（如启动时目录为空），桶边界已不能反映价格分布"""
+        return len(self.price_edges) < PRICE_BUCKETS and self.size >= 2 * max(self.price_bucketed, 1)
+
+    def build_price_buckets(self) -> None:
+        """按当前价格分布重建分桶边界和累积位图"""
+        size = self.size
+        prices = sorted(p for p in self.price if p == p)
+        self.price_edges = []
+        if prices:
+            step = max(len(prices) // PRICE_BUCKETS, 1)
+            self.price_edges = sorted(set(prices[::step]))
+        buckets: List[List[int]] = [[] for _ in self.price_edges]
+        for slot, p in enumerate(self.price):
+            bucket = self._price_bucket(p)
+            if bucket is not None:
+                buckets[bucket].append(slot)
+        self.price_cum = []
+        acc: List[int] = []
+        for slots in buckets:
+            acc.extend(slots)
+            self.price_cum.append(_bits_from_slots(acc, size))
+        self.price_bucketed = size
+
+    def compute_orders(self, size: int) -> tuple:
+        """
+        计算各排序方式下 0..size-1 槽位的顺序
+
+        基于列数据的快照计算，计算期间的并发更新不会破坏序列的有序性。
+
+        Returns:
+            (各排序方式的槽位序列, 价格排序序列对应的价格值)
+        """
+        price = self.price[:size]
+        rating = self.rating[:size]
+        sales = self.sales[:size]
+        created = self.created[:size]
+        orders = {
+            mode: array("i", sorted(range(size), key=_sort_key(mode, price, rating, sales, created)))
+            for mode in SORT_MODES
+        }
+        order_prices = {
+            "price_asc": array("d", (price[s] if price[s] == price[s] else _INF for s in orders["price_asc"])),
+            "price_desc": array("d", (-price[s] if price[s] == price[s] else -_INF for s in orders["price_desc"])),
+        }
+        return orders, order_prices
+
+    # ---- 查询 ----
+
+    def price_mask(self, price_min: Optional[float], price_max: Optional[float]) -> int:
+        """价格区间的候选位图（按分桶取超集，精确判断在取结果时进行）"""
+        if not self.price_cum:
+            return 0
+        first = self._price_bucket(price_min) if price_min is not None else 0
+        last = self._price_bucket(price_max) if price_max is not None else len(self.price_cum) - 1
+        mask = self.price_cum[last]
+        if first:
+            mask &= ~self.price_cum[first - 1]
+        return mask
+
+    def any_of(self, facet: str, keys: Iterable[Any]) -> int:
+        table = self.bits[facet]
+        mask = 0
+        for key in keys:
+            mask |= table.get(key, 0)
+        return mask
+
+    def top_k(
+        self,
+        mask: int,
+        sort_by: str,
+        limit: int,
+        price_min: Optional[float],
+        price_max: Optional[float],
+    ) -> List[int]:
+        """按排序方式取位图中前 limit 个商品ID"""
+        count = mask.bit_count()
+        if not count:
+            return []
+        size = self.size
+        price = self.price
+
+        def price_ok(slot: int) -> bool:
+            p = price[slot]
+            if price_min is not None and not p >= price_min:
+                return False
+            if price_max is not None and not p <= price_max:
+                return False
+            return True
+
+        key = self.sort_key(sort_by)
+        if count * count <= WALK_COST_RATIO * limit * size:
+            slots = [s for s in _iter_bits(mask, size) if price_ok(s)]
+            return [self.ids[s] for s in heapq.nsmallest(limit, slots, key=key)]
+
+        order = self.orders.get(sort_by, self.orders["relevance"])
+        # 按价格排序且有价格条件时，只扫描序列中价格落在区间内的一段
+        start, end = 0, len(order)
+        if sort_by in self.order_prices and (price_min is not None or price_max is not None):
+            prices = self.order_prices[sort_by]
+            low, high = (price_min, price_max) if sort_by == "price_asc" else (
+                -price_max if price_max is not None else None,
+                -price_min if price_min is not None else None,
+            )
+            start = bisect_left(prices, low) if low is not None else bisect_right(prices, -_INF)
+            end = bisect_right(prices, high) if high is not None else bisect_left(prices, _INF)
+
+        data = mask.to_bytes((size + 7) // 8, "little")
+        stale = self.dirty | self.rebuilding
+        picked: List[int] = []
+        for slot in memoryview(order)[start:end]:
+            if slot in stale:
+                continue
+            if data[slot >> 3] >> (slot & 7) & 1 and price_ok(slot):
+                picked.append(slot)
+                if len(picked) >= limit:
+                    break
+        # 序列中位置已过期或尚未进入序列的槽位按当前值单独参与合并
+        extra = [
+            s for s in stale
+            if s < size and data[s >> 3] >> (s & 7) & 1 and price_ok(s)
+        ]
+        if extra:
+            picked = heapq.nsmallest(limit, picked + extra, key=key)
+        return [self.ids[s] for s in picked]
+
+
+class ProductFacetIndex:
+    """
+    商品分面索引
+
+    启动时从数据库全量加载，之后按 updated_at/created_at 水位线增量刷新；
+    新建商品时也可直接调用 upsert 立即生效。
+    """
+
+    def __init__(self, rebuild_threshold: int = 1024, refresh_overlap: float = 60):
+        """
+        Args:
+            rebuild_threshold: 未反映到排序序列中的槽位数超过该值时重算排序序列
+            refresh_overlap: 增量刷新回看水位线之前的秒数。时间戳取自事务开始时间，
+                事务提交较晚的商品时间戳可能早于已推进的水位线
+        """
+        self.rebuild_threshold = rebuild_threshold
+        self.refresh_overlap = timedelta(seconds=refresh_overlap)
+        self.loaded = False
+        self.watermark = None
+        # 回看窗口内已处理过的商品及其修改时间，重复读到同一版本时跳过
+        self._recent: Dict[int, Any] = {}
+        self._state = _FacetState()
+        self._lock = threading.RLock()
+        self._rebuild_lock = threading.Lock()
+        self.stats = {
+            "products": 0,
+            "load_seconds": 0.0,
+            "loaded_at": None,
+            "refreshed_at": None,
+            "searches": 0,
+            "search_seconds_total": 0.0,
+        }
+
+    # ---- 加载与刷新 ----
+
+    def load(self, db: Session) -> None:
+        """全量加载商品目录，构建完成后原子替换"""
+        started = time.perf_counter()
+        state = _FacetState()
+        watermark = None
+        recent: Dict[int, Any] = {}
+        for row in db.query(*_INDEX_COLUMNS).yield_per(10000):
+            slot = state.append(row)
+            state.write_columns(slot, row)
+            changed_at = row.updated_at or row.created_at
+            if changed_at and (watermark is None or changed_at > watermark):
+                watermark = changed_at
+            if changed_at and changed_at >= watermark - self.refresh_overlap:
+                recent[row.id] = changed_at
+        state.build_bitmaps()
+        state.orders, state.order_prices = state.compute_orders(state.size)
+
+        with self._lock:
+            self._state = state
+            self.watermark = watermark
+            self._recent = self._prune_recent(recent, watermark)
+            self.loaded = True
+        elapsed = time.perf_counter() - started
+        self.stats.update(products=state.size, load_seconds=round(elapsed, 3), loaded_at=time.time())
+        logger.info(f"商品分面索引加载完成: {state.size} 个商品, 耗时 {elapsed:.2f}s")
+
+    def refresh(self, db: Session) -> int:
+        """
+        增量刷新：读取水位线（减去回看窗口）之后新增或修改的商品，返回更新数量
+
+        回看窗口内的商品每次刷新都会再读到，按商品ID和修改时间去重，未变化的不重复写入。
+        """
+        if not self.loaded:
+            self.load(db)
+            return self.stats["products"]
+
+        query = db.query(*_INDEX_COLUMNS)
+        if self.watermark is not None:
+            changed_at = func.coalesce(Product.updated_at, Product.created_at)
+            query = query.filter(changed_at >= self.watermark - self.refresh_overlap)
+        count = 0
+        for row in query.yield_per(1000):
+            changed = row.updated_at or row.created_at
+            if changed is not None and self._recent.get(row.id) == changed:
+                continue
+            self.upsert(row)
+            if changed:
+                self._recent[row.id] = changed
+                if self.watermark is None or changed > self.watermark:
+                    self.watermark = changed
+            count += 1
+        self._recent = self._prune_recent(self._recent, self.watermark)
+        self.stats["refreshed_at"] = time.time()
+        self.stats["products"] = self._state.size
+
+        if self._state.price_buckets_stale():
+            with self._lock:
+                self._state.build_price_buckets()
+        if len(self._state.dirty) > self.rebuild_threshold:
+            self.rebuild_orders()
+        return count
+
+    def _prune_recent(self, recent: Dict[int, Any], watermark: Any) -> Dict[int, Any]:
+        """只保留下一次刷新仍会读到的商品"""
+        if watermark is None:
+            return {}
+        cutoff = watermark - self.refresh_overlap
+        return {pid: ts for pid, ts in recent.items() if ts >= cutoff}
+
+    def rebuild_orders(self) -> None:
+        """重算排序序列；计算期间不持有查询锁，期间发生的更新继续按脏槽位处理"""
+        if not self._rebuild_lock.acquire(blocking=False):
+            return
+        try:
+            with self._lock:
+                state = self._state
+                state.rebuilding = state.dirty
+                state.dirty = set()
+                size = state.size
+            orders, order_prices = state.compute_orders(size)
+            with self._lock:
+                if state is self._state:
+                    state.orders = orders
+                    state.order_prices = order_prices
+                    state.rebuilding = set()
+        finally:
+            self._rebuild_lock.release()
+
+    def upsert(self, product: Any) -> None:
+        """插入或更新单个商品（接受 Product 实例或查询结果行）"""
+        if not self.loaded:
+            return
+        with self._lock:
+            self._state.upsert(product)
+
+    def remove(self, product_id: int) -> None:
+        """移除单个商品"""
+        if not self.loaded:
+            return
+        with self._lock:
+            self._state.remove(product_id)
+
+    # ---- 查询 ----
+
+    def search(
+        self,
+        price_min: Optional[float] = None,
+        price_max: Optional[float] = None,
+        gender: Optional[str] = None,
+        age_range: Optional[str] = None,
+        style: Optional[str] = None,
+        category_ids: Optional[List[int]] = None,
+        platform: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        scenes: Optional[List[str]] = None,
+        sort_by: str = "relevance",
+        limit: int = 10,
+    ) -> List[int]:
+        """
+        按推荐筛选条件查询商品ID，语义与推荐接口的SQL查询一致：
+        性别/年龄段/风格允许商品取值为空，标签/场景匹配任一元素，
+        标签/场景没有命中时放宽这两个条件
+
+        Returns:
+            按排序方式排列的商品ID列表
+        """
+        started = time.perf_counter()
+        with self._lock:
+            state = self._state
+            bits = state.bits
+            mask = state.live
+            if price_min is not None or price_max is not None:
+                mask &= state.price_mask(price_min, price_max)
+            if gender:
+                mask &= state.any_of("gender", (gender, "unisex", None))
+            if age_range:
+                mask &= state.any_of("age_range", (age_range, None))
+            if style:
+                mask &= state.any_of("style", (style, None))
+            if category_ids is not None:
+                mask &= state.any_of("category", category_ids)
+            if platform:
+                mask &= bits["platform"].get(platform, 0)
+
+            strict = mask
+            if tags:
+                strict &= state.any_of("tags", tags)
+            if scenes:
+                strict &= state.any_of("scenes", scenes)
+
+            ids = state.top_k(strict, sort_by, limit, price_min, price_max)
+            if not ids and (tags or scenes):
+                ids = state.top_k(mask, sort_by, limit, price_min, price_max)
+
+        self.stats["searches"] += 1
+        self.stats["search_seconds_total"] += time.perf_counter() - started
+        return ids
+
+    def get_stats(self) -> Dict[str, Any]:
+        searches = self.stats["searches"]
+        return {
+            "loaded": self.loaded,
+            **self.stats,
+            "dirty_slots": len(self._state.dirty),
+            "avg_search_ms": round(self.stats["search_seconds_total"] / searches * 1000, 3) if searches else 0.0,
+        }
+
+
+async def run_refresh_loop(index: ProductFacetIndex, interval: float) -> None:
+    """后台任务：首次全量加载，之后定期增量刷新"""
+    while True:
+        try:
+            await asyncio.to_thread(_refresh_with_session, index)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"商品分面索引刷新失败: {e!r}")
+        await asyncio.sleep(interval)
+
+
+def _refresh_with_session(index: ProductFacetIndex) -> None:
+    db = SessionLocal()
+    try:
+        index.refresh(db)
+    finally:
+        db.close()
+
+
+# 创建全局实例
+product_facet_index = ProductFacetIndex(refresh_overlap=settings.INDEX_REFRESH_OVERLAP)
@@ -0,0 +1,257 @@
+"""
+LLM结果缓存 - 进程内LRU + Redis两级缓存
+用于缓存需求分析等耗时的模型调用结果
+"""
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Mapping, Optional
+import hashlib
+import json
+import logging
+import time
+
+import redis.asyncio as aioredis
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 预算分桶边界（元），同一桶内的预算视为同一类请求
+BUDGET_BUCKETS = [0, 50, 100, 200, 300, 500, 800, 1000, 1500, 2000, 3000, 5000, 10000]
+
+# 参与签名的请求字段（与 RecommendationRequest 保持一致）
+SIGNATURE_FIELDS = [
+    "user_query", "recipient_type", "age_range", "gender", "relationship",
+    "occasion", "budget_min", "budget_max", "style", "mbti", "zodiac", "interests",
+]
+
+
+def _bucket_budget(value: Optional[float]) -> Optional[int]:
+    """将预算映射到所在分桶的下边界"""
+    if value is None:
+        return None
+    bucket = BUDGET_BUCKETS[0]
+    for edge in BUDGET_BUCKETS:
+        if value >= edge:
+            bucket = edge
+        else:
+            break
+    return bucket
+
+
+def _normalize_text(value: Optional[str]) -> Optional[str]:
+    """去除首尾空白、合并连续空白并转为小写"""
+    if value is None:
+        return None
+    text = " ".join(value.split()).lower()
+    return text or None
+
+
+def canonicalize_request(request: Mapping[str, Any], bucket_budget: bool = True) -> Dict[str, Any]:
+    """
+    规范化推荐请求，语义相同的请求得到相同的结果
+
+    - 预算按 BUDGET_BUCKETS 分桶（bucket_budget=False 时保留精确值）
+    - 兴趣爱好去重并排序
+    - 文本字段合并空白、统一小写
+    """
+    canonical: Dict[str, Any] = {}
+    for field in SIGNATURE_FIELDS:
+        value = request.get(field)
+        if field in ("budget_min", "budget_max"):
+            value = _bucket_budget(value) if bucket_budget else value
+        elif field == "interests":
+            items = {_normalize_text(i) for i in (value or [])}
+            value = sorted(i for i in items if i) or None
+        elif isinstance(value, str):
+            value = _normalize_text(value)
+        canonical[field] = value
+    return canonical
+
+
+def request_signature(
+    request: Mapping[str, Any],
+    fields: Optional[Iterable[str]] = None,
+    bucket_budget: bool = True,
+) -> str:
+    """生成请求签名（规范化后的请求做SHA1摘要）"""
+    canonical = canonicalize_request(request, bucket_budget=bucket_budget)
+    if fields is not None:
+        canonical = {k: canonical.get(k) for k in fields}
+    payload = json.dumps(canonical, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+# 推荐理由提示词用到的商品字段
+REASONING_PRODUCT_FIELDS = ["id", "name", "price", "style", "description"]
+
+
+def reasoning_signature(
+    products: Iterable[Mapping[str, Any]],
+    request: Mapping[str, Any],
+    model: str,
+) -> str:
+    """
+    推荐理由签名：有序商品（含提示词用到的内容）+ 规范化请求字段（精确预算）+ 模型
+
+    商品名称、价格、风格、描述任一变化都会得到新的签名，旧缓存不再命中、按TTL过期。
+    """
+    payload = json.dumps(
+        {
+            "model": model,
+            "request": canonicalize_request(request, bucket_budget=False),
+            "products": [[p.get(f) for f in REASONING_PRODUCT_FIELDS] for p in products],
+        },
+        ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str,
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    """带过期时间的进程内LRU缓存"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self._data[key] = (time.monotonic() + (ttl or self.ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class LLMCache:
+    """
+    两级缓存：进程内LRU在前，Redis在后
+
+    Redis不可用时自动降级为仅使用进程内缓存，不影响主流程；连接失败后
+    REDIS_RETRY_AFTER 秒内不再访问Redis，避免每次未命中都等满读写超时。
+    """
+
+    def __init__(self, namespace: str, ttl: float, local_size: int, redis_url: Optional[str] = None):
+        """
+        Args:
+            namespace: Redis键前缀
+            ttl: 过期时间（秒）
+            local_size: 进程内LRU容量
+            redis_url: Redis地址，默认从配置读取
+        """
+        self.namespace = namespace
+        self.ttl = ttl
+        self.local = LRUCache(local_size, ttl)
+        self.redis_url = redis_url or settings.REDIS_URL
+        self._redis = None
+        self.redis_enabled = settings.REDIS_CACHE_ENABLED
+        self.retry_after = settings.REDIS_RETRY_AFTER
+        self._redis_down_until = 0.0
+        self.stats = {
+            "local_hits": 0, "redis_hits": 0, "misses": 0, "sets": 0,
+            "redis_errors": 0, "redis_skipped": 0,
+        }
+
+    def _redis_key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _get_redis(self):
+        """延迟创建Redis客户端；连接失败后的暂停期内返回 None"""
+        if not self.redis_enabled:
+            return None
+        if time.monotonic() < self._redis_down_until:
+            self.stats["redis_skipped"] += 1
+            return None
+        if self._redis is None:
+            self._redis = aioredis.from_url(
+                self.redis_url,
+                socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            )
+        return self._redis
+
+    def _redis_failed(self, action: str, error: Exception) -> None:
+        """记录Redis错误；连接失败或超时时暂停访问，到期后再重试"""
+        self.stats["redis_errors"] += 1
+        if isinstance(error, (aioredis.ConnectionError, aioredis.TimeoutError, OSError)):
+            self._redis_down_until = time.monotonic() + self.retry_after
+            logger.warning(f"{action}Redis缓存失败，{self.retry_after}秒内只使用进程内缓存: {error!r}")
+        else:
+            logger.warning(f"{action}Redis缓存失败: {error!r}")
+
+    async def get(self, key: str) -> Optional[Any]:
+        """读取缓存，依次查询进程内LRU和Redis"""
+        value = self.local.get(key)
+        if value is not None:
+            self.stats["local_hits"] += 1
+            return value
+
+        client = self._get_redis()
+        if client is not None:
+            try:
+                raw = await client.get(self._redis_key(key))
+                if raw is not None:
+                    value = json.loads(raw)
+                    self.local.set(key, value)
+                    self.stats["redis_hits"] += 1
+                    return value
+            except Exception as e:
+                self._redis_failed("读取", e)
+
+        self.stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """写入缓存（同时写入进程内LRU和Redis）"""
+        ttl = ttl or self.ttl
+        self.local.set(key, value, ttl)
+        self.stats["sets"] += 1
+
+        client = self._get_redis()
+        if client is not None:
+            try:
+                await client.set(
+                    self._redis_key(key),
+                    json.dumps(value, ensure_ascii=False),
+                    ex=int(ttl),
+                )
+            except Exception as e:
+                self._redis_failed("写入", e)
+
+    async def delete(self, key: str) -> None:
+        """删除缓存"""
+        self.local.delete(key)
+        client = self._get_redis()
+        if client is not None:
+            try:
+                await client.delete(self._redis_key(key))
+            except Exception as e:
+                self._redis_failed("删除", e)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """缓存命中统计"""
+        hits = self.stats["local_hits"] + self.stats["redis_hits"]
+        total = hits + self.stats["misses"]
+        return {
+            **self.stats,
+            "local_size": len(self.local),
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+        }
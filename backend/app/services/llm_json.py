@@ -0,0 +1,154 @@
+"""
+模型输出JSON处理 - 提取与本地修复
+结构化输出下模型基本只会生成合法JSON；被截断或夹带说明文字时在本地修复，不重新调用模型
+"""
+from typing import Any, List, Optional
+import json
+import re
+
+_CODE_FENCE = re.compile(r"```(?:json)?\s*(.*?)(?:```|$)", re.DOTALL)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_PY_LITERAL = re.compile(r"\b(True|False|None)\b")
+_QUOTE_FIXES = str.maketrans({"“": '"', "”": '"'})
+
+
+def extract_json_text(text: str) -> str:
+    """去掉代码块标记和JSON对象之前的说明文字"""
+    text = text.strip()
+    fence = _CODE_FENCE.search(text)
+    if fence:
+        text = fence.group(1).strip()
+    start = text.find("{")
+    return text[start:] if start != -1 else text
+
+
+def _close_unbalanced(text: str) -> str:
+    """
+    补全被截断的JSON：未闭合的字符串和括号按嵌套顺序补齐，
+    丢弃最后一个完整值之后的残缺片段（如悬空的键或逗号）
+    """
+    stack: List[str] = []
+    in_string = False
+    escaped = False
+    end = len(text)
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]":
+            if stack:
+                stack.pop()
+            if not stack:
+                # 顶层对象已闭合，之后的内容都是多余的说明文字
+                end = i + 1
+                break
+    text = text[:end]
+    if not stack:
+        return text
+    if in_string:
+        text += '"'
+    text = text.rstrip()
+    if stack[-1] == "}":
+        # 对象中悬空的键（"key" 或 "key":）没有值，去掉
+        text = re.sub(r'([{,])\s*"[^"]*"\s*:?\s*$', r"\1", text)
+    text = text.rstrip().rstrip(",")
+    return text + "".join(reversed(stack))
+
+
+def repair_json(text: str) -> str:
+    """对接近合法的JSON做低成本修复"""
+    text = extract_json_text(text).translate(_QUOTE_FIXES)
+    text = _PY_LITERAL.sub(lambda m: _PY_LITERALS[m.group(1)], text)
+    text = _close_unbalanced(text)
+    return _TRAILING_COMMA.sub(r"\1", text)
+
+
+def loads_lenient(text: str) -> "tuple[Optional[Any], bool]":
+    """
+    解析JSON，失败时尝试本地修复
+
+    Returns:
+        (解析结果, 是否经过修复)；修复后仍无法解析时结果为 None
+    """
+    try:
+        return json.loads(text), False
+    except json.JSONDecodeError:
+        pass
+    try:
+        return json.loads(repair_json(text)), True
+    except json.JSONDecodeError:
+        return None, True
+
+
+class JsonObjectScanner:
+    """
+    增量JSON对象扫描器
+
+    流式输出逐段喂入，括号配平（忽略字符串内的括号）且能成功解析时返回完整对象文本，
+    调用方即可中止生成。对象之前的说明文字和 <think>...</think> 思考内容会被跳过。
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._start = -1
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, chunk: str) -> Optional[str]:
+        """喂入一段输出，对象完整时返回对象文本，否则返回 None"""
+        self.text += chunk
+        text = self.text
+        while self._pos < len(text):
+            if self._start < 0:
+                brace = text.find("{", self._pos)
+                think = text.find("<think>", self._pos)
+                if think != -1 and (brace == -1 or think < brace):
+                    end = text.find("</think>", think)
+                    if end == -1:
+                        self._pos = think
+                        return None
+                    self._pos = end + len("</think>")
+                    continue
+                if brace == -1:
+                    # 保留末尾几个字符，以免漏掉被分段截断的 "<think>"
+                    self._pos = max(self._pos, len(text) - len("<think>") + 1)
+                    return None
+                self._start = self._pos = brace
+
+            ch = text[self._pos]
+            self._pos += 1
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    candidate = text[self._start:self._pos]
+                    try:
+                        json.loads(candidate)
+                        return candidate
+                    except json.JSONDecodeError:
+                        # 配平但不合法（如说明文字里的花括号），从下一个位置继续寻找
+                        self._pos = self._start + 1
+                        self._start = -1
+        return None
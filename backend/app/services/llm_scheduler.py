@@ -0,0 +1,156 @@
+"""
+LLM调度器 - 有界并发 + 按用户角色分优先级排队
+Ollama 能同时处理的请求数有限，超出部分在这里排队，高优先级用户先获得执行槽位
+"""
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import asyncio
+import heapq
+import itertools
+import logging
+
+from app.core.config import settings
+from app.models.user import User, UserRole
+
+logger = logging.getLogger(__name__)
+
+# 优先级通道（数值越小越优先）
+PRIORITY_VIP = 0
+PRIORITY_ADMIN = 1
+PRIORITY_USER = 2
+PRIORITY_ANONYMOUS = 3
+PRIORITY_BATCH = 4
+
+PRIORITY_LANES = {
+    PRIORITY_VIP: "vip",
+    PRIORITY_ADMIN: "admin",
+    PRIORITY_USER: "user",
+    PRIORITY_ANONYMOUS: "anonymous",
+    PRIORITY_BATCH: "batch",
+}
+
+ROLE_PRIORITY = {
+    UserRole.VIP: PRIORITY_VIP,
+    UserRole.ADMIN: PRIORITY_ADMIN,
+    UserRole.USER: PRIORITY_USER,
+}
+
+
+def priority_for_user(user: Optional[User]) -> int:
+    """根据用户角色确定优先级，未登录用户走匿名通道"""
+    if user is None:
+        return PRIORITY_ANONYMOUS
+    return ROLE_PRIORITY.get(user.role, PRIORITY_USER)
+
+
+class LLMOverloadedError(Exception):
+    """LLM排队超过最长等待时间或队列已满"""
+
+
+class LLMScheduler:
+    """
+    有界并发的优先级调度器
+
+    - 同时执行的LLM调用数不超过 concurrency（与 Ollama 的 OLLAMA_NUM_PARALLEL 对齐）
+    - 排队请求按优先级、再按到达顺序获得槽位
+    - 排队超过 max_wait 秒或队列长度达到 max_queue 时抛出 LLMOverloadedError，
+      由调用方降级到规则推荐
+    """
+
+    def __init__(self, concurrency: int, max_queue: int, max_wait: float):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._active = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self.lane_stats: Dict[str, Dict[str, Any]] = {
+            lane: {"admitted": 0, "timeouts": 0, "rejected": 0, "wait_seconds_total": 0.0, "max_wait_seconds": 0.0}
+            for lane in PRIORITY_LANES.values()
+        }
+
+    def _queued(self) -> int:
+        return sum(1 for _, _, fut in self._waiters if not fut.done())
+
+    def _record_admit(self, lane: str, waited: float) -> None:
+        stats = self.lane_stats[lane]
+        stats["admitted"] += 1
+        stats["wait_seconds_total"] += waited
+        stats["max_wait_seconds"] = max(stats["max_wait_seconds"], round(waited, 3))
+
+    async def acquire(self, priority: int = PRIORITY_USER) -> None:
+        """获取执行槽位，必要时排队等待"""
+        lane = PRIORITY_LANES.get(priority, "user")
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+
+        if self._active < self.concurrency and not self._queued():
+            self._active += 1
+            self._record_admit(lane, 0.0)
+            return
+
+        if self._queued() >= self.max_queue:
+            self.lane_stats[lane]["rejected"] += 1
+            raise LLMOverloadedError(f"LLM队列已满（{self.max_queue}）")
+
+        fut = loop.create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), timeout=self.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if fut.done() and not fut.cancelled():
+                # 超时/取消的同时恰好分配到了槽位，归还
+                self.release()
+            else:
+                fut.cancel()
+            if isinstance(e, asyncio.TimeoutError):
+                self.lane_stats[lane]["timeouts"] += 1
+                raise LLMOverloadedError(f"LLM排队超过 {self.max_wait} 秒") from None
+            raise
+        self._record_admit(lane, loop.time() - started)
+
+    def release(self) -> None:
+        """释放槽位，直接转交给优先级最高的等待者"""
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self._active -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_USER) -> AsyncIterator[None]:
+        """在槽位内执行：async with scheduler.slot(priority): ..."""
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        depth = {lane: 0 for lane in PRIORITY_LANES.values()}
+        for priority, _, fut in self._waiters:
+            if not fut.done():
+                depth[PRIORITY_LANES.get(priority, "user")] += 1
+        lanes = {}
+        for lane, stats in self.lane_stats.items():
+            admitted = stats["admitted"]
+            lanes[lane] = {
+                **stats,
+                "queued": depth[lane],
+                "avg_wait_seconds": round(stats["wait_seconds_total"] / admitted, 3) if admitted else 0.0,
+            }
+        return {
+            "concurrency": self.concurrency,
+            "active": self._active,
+            "queued": sum(depth.values()),
+            "lanes": lanes,
+        }
+
+
+# 创建全局实例
+llm_scheduler = LLMScheduler(
+    concurrency=settings.LLM_CONCURRENCY,
+    max_queue=settings.LLM_MAX_QUEUE,
+    max_wait=settings.LLM_MAX_WAIT,
+)
@@ -0,0 +1,100 @@
+"""
+模型路由 - 按调用类型选择模型和 Ollama 节点池
+需求分析用小而快的模型，推荐理由可以用更大的模型；各自的节点池可以横向扩展
+"""
+from typing import Any, Dict, List
+import logging
+
+from app.core.config import settings
+from app.services.ollama_pool import ALTERNATIVE_URLS, OllamaPool, default_urls
+
+logger = logging.getLogger(__name__)
+
+CALL_ANALYSIS = "analysis"
+CALL_REASONING = "reasoning"
+
+
+def _split_urls(value: str) -> List[str]:
+    return [u.strip() for u in value.split(",") if u.strip()]
+
+
+class ModelRoute:
+    """一种调用类型的路由：模型名 + 节点池"""
+
+    def __init__(self, call_type: str, model: str, pool: OllamaPool):
+        self.call_type = call_type
+        self.model = model
+        self.pool = pool
+
+
+class ModelRouter:
+    """
+    调用类型 -> (模型, 节点池) 的路由表，并按模型统计延迟
+
+    未单独配置节点地址的调用类型共用默认节点池（OLLAMA_BASE_URL + 常见备用地址）。
+    """
+
+    def __init__(self, base_url: str, default_model: str):
+        self.default_pool = OllamaPool(
+            default_urls(base_url), alternatives=[u for u in ALTERNATIVE_URLS if u != base_url]
+        )
+        self.routes: Dict[str, ModelRoute] = {}
+        for call_type, model, urls in (
+            (CALL_ANALYSIS, settings.OLLAMA_ANALYSIS_MODEL, settings.OLLAMA_ANALYSIS_URLS),
+            (CALL_REASONING, settings.OLLAMA_REASONING_MODEL, settings.OLLAMA_REASONING_URLS),
+        ):
+            urls = _split_urls(urls)
+            pool = OllamaPool(urls) if urls else self.default_pool
+            self.routes[call_type] = ModelRoute(call_type, model or default_model, pool)
+        self.model_stats: Dict[str, Dict[str, float]] = {}
+
+    def route(self, call_type: str) -> ModelRoute:
+        return self.routes[call_type]
+
+    def pools(self) -> List[OllamaPool]:
+        """全部节点池（去重）"""
+        pools: List[OllamaPool] = []
+        for route in self.routes.values():
+            if route.pool not in pools:
+                pools.append(route.pool)
+        return pools
+
+    def models(self) -> Dict[str, List[OllamaPool]]:
+        """模型 -> 使用该模型的节点池（用于预热）"""
+        models: Dict[str, List[OllamaPool]] = {}
+        for route in self.routes.values():
+            pools = models.setdefault(route.model, [])
+            if route.pool not in pools:
+                pools.append(route.pool)
+        return models
+
+    def record(self, model: str, latency: float, ok: bool) -> None:
+        """记录一次调用的延迟（流式调用为首段延迟）"""
+        stats = self.model_stats.setdefault(
+            model, {"calls": 0, "errors": 0, "latency_total": 0.0, "latency_max": 0.0}
+        )
+        stats["calls"] += 1
+        if not ok:
+            stats["errors"] += 1
+            return
+        stats["latency_total"] += latency
+        stats["latency_max"] = max(stats["latency_max"], latency)
+
+    def get_stats(self) -> Dict[str, Any]:
+        models = {}
+        for model, stats in self.model_stats.items():
+            succeeded = stats["calls"] - stats["errors"]
+            models[model] = {
+                "calls": stats["calls"],
+                "errors": stats["errors"],
+                "avg_latency": round(stats["latency_total"] / succeeded, 3) if succeeded else 0.0,
+                "max_latency": round(stats["latency_max"], 3),
+            }
+        return {
+            "routes": {
+                call_type: {"model": route.model, "endpoints": [ep.url for ep in route.pool.endpoints]}
+                for call_type, route in self.routes.items()
+            },
+            "models": models,
+            "pools": [pool.get_stats() for pool in self.pools()],
+        }
@@ -0,0 +1,277 @@
+"""
+Ollama 节点池 - 每个节点带熔断器，后台健康探测，按负载在存活节点间分配
+Ollama 变慢或宕机时熔断器打开，请求立即降级而不是等满超时
+"""
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+import asyncio
+import logging
+import time
+
+import httpx
+import ollama
+
+from app.core.config import settings
+from app.services.llm_scheduler import LLMOverloadedError
+
+logger = logging.getLogger(__name__)
+
+# 配置地址不可用时尝试的备用地址（适用于Docker环境）
+ALTERNATIVE_URLS = [
+    "http://ollama:11434",  # Docker Compose 服务名（优先）
+    "http://host.docker.internal:11434",  # Docker Desktop / Docker 20.10+
+    "http://172.17.0.1:11434",  # Docker默认网关（Linux）
+    "http://localhost:11434",  # 本地运行
+]
+
+# 节点延迟的指数移动平均系数
+LATENCY_EWMA_ALPHA = 0.2
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class LLMUnavailableError(LLMOverloadedError):
+    """所有节点的熔断器均已打开，与排队超时一样由调用方降级为规则推荐"""
+
+
+class CircuitBreaker:
+    """
+    熔断器
+
+    - closed：正常放行，记录最近 window 次调用结果；慢调用（超过 slow_call 秒）计为失败
+    - 最近调用数不少于 min_calls 且失败率达到 failure_rate 时打开
+    - open：直接拒绝；open_seconds 秒后或健康探测成功后进入 half_open
+    - half_open：只放行一个试探调用，成功则关闭，失败则重新打开
+    """
+
+    def __init__(
+        self,
+        failure_rate: float,
+        min_calls: int,
+        window: int,
+        slow_call: float,
+        open_seconds: float,
+    ):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.slow_call = slow_call
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self.stats = {"opened": 0, "rejected": 0, "failures": 0, "slow_calls": 0}
+
+    def rejecting(self) -> bool:
+        """是否处于打开且尚未到恢复时间（不改变状态）"""
+        return self.state == OPEN and time.monotonic() - self._opened_at < self.open_seconds
+
+    def allow(self) -> bool:
+        """是否放行本次调用"""
+        if self.state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self.half_open()
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        self.stats["rejected"] += 1
+        return False
+
+    def record_success(self, latency: float) -> None:
+        if latency > self.slow_call:
+            self.stats["slow_calls"] += 1
+            self.record_failure()
+            return
+        if self.state == HALF_OPEN:
+            self.close()
+            return
+        self._outcomes.append(True)
+
+    def record_failure(self) -> None:
+        self.stats["failures"] += 1
+        if self.state == HALF_OPEN:
+            self.trip()
+            return
+        self._outcomes.append(False)
+        failures = self._outcomes.count(False)
+        if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate:
+            self.trip()
+
+    def release_trial(self) -> None:
+        """试探调用被取消（既不算成功也不算失败）时归还试探名额"""
+        self._trial_in_flight = False
+
+    def trip(self) -> None:
+        if self.state != OPEN:
+            self.stats["opened"] += 1
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._trial_in_flight = False
+
+    def half_open(self) -> None:
+        if self.state == OPEN:
+            self.state = HALF_OPEN
+            self._trial_in_flight = False
+
+    def close(self) -> None:
+        self.state = CLOSED
+        self._outcomes.clear()
+        self._trial_in_flight = False
+
+    def get_stats(self) -> Dict[str, Any]:
+        total = len(self._outcomes)
+        return {
+            "state": self.state,
+            **self.stats,
+            "window_failure_rate": round(self._outcomes.count(False) / total, 4) if total else 0.0,
+        }
+
+
+class OllamaEndpoint:
+    """单个 Ollama 节点：复用的异步客户端 + 熔断器 + 负载统计"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.in_flight = 0
+        self.latency_ewma: Optional[float] = None
+        # 异步客户端在整个进程内复用，底层httpx连接池保持长连接；
+        # 连接阶段单独限时，节点不可达时尽快失败并切换节点，不耗尽整个调用的超时
+        self.client = ollama.AsyncClient(
+            host=url,
+            timeout=httpx.Timeout(settings.OLLAMA_TIMEOUT, connect=settings.OLLAMA_CONNECT_TIMEOUT),
+        )
+        self.breaker = CircuitBreaker(
+            failure_rate=settings.OLLAMA_BREAKER_FAILURE_RATE,
+            min_calls=settings.OLLAMA_BREAKER_MIN_CALLS,
+            window=settings.OLLAMA_BREAKER_WINDOW,
+            slow_call=settings.OLLAMA_BREAKER_SLOW_CALL,
+            open_seconds=settings.OLLAMA_BREAKER_OPEN_SECONDS,
+        )
+
+    def begin(self) -> None:
+        self.in_flight += 1
+
+    def end(self, latency: Optional[float] = None) -> None:
+        """调用结束；latency 为成功调用的延迟，失败时不更新"""
+        self.in_flight -= 1
+        if latency is not None:
+            if self.latency_ewma is None:
+                self.latency_ewma = latency
+            else:
+                self.latency_ewma += LATENCY_EWMA_ALPHA * (latency - self.latency_ewma)
+
+    def load_score(self, default_latency: float) -> float:
+        """预计等待代价：(进行中请求数 + 1) × 平均延迟"""
+        latency = self.latency_ewma if self.latency_ewma is not None else default_latency
+        return (self.in_flight + 1) * latency
+
+    async def probe(self) -> bool:
+        """健康探测：列出模型（不触发生成）"""
+        try:
+            await asyncio.wait_for(self.client.list(), timeout=settings.OLLAMA_CONNECT_TIMEOUT)
+            return True
+        except Exception as e:
+            logger.debug(f"探测 {self.url} 失败: {e!r}")
+            return False
+
+
+def default_urls(base_url: str) -> List[str]:
+    """配置地址在前，其后是常见备用地址"""
+    return [base_url] + [u for u in ALTERNATIVE_URLS if u != base_url]
+
+
+class OllamaPool:
+    """
+    Ollama 节点池
+
+    每次调用在熔断器放行的节点中选择预计等待代价最小的节点
+    （进行中请求数 × 平均延迟，代价相同时有延迟数据的优先，再按配置顺序）；
+    所有节点都被熔断时抛出 LLMUnavailableError。
+    """
+
+    def __init__(self, urls: List[str], alternatives: Iterable[str] = ()):
+        """
+        Args:
+            urls: 节点地址（按优先顺序）
+            alternatives: 其中属于猜测的备用地址，启动发现后不可达的会被移出节点池
+        """
+        self.endpoints: List[OllamaEndpoint] = [OllamaEndpoint(url) for url in urls]
+        self.alternatives = set(alternatives)
+        self.stats = {"failovers": 0, "unavailable": 0}
+
+    async def probe_all(self) -> List[OllamaEndpoint]:
+        """
+        并发探测全部节点并更新熔断状态
+
+        探测失败的节点熔断（已熔断的重新计时，仍然宕机的节点不会到时进入 half_open，
+        让真实请求去试探）；已熔断的节点探测成功后进入 half_open，由下一次真实调用决定是否恢复。
+
+        Returns:
+            探测成功的节点（按优先顺序）
+        """
+        results = await asyncio.gather(*[ep.probe() for ep in self.endpoints])
+        alive = []
+        for endpoint, ok in zip(self.endpoints, results):
+            if ok:
+                endpoint.breaker.half_open()
+                alive.append(endpoint)
+            else:
+                if endpoint.breaker.state != OPEN:
+                    logger.warning(f"Ollama节点健康探测失败，熔断: {endpoint.url}")
+                endpoint.breaker.trip()
+        return alive
+
+    def drop_unreachable(self) -> None:
+        """移除探测失败的备用地址（启动发现后调用）；配置的地址始终保留"""
+        dropped = [
+            ep for ep in self.endpoints
+            if ep.url in self.alternatives and ep.breaker.state == OPEN
+        ]
+        if dropped:
+            self.endpoints = [ep for ep in self.endpoints if ep not in dropped]
+            logger.info(f"移除不可达的备用地址: {[ep.url for ep in dropped]}")
+
+    def available(self) -> bool:
+        """是否有未熔断的节点（不占用 half_open 试探名额）"""
+        return any(not ep.breaker.rejecting() for ep in self.endpoints)
+
+    def acquire(self, exclude: Tuple[OllamaEndpoint, ...] = ()) -> OllamaEndpoint:
+        """选择一个可用节点，exclude 中的节点跳过（用于故障切换）"""
+        known = [ep.latency_ewma for ep in self.endpoints if ep.latency_ewma is not None]
+        # 还没有延迟数据的节点按已知最慢节点估计，代价相同时排在有数据的节点之后：
+        # 新节点在已知节点繁忙时分到流量，但不会抢在已知节点之前
+        default_latency = max(known) if known else 1.0
+        candidates = sorted(
+            (ep for ep in self.endpoints if ep not in exclude and not ep.breaker.rejecting()),
+            key=lambda ep: (ep.load_score(default_latency), ep.latency_ewma is None),
+        )
+        for endpoint in candidates:
+            if endpoint.breaker.allow():
+                if exclude:
+                    self.stats["failovers"] += 1
+                return endpoint
+        self.stats["unavailable"] += 1
+        raise LLMUnavailableError("所有Ollama节点均已熔断")
+
+    def primary(self) -> Optional[OllamaEndpoint]:
+        """当前优先使用的节点"""
+        for endpoint in self.endpoints:
+            if endpoint.breaker.state == CLOSED:
+                return endpoint
+        return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "endpoints": {
+                ep.url: {
+                    **ep.breaker.get_stats(),
+                    "in_flight": ep.in_flight,
+                    "latency_ewma": round(ep.latency_ewma, 3) if ep.latency_ewma is not None else None,
+                }
+                for ep in self.endpoints
+            },
+        }
@@ -2,14 +2,35 @@
 Ollama服务 - 封装本地Ollama模型调用
 用于分析用户输入并生成商品筛选和排序建议
 """
-import ollama
-from typing import Dict, List, Optional, Any
-import json
+from contextlib import aclosing
+from typing import Dict, List, Optional, Any, AsyncIterator, Awaitable, Callable
+import asyncio
 import logging
+import time
+import httpx
+from pydantic import ValidationError
 from app.core.config import settings
+from app.schemas.analysis import AnalysisResult
+from app.services.llm_json import JsonObjectScanner, extract_json_text, loads_lenient
+from app.services.llm_cache import LLMCache, reasoning_signature, request_signature
+from app.services.rule_filters import compile_filters, is_structured_request
+from app.services.singleflight import SingleFlight
+from app.services.llm_scheduler import llm_scheduler, LLMOverloadedError, PRIORITY_LANES, PRIORITY_USER
+from app.services.prompt_builder import TokenUsage, build_analysis_prompt, build_reasoning_prompt
+from app.services.ollama_pool import OPEN, LLMUnavailableError, OllamaEndpoint
+from app.services.model_router import ModelRoute, ModelRouter
 
 logger = logging.getLogger(__name__)
 
+# 视为节点不可达、需要切换节点的错误
+CONNECT_ERRORS = (ConnectionError, httpx.ConnectError, httpx.ConnectTimeout)
+
+# 推荐理由提示词中包含的商品数
+REASONING_PRODUCTS = 5
+
+# 需求分析的结构化输出约束
+ANALYSIS_SCHEMA = AnalysisResult.model_json_schema()
+
 
 class OllamaService:
     """Ollama服务类，用于调用本地Ollama模型"""
@@ -25,49 +46,354 @@ class OllamaService:
         self.model_name = model_name or settings.OLLAMA_MODEL_NAME
         self.base_url = base_url or settings.OLLAMA_BASE_URL
         self.enabled = settings.OLLAMA_ENABLED
-        self.client = None
+        # 模型路由：需求分析 / 推荐理由各自的模型和节点池，每个节点带熔断器
+        self.router = ModelRouter(self.base_url, self.model_name)
+        # 连接状态：disabled / connecting / warming / ready / unavailable
+        self.state = "connecting" if self.enabled else "disabled"
+        self._ready = asyncio.Event()
+        self._connect_task: Optional[asyncio.Task] = None
+        self.stats = {"rule_fast_path": 0, "llm_analysis_calls": 0, "not_ready_fallbacks": 0, "breaker_fast_fails": 0}
+        # 需求分析响应的解析结果：直接合法 / 本地修复后合法 / 失败 / 合法但没有筛选条件
+        self.parse_stats = {"valid": 0, "repaired": 0, "failed": 0, "empty_filters": 0}
+        # 需求分析流式生成：JSON完整后提前中止的次数与节省的token数（按 num_predict 上限估算）
+        self.stream_stats = {"tokens_generated": 0, "early_stops": 0, "ran_to_end": 0, "tokens_saved": 0}
+        # 各调用类型的提示词规模、token数与耗时
+        self.usage = TokenUsage()
+        # 需求分析结果缓存（键为规范化后的请求签名）
+        self.analysis_cache = LLMCache(
+            namespace="llm:analysis",
+            ttl=settings.ANALYSIS_CACHE_TTL,
+            local_size=settings.ANALYSIS_CACHE_LOCAL_SIZE,
+        )
+        self.analysis_flight = SingleFlight("analysis")
+        # 推荐理由缓存（键为提示词中的商品内容 + 请求字段）
+        self.reasoning_cache = LLMCache(
+            namespace="llm:reasoning",
+            ttl=settings.REASONING_CACHE_TTL,
+            local_size=settings.REASONING_CACHE_LOCAL_SIZE,
+        )
+        self.reasoning_flight = SingleFlight("reasoning")
         
-        if self.enabled:
-            # 尝试连接Ollama服务，如果配置的地址失败，尝试其他常见地址
-            success = self._try_connect_ollama(self.base_url)
-            
-            # 如果配置的地址失败，尝试其他地址（适用于Docker环境）
-            if not success:
-                alternative_urls = [
-                    "http://ollama:11434",  # Docker Compose 服务名（优先）
-                    "http://host.docker.internal:11434",  # Docker Desktop / Docker 20.10+
-                    "http://172.17.0.1:11434",  # Docker默认网关（Linux）
-                    "http://localhost:11434",  # 本地运行
-                ]
-                
-                for alt_url in alternative_urls:
-                    if alt_url != self.base_url:
-                        logger.info(f"尝试备用地址: {alt_url}")
-                        if self._try_connect_ollama(alt_url):
-                            self.base_url = alt_url
-                            logger.info(f"使用备用地址连接成功: {alt_url}")
-                            break
-                
-                if not self.client:
-                    logger.warning("所有Ollama连接尝试均失败，将使用回退逻辑")
-                    self.enabled = False
-        else:
+        if not self.enabled:
             logger.info("Ollama服务已禁用")
     
-    def _try_connect_ollama(self, url: str) -> bool:
-        """尝试连接Ollama服务"""
-        try:
-            self.client = ollama.Client(host=url)
-            # 测试连接
-            self.client.list()
-            logger.info(f"Ollama服务已连接: {url}, 模型: {self.model_name}")
-            return True
-        except Exception as e:
-            logger.debug(f"连接 {url} 失败: {e}")
-            self.client = None
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+    
+    def start(self) -> None:
+        """在后台启动连接发现和模型预热，不阻塞应用启动"""
+        if self.enabled and self._connect_task is None:
+            self._connect_task = asyncio.create_task(self._connect_loop())
+    
+    async def stop(self) -> None:
+        """停止后台连接任务"""
+        if self._connect_task is not None:
+            self._connect_task.cancel()
+            await asyncio.gather(self._connect_task, return_exceptions=True)
+            self._connect_task = None
+    
+    async def _connect_loop(self) -> None:
+        """后台任务：连接失败时按间隔重试，连接成功后预热模型并持续健康探测"""
+        # 重试期间保持 unavailable，请求直接回退而不是等待
+        while True:
+            if await self._discover():
+                break
+            self.state = "unavailable"
+            logger.warning(
+                f"所有Ollama连接尝试均失败，将使用回退逻辑，"
+                f"{settings.OLLAMA_RECONNECT_INTERVAL}秒后重试"
+            )
+            await asyncio.sleep(settings.OLLAMA_RECONNECT_INTERVAL)
+        
+        self.state = "warming"
+        await self._warm_up()
+        self.state = "ready"
+        self._ready.set()
+        
+        # 健康探测：宕机节点提前熔断，恢复的节点进入 half_open 等待试探
+        while True:
+            await asyncio.sleep(settings.OLLAMA_HEALTH_INTERVAL)
+            await self._probe_pools()
+            primary = self.router.default_pool.primary()
+            if primary is not None and primary.url != self.base_url:
+                logger.info(f"Ollama主节点切换: {self.base_url} -> {primary.url}")
+                self.base_url = primary.url
+    
+    async def _probe_pools(self) -> List[OllamaEndpoint]:
+        """并发探测所有节点池，返回探测成功的节点"""
+        results = await asyncio.gather(*[pool.probe_all() for pool in self.router.pools()])
+        return [endpoint for alive in results for endpoint in alive]
+    
+    async def _discover(self) -> bool:
+        """并发探测所有路由的节点（默认池为配置地址和常见备用地址）"""
+        alive = await self._probe_pools()
+        if not alive:
             return False
+        # 备用地址只是猜测，不可达的不再保留：否则每到熔断恢复时间都会让真实请求去试探
+        for pool in self.router.pools():
+            pool.drop_unreachable()
+        primary = self.router.default_pool.primary()
+        if primary is not None and primary.url != self.base_url:
+            logger.info(f"使用备用地址连接成功: {primary.url}")
+            self.base_url = primary.url
+        logger.info(f"Ollama服务已连接, 可用节点: {[ep.url for ep in alive]}")
+        return True
+    
+    async def _warm_up(self) -> None:
+        """空提示词生成会把模型加载进内存，keep_alive 让模型常驻，避免首个请求承担加载耗时"""
+        for model, pools in self.router.models().items():
+            for endpoint in {ep for pool in pools for ep in pool.endpoints}:
+                if endpoint.breaker.state == OPEN:
+                    continue
+                try:
+                    await asyncio.wait_for(
+                        endpoint.client.generate(
+                            model=model,
+                            prompt="",
+                            keep_alive=settings.OLLAMA_KEEP_ALIVE,
+                        ),
+                        timeout=settings.OLLAMA_WARMUP_TIMEOUT,
+                    )
+                    logger.info(f"模型预热完成: {model} @ {endpoint.url}")
+                except Exception as e:
+                    # 预热失败不影响可用性，首个请求会自行加载模型
+                    logger.warning(f"模型预热失败 {model} @ {endpoint.url}: {e!r}")
+    
+    async def wait_until_ready(self) -> bool:
+        """
+        等待连接就绪
+        
+        连接或预热进行中时最多等待 OLLAMA_READY_WAIT 秒；
+        未启用、连接失败或等待超时时返回 False，调用方走回退逻辑。
+        """
+        if self.ready:
+            return True
+        if self.state in ("connecting", "warming"):
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout=settings.OLLAMA_READY_WAIT)
+                return True
+            except asyncio.TimeoutError:
+                pass
+        if self.enabled:
+            self.stats["not_ready_fallbacks"] += 1
+        return False
+    
+    async def _generate_stream(
+        self,
+        prompt: str,
+        options: Dict[str, Any],
+        timeout: float,
+        priority: int = PRIORITY_USER,
+        format: Optional[Dict[str, Any]] = None,
+        call_type: str = "analysis"
+    ) -> AsyncIterator[str]:
+        """
+        流式调用模型生成，逐段返回文本（生成期间占用调度器槽位）
+        
+        调用方提前停止迭代时应关闭生成器（aclosing），以便立即释放槽位并中止生成。
+        
+        Args:
+            prompt: 提示词
+            options: 模型参数
+            timeout: 整个生成过程的超时时间（秒）
+            priority: 调度优先级
+            format: 结构化输出的JSON Schema
+            call_type: 调用类型（analysis / reasoning），决定模型路由并用于token统计
+        """
+        self._check_available(call_type)
+        async with llm_scheduler.slot(priority):
+            async with aclosing(
+                self._generate_stream_unscheduled(prompt, options, timeout, format, call_type)
+            ) as stream:
+                async for text in stream:
+                    yield text
+    
+    async def _generate_stream_unscheduled(
+        self,
+        prompt: str,
+        options: Dict[str, Any],
+        timeout: float,
+        format: Optional[Dict[str, Any]] = None,
+        call_type: str = "analysis"
+    ) -> AsyncIterator[str]:
+        """
+        流式调用模型生成（不经过调度器）
+        
+        首段输出之前的连接失败会切换到下一个节点；熔断器按首段延迟判断慢调用。
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        route = self.router.route(call_type)
+        self.usage.record_prompt(call_type, prompt)
+        tried: List[OllamaEndpoint] = []
+        while True:
+            endpoint = route.pool.acquire(exclude=tuple(tried))
+            endpoint.begin()
+            started = loop.time()
+            iterator = None
+            # 拿到首段后节点计数交给下面的读取循环结算，之前的任何退出都在 finally 中结算
+            streaming = False
+            latency = None
+            try:
+                stream = await asyncio.wait_for(
+                    endpoint.client.generate(
+                        model=route.model,
+                        prompt=prompt,
+                        options=options,
+                        format=format,
+                        stream=True,
+                        keep_alive=settings.OLLAMA_KEEP_ALIVE,
+                    ),
+                    timeout=deadline - loop.time(),
+                )
+                iterator = stream.__aiter__()
+                first = await asyncio.wait_for(iterator.__anext__(), timeout=deadline - loop.time())
+                streaming = True
+            except StopAsyncIteration:
+                latency = loop.time() - started
+                self._record_success(route, endpoint, latency)
+                return
+            except asyncio.CancelledError:
+                endpoint.breaker.release_trial()
+                raise
+            except CONNECT_ERRORS as e:
+                self._record_failure(route, endpoint)
+                tried.append(endpoint)
+                logger.warning(f"Ollama节点连接失败，切换节点: {endpoint.url}: {e!r}")
+                continue
+            except Exception:
+                self._record_failure(route, endpoint)
+                raise
+            finally:
+                if not streaming:
+                    endpoint.end(latency)
+            first_token = loop.time() - started
+            self._record_success(route, endpoint, first_token)
+            self.usage.record_first_token(call_type, first_token)
+            break
+        
+        try:
+            chunk = first
+            while True:
+                text = chunk.get("response", "")
+                if text:
+                    yield text
+                if chunk.get("done"):
+                    self.usage.record_response(call_type, chunk)
+                    break
+                try:
+                    chunk = await asyncio.wait_for(iterator.__anext__(), timeout=deadline - loop.time())
+                except StopAsyncIteration:
+                    break
+        except (asyncio.TimeoutError, *CONNECT_ERRORS):
+            endpoint.breaker.record_failure()
+            raise
+        finally:
+            endpoint.end(first_token)
+            # 提前结束或超时时关闭底层HTTP流，让Ollama停止生成
+            aclose = getattr(iterator, "aclose", None)
+            if aclose is not None:
+                await aclose()
+    
+    def _check_available(self, call_type: str) -> None:
+        """该调用类型的所有节点都已熔断时立即失败，不进入调度队列"""
+        if not self.router.route(call_type).pool.available():
+            self.stats["breaker_fast_fails"] += 1
+            raise LLMUnavailableError("所有Ollama节点均已熔断")
+    
+    def _record_success(self, route: ModelRoute, endpoint: OllamaEndpoint, latency: float) -> None:
+        endpoint.breaker.record_success(latency)
+        self.router.record(route.model, latency, ok=True)
+    
+    def _record_failure(self, route: ModelRoute, endpoint: OllamaEndpoint) -> None:
+        endpoint.breaker.record_failure()
+        self.router.record(route.model, 0.0, ok=False)
+    
+    async def _call_with_failover(
+        self,
+        route: ModelRoute,
+        call: Callable[[Any, str], Awaitable[Any]],
+        timeout: float
+    ) -> Any:
+        """
+        在路由节点池中负载最低的可用节点上执行一次调用，记录熔断器和延迟统计
+        
+        连接失败时切换到下一个未熔断的节点；超时和其他错误直接抛出。
+        所有节点共用同一个截止时间，切换节点不会重新计时。
+        
+        Args:
+            route: 模型路由
+            call: 以 (客户端, 模型名) 发起调用的函数
+            timeout: 整个调用（含切换节点）的超时时间（秒）
+        """
+        deadline = time.monotonic() + timeout
+        tried: List[OllamaEndpoint] = []
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            endpoint = route.pool.acquire(exclude=tuple(tried))
+            endpoint.begin()
+            started = time.monotonic()
+            latency = None
+            try:
+                result = await asyncio.wait_for(call(endpoint.client, route.model), timeout=remaining)
+                latency = time.monotonic() - started
+            except asyncio.CancelledError:
+                endpoint.breaker.release_trial()
+                raise
+            except CONNECT_ERRORS as e:
+                self._record_failure(route, endpoint)
+                tried.append(endpoint)
+                logger.warning(f"Ollama节点连接失败，切换节点: {endpoint.url}: {e!r}")
+                continue
+            except Exception:
+                self._record_failure(route, endpoint)
+                raise
+            finally:
+                endpoint.end(latency)
+            self._record_success(route, endpoint, latency)
+            return result
+    
+    async def _generate(
+        self,
+        prompt: str,
+        options: Dict[str, Any],
+        timeout: float,
+        priority: int = PRIORITY_USER,
+        format: Optional[Dict[str, Any]] = None,
+        call_type: str = "reasoning"
+    ) -> Dict[str, Any]:
+        """
+        异步调用模型生成，不阻塞事件循环
+        
+        Args:
+            prompt: 提示词
+            options: 模型参数
+            timeout: 本次调用的超时时间（秒，不含排队时间）
+            priority: 调度优先级
+            format: 结构化输出的JSON Schema，模型只会生成符合该结构的JSON
+            call_type: 调用类型（analysis / reasoning），决定模型路由并用于token统计
+        """
+        self._check_available(call_type)
+        self.usage.record_prompt(call_type, prompt)
+        async with llm_scheduler.slot(priority):
+            response = await self._call_with_failover(
+                self.router.route(call_type),
+                lambda client, model: client.generate(
+                    model=model,
+                    prompt=prompt,
+                    options=options,
+                    format=format,
+                    keep_alive=settings.OLLAMA_KEEP_ALIVE,
+                ),
+                timeout=timeout,
+            )
+        self.usage.record_response(call_type, response)
+        return response
     
-    def analyze_user_request(
+    async def analyze_user_request(
         self, 
         recipient_type: Optional[str] = None,
         age_range: Optional[str] = None,
@@ -80,14 +406,50 @@ class OllamaService:
         mbti: Optional[str] = None,
         zodiac: Optional[str] = None,
         interests: Optional[List[str]] = None,
-        user_query: Optional[str] = None
+        user_query: Optional[str] = None,
+        priority: int = PRIORITY_USER
     ) -> Dict[str, Any]:
         """
         分析用户请求，生成商品筛选和排序建议
         
+        Args:
+            priority: LLM调度优先级
+        
         Returns:
             包含筛选条件和排序建议的字典
+        
+        Raises:
+            LLMOverloadedError: LLM排队超时，调用方应降级为规则推荐
         """
+        request_fields = {
+            "recipient_type": recipient_type,
+            "age_range": age_range,
+            "gender": gender,
+            "relationship": relationship,
+            "occasion": occasion,
+            "budget_min": budget_min,
+            "budget_max": budget_max,
+            "style": style,
+            "mbti": mbti,
+            "zodiac": zodiac,
+            "interests": interests,
+            "user_query": user_query,
+        }
+        
+        # 纯表单请求直接用规则编译筛选条件，不调用LLM
+        if is_structured_request(request_fields):
+            self.stats["rule_fast_path"] += 1
+            return compile_filters(request_fields)
+        
+        # 缓存命中不需要模型，先于等待模型就绪，预热期间也能直接返回
+        cache_key = request_signature(request_fields)
+        cached = await self.analysis_cache.get(cache_key)
+        if cached is not None:
+            return self._apply_exact_budget(cached, budget_min, budget_max)
+        
+        if not await self.wait_until_ready():
+            return self._get_default_filters(budget_min, budget_max, style)
+        
         # 构建用户输入描述
         user_input = self._build_user_input_description(
             recipient_type, age_range, gender, relationship, occasion,
@@ -97,35 +459,79 @@ class OllamaService:
         # 构建提示词
         prompt = self._build_analysis_prompt(user_input)
         
-        if not self.enabled or not self.client:
-            return self._get_default_filters(budget_min, budget_max, style)
-        
         try:
-            # 调用Ollama模型
-            response = self.client.generate(
-                model=self.model_name,
-                prompt=prompt,
-                options={
-                    "temperature": 0.3,  # 降低温度以获得更稳定的输出
-                    "top_p": 0.9,
-                }
+            # 相同请求的并发分析合并为一次模型调用；只在同一优先级内合并，
+            # 高优先级请求不会加入低优先级通道中排队的调用（缓存仍跨通道共享）
+            result = await self.analysis_flight.do(
+                f"{PRIORITY_LANES[priority]}:{cache_key}", lambda: self._run_analysis(prompt, cache_key, priority)
             )
+            return self._apply_exact_budget(result, budget_min, budget_max)
             
-            # 解析模型响应
-            result = self._parse_model_response(response.get("response", ""))
-            return result
-            
+        except LLMOverloadedError:
+            raise
         except Exception as e:
-            logger.error(f"Ollama模型调用失败: {e}")
+            logger.error(f"Ollama模型调用失败: {e!r}")
             # 返回默认的筛选条件
             return self._get_default_filters(
                 budget_min, budget_max, style
             )
     
-    def generate_recommendation_reasoning(
+    async def _run_analysis(self, prompt: str, cache_key: str, priority: int) -> Dict[str, Any]:
+        """
+        调用模型分析请求并写入缓存
+        
+        以流式方式读取输出，JSON对象一完整就中止生成，省去模型在对象之后追加的说明文字。
+        """
+        self.stats["llm_analysis_calls"] += 1
+        scanner = JsonObjectScanner()
+        tokens = 0
+        completed = None
+        async with aclosing(self._generate_stream(
+            prompt,
+            options={
+                "temperature": 0.3,  # 降低温度以获得更稳定的输出
+                "top_p": 0.9,
+                "num_predict": settings.OLLAMA_ANALYSIS_NUM_PREDICT,
+            },
+            timeout=settings.OLLAMA_ANALYSIS_TIMEOUT,
+            priority=priority,
+            format=ANALYSIS_SCHEMA,
+            call_type="analysis",
+        )) as stream:
+            async for text in stream:
+                # 流式输出每段对应一个token
+                tokens += 1
+                completed = scanner.feed(text)
+                if completed is not None:
+                    break
+        self._record_stream_tokens(tokens, early_stop=completed is not None)
+        
+        # 解析模型响应
+        result = self._parse_model_response(completed or scanner.text)
+        # 只缓存解析出有效筛选条件的结果
+        if result.get("filters"):
+            await self.analysis_cache.set(cache_key, result)
+        return result
+    
+    def _record_stream_tokens(self, tokens: int, early_stop: bool) -> None:
+        """
+        记录需求分析的流式token数
+        
+        提前中止时，未生成的部分最多为 num_predict 上限减去已生成数，计入 tokens_saved。
+        """
+        stats = self.stream_stats
+        stats["tokens_generated"] += tokens
+        if early_stop and tokens < settings.OLLAMA_ANALYSIS_NUM_PREDICT:
+            stats["early_stops"] += 1
+            stats["tokens_saved"] += settings.OLLAMA_ANALYSIS_NUM_PREDICT - tokens
+        elif not early_stop:
+            stats["ran_to_end"] += 1
+    
+    async def generate_recommendation_reasoning(
         self,
         products: List[Dict[str, Any]],
-        user_request: Dict[str, Any]
+        user_request: Dict[str, Any],
+        priority: int = PRIORITY_USER
     ) -> str:
         """
         为推荐的商品生成推荐理由
@@ -133,33 +539,122 @@ class OllamaService:
         Args:
             products: 推荐的商品列表
             user_request: 用户请求信息
+            priority: LLM调度优先级
             
         Returns:
             推荐理由文本
+        
+        Raises:
+            LLMOverloadedError: LLM排队超时，调用方应降级为规则推荐
         """
-        # 构建提示词
-        prompt = self._build_reasoning_prompt(products, user_request)
+        cache_key = self._reasoning_cache_key(products, user_request)
+        cached = await self.reasoning_cache.get(cache_key)
+        if cached is not None:
+            return cached
         
-        if not self.enabled or not self.client:
+        if not await self.wait_until_ready():
             return "根据您的筛选条件，为您推荐了以下商品。"
         
         try:
-            response = self.client.generate(
-                model=self.model_name,
-                prompt=prompt,
-                options={
-                    "temperature": 0.7,  # 稍高温度以获得更自然的文本
-                    "top_p": 0.9,
-                }
+            # 相同商品和请求的并发生成合并为一次模型调用，避免缓存失效时的集中重算；
+            # 与需求分析一样只在同一优先级内合并
+            reasoning = await self.reasoning_flight.do(
+                f"{PRIORITY_LANES[priority]}:{cache_key}", lambda: self._run_reasoning(products, user_request, cache_key, priority)
             )
-            
-            reasoning = response.get("response", "").strip()
             return reasoning if reasoning else "根据您的需求，为您推荐了以下商品。"
             
+        except LLMOverloadedError:
+            raise
         except Exception as e:
-            logger.error(f"生成推荐理由失败: {e}")
+            logger.error(f"生成推荐理由失败: {e!r}")
             return "根据您的筛选条件，为您推荐了以下商品。"
     
+    async def _run_reasoning(
+        self,
+        products: List[Dict[str, Any]],
+        user_request: Dict[str, Any],
+        cache_key: str,
+        priority: int
+    ) -> str:
+        """调用模型生成推荐理由并写入缓存"""
+        prompt = self._build_reasoning_prompt(products, user_request)
+        response = await self._generate(
+            prompt,
+            options={
+                "temperature": 0.7,  # 稍高温度以获得更自然的文本
+                "top_p": 0.9,
+                "num_predict": settings.OLLAMA_REASONING_NUM_PREDICT,
+            },
+            timeout=settings.OLLAMA_REASONING_TIMEOUT,
+            priority=priority,
+            call_type="reasoning",
+        )
+        reasoning = response.get("response", "").strip()
+        if reasoning:
+            await self.reasoning_cache.set(cache_key, reasoning)
+        return reasoning
+    
+    def _reasoning_cache_key(self, products: List[Dict[str, Any]], user_request: Dict[str, Any]) -> str:
+        """推荐理由缓存键：提示词中的商品 + 请求字段 + 生成模型"""
+        return reasoning_signature(
+            products[:REASONING_PRODUCTS], user_request, self.router.route("reasoning").model
+        )
+    
+    async def stream_recommendation_reasoning(
+        self,
+        products: List[Dict[str, Any]],
+        user_request: Dict[str, Any],
+        priority: int = PRIORITY_USER
+    ) -> AsyncIterator[str]:
+        """
+        流式生成推荐理由，模型每输出一段文本即返回一段
+        
+        命中缓存时一次性返回；完整生成的理由写入缓存。
+        
+        Args:
+            products: 推荐的商品列表
+            user_request: 用户请求信息
+            priority: LLM调度优先级（排队超时时返回默认理由）
+        """
+        cache_key = self._reasoning_cache_key(products, user_request)
+        cached = await self.reasoning_cache.get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+        
+        prompt = self._build_reasoning_prompt(products, user_request)
+        
+        if not await self.wait_until_ready():
+            yield "根据您的筛选条件，为您推荐了以下商品。"
+            return
+        
+        parts: List[str] = []
+        try:
+            # 客户端断开时本生成器被关闭，aclosing 立即关闭内层生成，释放调度槽位和节点并中止上游生成
+            async with aclosing(self._generate_stream(
+                prompt,
+                options={
+                    "temperature": 0.7,
+                    "top_p": 0.9,
+                    "num_predict": settings.OLLAMA_REASONING_NUM_PREDICT,
+                },
+                timeout=settings.OLLAMA_REASONING_TIMEOUT,
+                priority=priority,
+                call_type="reasoning",
+            )) as stream:
+                async for text in stream:
+                    parts.append(text)
+                    yield text
+        except Exception as e:
+            logger.error(f"流式生成推荐理由失败: {e!r}")
+        else:
+            reasoning = "".join(parts).strip()
+            if reasoning:
+                await self.reasoning_cache.set(cache_key, reasoning)
+        
+        if not parts:
+            yield "根据您的需求，为您推荐了以下商品。"
+    
     def _build_user_input_description(
         self,
         recipient_type: Optional[str],
@@ -218,52 +713,11 @@ class OllamaService:
         return "；".join(parts) if parts else "通用礼品推荐"
     
     def _build_analysis_prompt(self, user_input: str) -> str:
-        """构建分析提示词"""
-        return f"""你是一个专业的礼品推荐AI助手。请根据用户的以下需求，分析并返回JSON格式的商品筛选和排序建议。
-
-用户需求：
-{user_input}
-
-请分析用户需求，并返回一个JSON对象，包含以下字段：
-1. "filters": 筛选条件对象
-   - "price_min": 最低价格（数字，可选）
-   - "price_max": 最高价格（数字，可选）
-   - "suitable_gender": 适用性别（"male", "female", "unisex"或null）
-   - "suitable_age_range": 适用年龄段（字符串，如"18-25", "25-35", "35+"或null）
-   - "style": 风格（"实用型", "创意型", "浪漫型"等或null）
-   - "tags": 标签列表（字符串数组，如["实用", "创意", "浪漫"]或null）
-   - "suitable_scenes": 适用场景列表（字符串数组，如["生日", "情人节"]或null）
-   - "category_keywords": 分类关键词列表（字符串数组，用于匹配商品分类，如["电子产品", "首饰"]或null）
-
-2. "sort_by": 排序方式（"price_asc", "price_desc", "rating_desc", "sales_desc"或"relevance"）
-3. "reasoning": 简要说明筛选逻辑（字符串）
-
-只返回JSON对象，不要包含其他文字说明。JSON格式示例：
-{{
-  "filters": {{
-    "price_min": 100,
-    "price_max": 500,
-    "suitable_gender": "female",
-    "style": "浪漫型",
-    "tags": ["浪漫", "精致"],
-    "suitable_scenes": ["情人节", "纪念日"]
-  }},
-  "sort_by": "relevance",
-  "reasoning": "根据用户需求，推荐适合女性的浪漫型礼品，价格在100-500元之间"
-}}
-"""
+        """构建分析提示词（固定前缀在前，便于Ollama复用KV缓存）"""
+        return build_analysis_prompt(user_input, settings.OLLAMA_ANALYSIS_PROMPT_BUDGET)
     
     def _build_reasoning_prompt(self, products: List[Dict[str, Any]], user_request: Dict[str, Any]) -> str:
-        """构建推荐理由生成提示词"""
-        products_summary = []
-        for i, product in enumerate(products[:5], 1):  # 只取前5个商品
-            products_summary.append(
-                f"{i}. {product.get('name', '')} - "
-                f"价格: {product.get('price', 0)}元, "
-                f"风格: {product.get('style', '')}, "
-                f"描述: {product.get('description', '')[:50]}"
-            )
-        
+        """构建推荐理由生成提示词，商品信息按token预算截断"""
         user_input = self._build_user_input_description(
             user_request.get('recipient_type'),
             user_request.get('age_range'),
@@ -279,52 +733,73 @@ class OllamaService:
             user_request.get('user_query')
         )
         
-        return f"""你是一个专业的礼品推荐AI助手。请根据用户需求和推荐的商品，生成一段自然、友好的推荐理由（100-200字）。
-
-用户需求：
-{user_input}
-
-推荐的商品：
-{chr(10).join(products_summary)}
-
-请生成推荐理由，说明为什么这些商品适合用户的需求。语言要自然、友好，不要使用列表格式。
-"""
+        return build_reasoning_prompt(
+            user_input, products[:REASONING_PRODUCTS], settings.OLLAMA_REASONING_PROMPT_BUDGET
+        )
     
     def _parse_model_response(self, response_text: str) -> Dict[str, Any]:
-        """解析模型响应，提取JSON"""
+        """
+        解析模型响应并校验为 AnalysisResult
+        
+        结构化输出下通常可以直接解析；不合法时在本地修复一次，不重新调用模型。
+        修复后仍无法解析或结构不符时返回空筛选条件，并计入 failed。
+        """
+        data, repaired = loads_lenient(extract_json_text(response_text))
         try:
-            # 尝试提取JSON部分
-            response_text = response_text.strip()
-            
-            # 如果响应包含代码块，提取其中的JSON
-            if "```json" in response_text:
-                start = response_text.find("```json") + 7
-                end = response_text.find("```", start)
-                if end != -1:
-                    response_text = response_text[start:end].strip()
-            elif "```" in response_text:
-                start = response_text.find("```") + 3
-                end = response_text.find("```", start)
-                if end != -1:
-                    response_text = response_text[start:end].strip()
-            
-            # 尝试找到JSON对象
-            start_brace = response_text.find("{")
-            end_brace = response_text.rfind("}")
-            if start_brace != -1 and end_brace != -1:
-                response_text = response_text[start_brace:end_brace + 1]
-            
-            # 解析JSON
-            result = json.loads(response_text)
-            return result
-            
-        except json.JSONDecodeError as e:
+            if not isinstance(data, dict):
+                raise ValueError("响应不是JSON对象")
+            result = AnalysisResult.model_validate(data).to_dict()
+        except (ValueError, ValidationError) as e:
+            self.parse_stats["failed"] += 1
             logger.warning(f"解析模型响应失败: {e}, 响应内容: {response_text[:200]}")
-            return {
-                "filters": {},
-                "sort_by": "relevance",
-                "reasoning": "根据您的需求进行了商品筛选"
-            }
+            return AnalysisResult().to_dict()
+        
+        self.parse_stats["repaired" if repaired else "valid"] += 1
+        if not result["filters"]:
+            self.parse_stats["empty_filters"] += 1
+        result["source"] = "llm"
+        return result
+    
+    def _apply_exact_budget(
+        self,
+        analysis: Dict[str, Any],
+        budget_min: Optional[float],
+        budget_max: Optional[float]
+    ) -> Dict[str, Any]:
+        """缓存键对预算做了分桶，命中后用本次请求的精确预算覆盖价格区间"""
+        filters = dict(analysis.get("filters") or {})
+        if budget_min:
+            filters["price_min"] = budget_min
+        if budget_max:
+            filters["price_max"] = budget_max
+        return {**analysis, "filters": filters}
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """服务运行统计"""
+        return {
+            "enabled": self.enabled,
+            "state": self.state,
+            "base_url": self.base_url,
+            "model": self.model_name,
+            "router": self.router.get_stats(),
+            **self.stats,
+            "analysis_parse": self._parse_summary(),
+            "analysis_stream": self.stream_stats,
+            "token_usage": self.usage.get_stats(),
+            "analysis_cache": self.analysis_cache.get_stats(),
+            "analysis_flight": self.analysis_flight.get_stats(),
+            "reasoning_cache": self.reasoning_cache.get_stats(),
+            "reasoning_flight": self.reasoning_flight.get_stats(),
+        }
+    
+    def _parse_summary(self) -> Dict[str, Any]:
+        """解析统计；wasted_rate 为未产生可用筛选条件的模型调用占比"""
+        total = self.parse_stats["valid"] + self.parse_stats["repaired"] + self.parse_stats["failed"]
+        wasted = self.parse_stats["failed"] + self.parse_stats["empty_filters"]
+        return {
+            **self.parse_stats,
+            "wasted_rate": round(wasted / total, 4) if total else 0.0,
+        }
     
     def _get_default_filters(
         self,
@@ -345,7 +820,8 @@ class OllamaService:
         return {
             "filters": filters,
             "sort_by": "relevance",
-            "reasoning": "根据您的筛选条件进行了商品推荐"
+            "reasoning": "根据您的筛选条件进行了商品推荐",
+            "source": "default"
         }
 
 
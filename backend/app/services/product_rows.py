@@ -0,0 +1,69 @@
+"""
+商品快速读取 - 用 Core select() 直接取行映射，跳过 ORM 对象构建和逐行 Pydantic 校验
+列表类接口返回的行可以直接交给 orjson 序列化，并支持只取部分字段（稀疏字段集）
+"""
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import Select, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.product import Product
+from app.schemas.product import ProductResponse
+
+# 对外返回的商品字段，顺序与 ProductResponse 一致
+PRODUCT_FIELDS = tuple(ProductResponse.model_fields)
+
+_COLUMNS = {name: Product.__table__.c[name] for name in PRODUCT_FIELDS}
+
+
+def parse_fields(fields: Optional[str]) -> Sequence[str]:
+    """
+    解析逗号分隔的字段列表，如 "id,name,price"；为空时返回全部字段
+
+    id 总是返回（分页游标和前端渲染依赖它）。包含未知字段时抛出 ValueError。
+    """
+    if not fields:
+        return PRODUCT_FIELDS
+    requested = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = requested - _COLUMNS.keys()
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    requested.add("id")
+    return tuple(f for f in PRODUCT_FIELDS if f in requested)
+
+
+def select_products(fields: Sequence[str] = PRODUCT_FIELDS) -> Select:
+    """只选取指定列的查询"""
+    return select(*(_COLUMNS[f] for f in fields))
+
+
+async def fetch_rows(db: AsyncSession, query: Select) -> List[Dict[str, Any]]:
+    """执行查询，返回普通 dict 列表"""
+    result = await db.execute(query)
+    return [dict(row) for row in result.mappings()]
+
+
+async def fetch_rows_by_ids(
+    db: AsyncSession,
+    product_ids: Iterable[int],
+    fields: Sequence[str] = PRODUCT_FIELDS,
+) -> List[Dict[str, Any]]:
+    """按ID批量取商品行，并保持传入的顺序"""
+    product_ids = list(product_ids)
+    if not product_ids:
+        return []
+    rows = await fetch_rows(db, select_products(fields).where(Product.id.in_(product_ids)))
+    by_id = {row["id"]: row for row in rows}
+    return [by_id[pid] for pid in product_ids if pid in by_id]
+
+
+def to_models(rows: Iterable[Dict[str, Any]]) -> List[ProductResponse]:
+    """数据库行已经是正确的类型，构造响应模型时跳过校验"""
+    return [ProductResponse.model_construct(**row) for row in rows]
+
+
+def project(items: Iterable[Dict[str, Any]], fields: Sequence[str]) -> List[Dict[str, Any]]:
+    """按稀疏字段集裁剪已序列化的商品"""
+    if fields is PRODUCT_FIELDS:
+        return list(items)
+    return [{f: item.get(f) for f in fields} for item in items]
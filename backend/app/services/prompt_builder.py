@@ -0,0 +1,143 @@
+"""
+提示词构建 - 固定前缀 + 按token预算截断的动态部分
+静态指令放在最前面且逐字节不变，Ollama 可以复用上一次请求的KV缓存，只需计算后面的动态部分
+"""
+from typing import Any, Dict, List
+import re
+
+# 中日韩字符约1个token，其余字符约4个一个token（粗略估算，用于预算控制）
+_CJK = re.compile(r"[　-〿一-鿿＀-￯]")
+
+# 需求分析提示词的固定前缀（不要在这里插入任何随请求变化的内容）
+ANALYSIS_PREFIX = """你是专业的礼品推荐AI助手。根据用户需求，返回商品筛选和排序建议的JSON对象，字段：
+- filters: 筛选条件
+  - price_min / price_max: 价格区间（数字）
+  - suitable_gender: "male"、"female"、"unisex"
+  - suitable_age_range: 年龄段，如"18-25"、"25-35"、"35+"
+  - style: 风格，如"实用型"、"创意型"、"浪漫型"
+  - tags: 标签数组，如["实用","创意","浪漫"]
+  - suitable_scenes: 适用场景数组，如["生日","情人节"]
+  - category_keywords: 分类关键词数组，如["电子产品","首饰"]
+  无法确定的字段填 null
+- sort_by: "price_asc"、"price_desc"、"rating_desc"、"sales_desc"或"relevance"
+- reasoning: 一句话说明筛选逻辑
+只返回JSON对象，不要其他文字。示例：
+{"filters":{"price_min":100,"price_max":500,"suitable_gender":"female","style":"浪漫型","tags":["浪漫","精致"],"suitable_scenes":["情人节","纪念日"]},"sort_by":"relevance","reasoning":"适合女性的浪漫型礼品，价格100-500元"}
+
+用户需求：
+"""
+
+# 推荐理由提示词的固定前缀
+REASONING_PREFIX = """你是专业的礼品推荐AI助手。根据用户需求和推荐的商品，写一段自然、友好的推荐理由（100-200字），说明这些商品为什么适合用户，不要使用列表格式。
+
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    """估算文本的token数"""
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """把文本截断到约 budget 个token以内"""
+    if budget <= 0 or not text:
+        return ""
+    if estimate_tokens(text) <= budget:
+        return text
+    used = 0
+    for i, ch in enumerate(text):
+        used += 4 if _CJK.match(ch) else 1
+        if used > budget * 4:
+            return text[:i].rstrip() + "…"
+    return text
+
+
+def build_analysis_prompt(user_input: str, budget: int) -> str:
+    """需求分析提示词：固定前缀 + 用户需求"""
+    return ANALYSIS_PREFIX + truncate_to_tokens(user_input, budget) + "\n"
+
+
+def build_reasoning_prompt(user_input: str, products: List[Dict[str, Any]], budget: int) -> str:
+    """
+    推荐理由提示词：固定前缀 + 用户需求 + 商品摘要
+
+    用户需求优先保留，剩余预算平均分给各商品；每个商品先保证名称和价格，
+    描述截断到剩余份额内。
+    """
+    user_part = "用户需求：\n" + truncate_to_tokens(user_input, budget // 3) + "\n\n推荐的商品：\n"
+    remaining = budget - estimate_tokens(user_part)
+    lines = []
+    for i, product in enumerate(products, 1):
+        share = remaining // (len(products) - i + 1)
+        head = (
+            f"{i}. {truncate_to_tokens(product.get('name') or '', 40)} - "
+            f"价格: {product.get('price') or 0}元, 风格: {product.get('style') or ''}"
+        )
+        line = head
+        description_budget = share - estimate_tokens(head) - 4
+        if description_budget > 8 and product.get("description"):
+            line += f", 描述: {truncate_to_tokens(product['description'], description_budget)}"
+        lines.append(line)
+        remaining -= estimate_tokens(line)
+    return REASONING_PREFIX + user_part + "\n".join(lines) + "\n"
+
+
+class TokenUsage:
+    """按调用类型累计提示词规模、Ollama 返回的token数和各阶段耗时"""
+
+    def __init__(self):
+        self._by_type: Dict[str, Dict[str, float]] = {}
+
+    def _entry(self, call_type: str) -> Dict[str, float]:
+        return self._by_type.setdefault(call_type, {
+            "calls": 0,
+            "prompt_tokens_estimated": 0,
+            "reported": 0,  # 返回了完整统计的调用数（流式提前中止的调用没有）
+            "prompt_tokens": 0,
+            "eval_tokens": 0,
+            "prompt_eval_seconds": 0.0,
+            "eval_seconds": 0.0,
+            "load_seconds": 0.0,
+            "first_token_samples": 0,
+            "first_token_seconds": 0.0,
+        })
+
+    def record_prompt(self, call_type: str, prompt: str) -> None:
+        entry = self._entry(call_type)
+        entry["calls"] += 1
+        entry["prompt_tokens_estimated"] += estimate_tokens(prompt)
+
+    def record_first_token(self, call_type: str, seconds: float) -> None:
+        """流式调用的首段延迟，主要由提示词计算耗时决定"""
+        entry = self._entry(call_type)
+        entry["first_token_samples"] += 1
+        entry["first_token_seconds"] += seconds
+
+    def record_response(self, call_type: str, response: Any) -> None:
+        """记录 Ollama 最终响应中的 prompt_eval_count / eval_count 和耗时（纳秒）"""
+        if not response.get("done"):
+            return
+        entry = self._entry(call_type)
+        entry["reported"] += 1
+        entry["prompt_tokens"] += response.get("prompt_eval_count") or 0
+        entry["eval_tokens"] += response.get("eval_count") or 0
+        entry["prompt_eval_seconds"] += (response.get("prompt_eval_duration") or 0) / 1e9
+        entry["eval_seconds"] += (response.get("eval_duration") or 0) / 1e9
+        entry["load_seconds"] += (response.get("load_duration") or 0) / 1e9
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        stats = {}
+        for call_type, entry in self._by_type.items():
+            calls, reported, samples = entry["calls"], entry["reported"], entry["first_token_samples"]
+            stats[call_type] = {
+                **{k: round(v, 3) if isinstance(v, float) else v for k, v in entry.items()},
+                "avg_prompt_tokens_estimated": round(entry["prompt_tokens_estimated"] / calls, 1) if calls else 0.0,
+                "avg_prompt_tokens": round(entry["prompt_tokens"] / reported, 1) if reported else 0.0,
+                "avg_eval_tokens": round(entry["eval_tokens"] / reported, 1) if reported else 0.0,
+                "avg_prompt_eval_seconds": round(entry["prompt_eval_seconds"] / reported, 3) if reported else 0.0,
+                "avg_first_token_seconds": round(entry["first_token_seconds"] / samples, 3) if samples else 0.0,
+            }
+        return stats
@@ -0,0 +1,177 @@
+"""
+规则筛选编译器 - 将结构化表单字段确定性地转换为商品筛选条件
+纯表单请求（没有自然语言描述）无需调用LLM，毫秒级返回与AI分析相同结构的结果
+"""
+from typing import Any, Dict, List, Mapping, Optional
+
+# 性别取值 -> 商品 suitable_gender
+GENDER_MAP: Dict[str, str] = {
+    "男": "male",
+    "男性": "male",
+    "male": "male",
+    "女": "female",
+    "女性": "female",
+    "female": "female",
+    "中性": "unisex",
+    "unisex": "unisex",
+}
+
+# 表单年龄段 -> 商品 suitable_age_range（商品侧只有 "18-25", "25-35", "35+" 三档）
+AGE_RANGE_MAP: Dict[str, str] = {
+    "18-25": "18-25",
+    "26-35": "25-35",
+    "25-35": "25-35",
+    "36-45": "35+",
+    "46-60": "35+",
+    "60+": "35+",
+    "35+": "35+",
+}
+
+# 收礼人类型 -> 推断的性别/年龄段/标签/分类关键词
+RECIPIENT_RULES: Dict[str, Dict[str, Any]] = {
+    "男/女友": {"tags": ["浪漫", "精致"]},
+    "女朋友": {"gender": "female", "tags": ["浪漫", "精致"]},
+    "男朋友": {"gender": "male", "tags": ["浪漫", "实用"]},
+    "老婆": {"gender": "female", "tags": ["浪漫", "精致"]},
+    "老公": {"gender": "male", "tags": ["实用", "品质"]},
+    "父母": {"age_range": "35+", "tags": ["实用", "健康"]},
+    "妈妈": {"gender": "female", "age_range": "35+", "tags": ["实用", "健康"]},
+    "母亲": {"gender": "female", "age_range": "35+", "tags": ["实用", "健康"]},
+    "爸爸": {"gender": "male", "age_range": "35+", "tags": ["实用", "健康"]},
+    "父亲": {"gender": "male", "age_range": "35+", "tags": ["实用", "健康"]},
+    "长辈": {"age_range": "35+", "tags": ["实用", "健康"]},
+    "同事": {"tags": ["实用", "小众"]},
+    "朋友": {"tags": ["创意", "实用"]},
+    "闺蜜": {"gender": "female", "tags": ["创意", "精致"]},
+    "兄弟": {"gender": "male", "tags": ["实用", "创意"]},
+    "客户": {"tags": ["商务", "体面"], "category_keywords": ["食品饮料"]},
+    "领导": {"tags": ["商务", "体面"]},
+    "老师": {"tags": ["实用", "体面"]},
+    "孩子": {"tags": ["趣味", "益智"]},
+}
+
+# 场景 -> 适用场景/标签
+OCCASION_RULES: Dict[str, Dict[str, Any]] = {
+    "生日": {"scenes": ["生日"], "tags": []},
+    "纪念日": {"scenes": ["纪念日", "情人节"], "tags": ["浪漫"]},
+    "情人节": {"scenes": ["情人节", "纪念日"], "tags": ["浪漫"]},
+    "七夕": {"scenes": ["七夕", "情人节"], "tags": ["浪漫"]},
+    "节日": {"scenes": ["节日", "春节", "中秋节", "圣诞节"], "tags": []},
+    "春节": {"scenes": ["春节", "节日"], "tags": ["喜庆"]},
+    "中秋节": {"scenes": ["中秋节", "节日"], "tags": []},
+    "圣诞节": {"scenes": ["圣诞节", "节日"], "tags": ["创意"]},
+    "母亲节": {"scenes": ["母亲节"], "tags": ["实用"]},
+    "父亲节": {"scenes": ["父亲节"], "tags": ["实用"]},
+    "教师节": {"scenes": ["教师节"], "tags": []},
+    "毕业": {"scenes": ["毕业"], "tags": ["纪念", "实用"]},
+    "见家长": {"scenes": ["见家长"], "tags": ["体面"]},
+    "商务往来": {"scenes": ["商务"], "tags": ["商务", "体面"]},
+    "结婚": {"scenes": ["结婚", "婚礼"], "tags": ["喜庆"]},
+    "乔迁": {"scenes": ["乔迁"], "tags": ["实用"]},
+}
+
+# 风格偏好 -> 标签
+STYLE_TAGS: Dict[str, str] = {
+    "实用型": "实用",
+    "创意型": "创意",
+    "浪漫型": "浪漫",
+    "搞笑型": "搞笑",
+    "有仪式感": "仪式感",
+}
+
+
+def _dedupe(items: List[str]) -> List[str]:
+    """保持顺序去重"""
+    seen = set()
+    result = []
+    for item in items:
+        if item and item not in seen:
+            seen.add(item)
+            result.append(item)
+    return result
+
+
+def _lookup(table: Mapping[str, Any], value: Optional[str]) -> Optional[Any]:
+    """按去除空白后的原值、小写值依次查表"""
+    if not value:
+        return None
+    value = value.strip()
+    return table.get(value) or table.get(value.lower())
+
+
+def is_structured_request(request: Mapping[str, Any]) -> bool:
+    """请求是否只包含结构化字段（没有需要LLM理解的自由文本）"""
+    user_query = request.get("user_query")
+    if user_query and user_query.strip():
+        return False
+    if request.get("interests"):
+        return False
+    return True
+
+
+def compile_filters(request: Mapping[str, Any]) -> Dict[str, Any]:
+    """
+    将结构化请求字段编译为筛选条件
+
+    Args:
+        request: RecommendationRequest 字段组成的字典
+
+    Returns:
+        与 OllamaService.analyze_user_request 相同结构的字典
+    """
+    filters: Dict[str, Any] = {}
+    tags: List[str] = []
+    scenes: List[str] = []
+    category_keywords: List[str] = []
+    reasons: List[str] = []
+
+    recipient = _lookup(RECIPIENT_RULES, request.get("recipient_type")) or {}
+    occasion = _lookup(OCCASION_RULES, request.get("occasion")) or {}
+
+    budget_min = request.get("budget_min")
+    budget_max = request.get("budget_max")
+    if budget_min:
+        filters["price_min"] = budget_min
+    if budget_max:
+        filters["price_max"] = budget_max
+    if budget_min or budget_max:
+        reasons.append(f"价格在{budget_min or 0}-{budget_max or '不限'}元之间")
+
+    gender = _lookup(GENDER_MAP, request.get("gender")) or recipient.get("gender")
+    if gender:
+        filters["suitable_gender"] = gender
+        reasons.append({"male": "适合男性", "female": "适合女性", "unisex": "男女皆宜"}[gender])
+
+    age_range = _lookup(AGE_RANGE_MAP, request.get("age_range")) or recipient.get("age_range")
+    if age_range:
+        filters["suitable_age_range"] = age_range
+        reasons.append(f"适合{age_range}岁人群")
+
+    style = request.get("style")
+    if style:
+        filters["style"] = style.strip()
+        style_tag = _lookup(STYLE_TAGS, style)
+        if style_tag:
+            tags.append(style_tag)
+        reasons.append(f"{style.strip()}风格")
+
+    tags.extend(recipient.get("tags", []))
+    tags.extend(occasion.get("tags", []))
+    scenes.extend(occasion.get("scenes", []))
+    category_keywords.extend(recipient.get("category_keywords", []))
+
+    if tags:
+        filters["tags"] = _dedupe(tags)
+    if scenes:
+        filters["suitable_scenes"] = _dedupe(scenes)
+        reasons.append(f"适合{request.get('occasion').strip()}场景")
+    if category_keywords:
+        filters["category_keywords"] = _dedupe(category_keywords)
+
+    reasoning = "根据您的筛选条件推荐" + ("，".join(reasons) if reasons else "通用") + "的礼品"
+    return {
+        "filters": filters,
+        "sort_by": "relevance",
+        "reasoning": reasoning,
+        "source": "rules",
+    }
@@ -0,0 +1,420 @@
+"""
+商品全文搜索 - 进程内字符二元组倒排索引 + BM25 打分
+中文按相邻两字切分，英文/数字按整词切分；索引 name、brand、tags 和 description（截断）
+"""
+from array import array
+from bisect import bisect_left
+from html import escape
+from operator import itemgetter
+from datetime import timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+import asyncio
+import heapq
+import logging
+import math
+import re
+import threading
+import time
+import unicodedata
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.product import Product
+
+logger = logging.getLogger(__name__)
+
+# 中文连续段与英文/数字词
+_TOKEN = re.compile(r"[㐀-䶿一-鿿]+|[a-z0-9]+")
+_CJK = re.compile(r"[㐀-䶿一-鿿]")
+
+# 字段权重（BM25F 的简化：各字段词频按权重累加）
+FIELD_WEIGHTS = (("name", 3.0), ("brand", 2.0), ("tags", 2.0), ("description", 1.0))
+
+# 描述只索引前若干字，控制百万商品规模下的倒排表大小
+DESCRIPTION_INDEX_CHARS = 200
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# 文档频率不超过 max(SELECTIVE_MIN_DF, 总数 * SELECTIVE_DF_RATIO) 的词用于产生候选；
+# 更常见的词只给已有候选加分（二分查找倒排表），避免遍历几十万条倒排
+SELECTIVE_MIN_DF = 2000
+SELECTIVE_DF_RATIO = 0.02
+
+# 单字查询扩展为包含该字的二元组，最多取文档频率最高的这么多个
+SINGLE_CHAR_EXPANSION = 64
+
+# 描述高亮片段的长度（字符）
+SNIPPET_CHARS = 80
+
+# 墓碑槽位（已更新/删除的旧槽位）超过存活数的该比例时全量重建
+COMPACT_RATIO = 0.25
+
+_INDEX_COLUMNS = (
+    Product.id,
+    Product.name,
+    Product.brand,
+    Product.tags,
+    Product.description,
+    Product.category_id,
+    Product.platform,
+    Product.created_at,
+    Product.updated_at,
+)
+
+
+def _normalize(text: str) -> str:
+    return unicodedata.normalize("NFKC", text).lower()
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """切分为检索词：中文连续段切为二元组（单字段保留单字），英文/数字保留整词"""
+    if not text:
+        return []
+    tokens = []
+    for match in _TOKEN.finditer(_normalize(text)):
+        run = match.group()
+        if _CJK.match(run) and len(run) > 1:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def _field_text(row: Any, field: str) -> str:
+    value = getattr(row, field)
+    if field == "tags":
+        return " ".join(t for t in value if isinstance(t, str)) if isinstance(value, list) else ""
+    if field == "description" and value:
+        return value[:DESCRIPTION_INDEX_CHARS]
+    return value or ""
+
+
+class _SearchState:
+    """倒排表：词 -> 按槽位递增的槽位数组 + 对应的加权词频"""
+
+    def __init__(self):
+        self.ids = array("q")
+        self.slot_of: Dict[int, int] = {}
+        self.live = bytearray()
+        self.live_count = 0
+        self.doc_len = array("f")
+        self.total_len = 0.0
+        self.changed: Dict[int, Any] = {}
+        self.category = array("q")
+        self.platform: List[Optional[str]] = []
+        self.postings: Dict[str, array] = {}
+        self.freqs: Dict[str, array] = {}
+        # 单字 -> 包含该字的二元组，用于单字查询
+        self.char_terms: Dict[str, Set[str]] = {}
+
+    @property
+    def size(self) -> int:
+        return len(self.ids)
+
+    @property
+    def tombstones(self) -> int:
+        return self.size - self.live_count
+
+    def add(self, row: Any) -> bool:
+        """
+        追加商品；已存在时旧槽位标记为墓碑，新内容写入新槽位（倒排表保持递增）
+
+        Returns:
+            是否写入；商品ID和修改时间与已索引版本相同时跳过
+        """
+        changed_at = row.updated_at or row.created_at
+        if row.id in self.slot_of and changed_at is not None and self.changed.get(row.id) == changed_at:
+            return False  # 未修改（增量刷新的回看窗口会重复读到同一版本）
+        self.remove(row.id)
+        slot = self.size
+        weights: Dict[str, float] = {}
+        length = 0.0
+        for field, weight in FIELD_WEIGHTS:
+            for token in tokenize(_field_text(row, field)):
+                weights[token] = weights.get(token, 0.0) + weight
+                length += weight
+        for token, tf in weights.items():
+            postings = self.postings.get(token)
+            if postings is None:
+                postings = self.postings[token] = array("I")
+                self.freqs[token] = array("f")
+                if len(token) == 2 and _CJK.match(token):
+                    for ch in set(token):
+                        self.char_terms.setdefault(ch, set()).add(token)
+            postings.append(slot)
+            self.freqs[token].append(tf)
+        self.ids.append(row.id)
+        self.slot_of[row.id] = slot
+        self.changed[row.id] = changed_at
+        self.live.append(1)
+        self.live_count += 1
+        self.doc_len.append(length)
+        self.total_len += length
+        self.category.append(row.category_id if row.category_id is not None else -1)
+        self.platform.append(row.platform)
+        return True
+
+    def remove(self, product_id: int) -> None:
+        slot = self.slot_of.pop(product_id, None)
+        self.changed.pop(product_id, None)
+        if slot is not None and self.live[slot]:
+            self.live[slot] = 0
+            self.live_count -= 1
+            self.total_len -= self.doc_len[slot]
+
+    def expand(self, tokens: Iterable[str]) -> List[str]:
+        """单个汉字扩展为包含它的二元组（取文档频率最高的若干个）"""
+        terms: List[str] = []
+        for token in tokens:
+            if len(token) == 1 and _CJK.match(token):
+                related = sorted(
+                    self.char_terms.get(token, ()),
+                    key=lambda t: len(self.postings[t]),
+                    reverse=True,
+                )[:SINGLE_CHAR_EXPANSION]
+                terms.extend(related)
+            terms.append(token)
+        return list(dict.fromkeys(t for t in terms if t in self.postings))
+
+    def search(
+        self,
+        tokens: List[str],
+        limit: int,
+        category_id: Optional[int] = None,
+        platform: Optional[str] = None,
+    ) -> Tuple[List[Tuple[int, float]], int]:
+        """BM25 打分，返回（[(商品ID, 得分)], 命中数）"""
+        terms = self.expand(tokens)
+        if not terms or not self.live_count:
+            return [], 0
+        n = self.live_count
+        avg_len = self.total_len / n if self.total_len > 0 else 1.0
+        k1_fixed = BM25_K1 * (1 - BM25_B)
+        k1_scaled = BM25_K1 * BM25_B / avg_len
+        live, doc_len, category, platforms = self.live, self.doc_len, self.category, self.platform
+
+        def idf(term: str) -> float:
+            df = len(self.postings[term])
+            return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+        terms.sort(key=lambda t: len(self.postings[t]))
+        selective = max(SELECTIVE_MIN_DF, n * SELECTIVE_DF_RATIO)
+        generators = [t for t in terms if len(self.postings[t]) <= selective] or terms[:1]
+        scorers = terms[len(generators):]
+
+        scores: Dict[int, float] = {}
+        for term in generators:
+            weight = idf(term) * (BM25_K1 + 1)
+            for slot, tf in zip(self.postings[term], self.freqs[term]):
+                if not live[slot]:
+                    continue
+                if category_id is not None and category[slot] != category_id:
+                    continue
+                if platform and platforms[slot] != platform:
+                    continue
+                scores[slot] = scores.get(slot, 0.0) + weight * tf / (tf + k1_fixed + k1_scaled * doc_len[slot])
+
+        for term in scorers:
+            weight = idf(term) * (BM25_K1 + 1)
+            postings, freqs = self.postings[term], self.freqs[term]
+            for slot in scores:
+                i = bisect_left(postings, slot)
+                if i < len(postings) and postings[i] == slot:
+                    tf = freqs[i]
+                    scores[slot] += weight * tf / (tf + k1_fixed + k1_scaled * doc_len[slot])
+
+        top = heapq.nlargest(limit, scores.items(), key=itemgetter(1))
+        return [(self.ids[slot], score) for slot, score in top], len(scores)
+
+
+class ProductSearchIndex:
+    """
+    商品搜索索引
+
+    与分面索引相同的加载方式：启动时全量加载，之后按 updated_at/created_at 水位线增量刷新，
+    新建商品时直接 upsert。更新产生的墓碑过多时下一次刷新全量重建。
+    """
+
+    def __init__(self, refresh_overlap: float = 60):
+        """
+        Args:
+            refresh_overlap: 增量刷新回看水位线之前的秒数，覆盖提交较晚、时间戳早于水位线的商品
+        """
+        self.refresh_overlap = timedelta(seconds=refresh_overlap)
+        self.loaded = False
+        self.watermark = None
+        self._state = _SearchState()
+        self._lock = threading.RLock()
+        self.stats = {
+            "products": 0,
+            "terms": 0,
+            "load_seconds": 0.0,
+            "loaded_at": None,
+            "refreshed_at": None,
+            "searches": 0,
+            "search_seconds_total": 0.0,
+            "search_seconds_max": 0.0,
+        }
+
+    # ---- 加载与刷新 ----
+
+    def load(self, db: Session) -> None:
+        """全量加载，构建完成后原子替换"""
+        started = time.perf_counter()
+        state = _SearchState()
+        watermark = None
+        for row in db.query(*_INDEX_COLUMNS).yield_per(10000):
+            state.add(row)
+            changed_at = row.updated_at or row.created_at
+            if changed_at and (watermark is None or changed_at > watermark):
+                watermark = changed_at
+        with self._lock:
+            self._state = state
+            self.watermark = watermark
+            self.loaded = True
+        elapsed = time.perf_counter() - started
+        self.stats.update(
+            products=state.live_count, terms=len(state.postings),
+            load_seconds=round(elapsed, 3), loaded_at=time.time(),
+        )
+        logger.info(f"商品搜索索引加载完成: {state.live_count} 个商品, {len(state.postings)} 个词, 耗时 {elapsed:.2f}s")
+
+    def refresh(self, db: Session) -> int:
+        """增量刷新：读取水位线（减去回看窗口）之后新增或修改的商品，返回实际更新数量"""
+        state = self._state
+        if not self.loaded or state.tombstones > state.live_count * COMPACT_RATIO:
+            self.load(db)
+            return self.stats["products"]
+
+        query = db.query(*_INDEX_COLUMNS)
+        if self.watermark is not None:
+            changed_at = func.coalesce(Product.updated_at, Product.created_at)
+            query = query.filter(changed_at >= self.watermark - self.refresh_overlap)
+        count = 0
+        for row in query.yield_per(1000):
+            if not self.upsert(row):
+                continue
+            changed = row.updated_at or row.created_at
+            if changed and (self.watermark is None or changed > self.watermark):
+                self.watermark = changed
+            count += 1
+        self.stats.update(products=self._state.live_count, terms=len(self._state.postings), refreshed_at=time.time())
+        return count
+
+    def upsert(self, product: Any) -> bool:
+        """插入或更新单个商品（接受 Product 实例或查询结果行），返回是否写入"""
+        if not self.loaded:
+            return False
+        with self._lock:
+            return self._state.add(product)
+
+    def remove(self, product_id: int) -> None:
+        if not self.loaded:
+            return
+        with self._lock:
+            self._state.remove(product_id)
+
+    # ---- 查询 ----
+
+    def search(
+        self,
+        query: str,
+        limit: int = 20,
+        category_id: Optional[int] = None,
+        platform: Optional[str] = None,
+    ) -> Tuple[List[Tuple[int, float]], int]:
+        """
+        搜索商品
+
+        Returns:
+            （按得分降序的 [(商品ID, 得分)], 命中商品数）
+        """
+        started = time.perf_counter()
+        with self._lock:
+            hits, total = self._state.search(tokenize(query), limit, category_id, platform)
+        elapsed = time.perf_counter() - started
+        self.stats["searches"] += 1
+        self.stats["search_seconds_total"] += elapsed
+        self.stats["search_seconds_max"] = max(self.stats["search_seconds_max"], elapsed)
+        return hits, total
+
+    def get_stats(self) -> Dict[str, Any]:
+        searches = self.stats["searches"]
+        return {
+            "loaded": self.loaded,
+            **self.stats,
+            "tombstones": self._state.tombstones,
+            "avg_search_ms": round(self.stats["search_seconds_total"] / searches * 1000, 3) if searches else 0.0,
+        }
+
+
+def highlight(text: Optional[str], query: str, max_chars: Optional[int] = None) -> Optional[str]:
+    """
+    用 <em> 标出文本中与查询词匹配的部分（其余内容做HTML转义）
+
+    max_chars 不为空时截取第一个命中位置附近的片段。
+    """
+    if not text:
+        return text
+    terms = set(tokenize(query))
+    # 逐字归一化，保证与原文下标一一对应
+    norm = "".join(n if len(n := _normalize(ch)) == 1 else ch for ch in text)
+    marked = bytearray(len(text))
+    for i, ch in enumerate(norm):
+        if not _CJK.match(ch):
+            continue
+        if ch in terms:
+            marked[i] = 1
+        # 只比较完整的二元组；单字词已在上面处理，末尾切片不足两字时会误判为单字
+        if i + 1 < len(norm) and norm[i:i + 2] in terms:
+            marked[i] = marked[i + 1] = 1
+    for match in _TOKEN.finditer(norm):
+        if match.group() in terms:
+            marked[match.start():match.end()] = b"\x01" * (match.end() - match.start())
+
+    start, end = 0, len(text)
+    if max_chars and len(text) > max_chars:
+        first = marked.find(1)
+        start = max(0, first - max_chars // 4) if first >= 0 else 0
+        end = min(len(text), start + max_chars)
+
+    parts = ["…"] if start > 0 else []
+    i = start
+    while i < end:
+        j = i
+        while j < end and marked[j] == marked[i]:
+            j += 1
+        segment = escape(text[i:j])
+        parts.append(f"<em>{segment}</em>" if marked[i] else segment)
+        i = j
+    if end < len(text):
+        parts.append("…")
+    return "".join(parts)
+
+
+async def run_refresh_loop(index: ProductSearchIndex, interval: float) -> None:
+    """后台任务：首次全量加载，之后定期增量刷新"""
+    while True:
+        try:
+            await asyncio.to_thread(_refresh_with_session, index)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"商品搜索索引刷新失败: {e!r}")
+        await asyncio.sleep(interval)
+
+
+def _refresh_with_session(index: ProductSearchIndex) -> None:
+    db = SessionLocal()
+    try:
+        index.refresh(db)
+    finally:
+        db.close()
+
+
+# 创建全局实例
+product_search_index = ProductSearchIndex(refresh_overlap=settings.INDEX_REFRESH_OVERLAP)
@@ -0,0 +1,64 @@
+"""
+请求合并（single-flight）- 相同键的并发调用共享同一次执行
+用于在流量高峰时把大量相同请求合并为一次LLM/数据库调用
+"""
+from typing import Any, Awaitable, Callable, Dict, TypeVar
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    异步请求合并器
+
+    第一个调用者启动执行，执行结束前到达的相同键调用直接等待同一结果。
+    执行任务被 shield 保护：发起者断开连接不会取消其他等待者的结果。
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[str, int] = {}
+        self.stats = {"calls": 0, "executions": 0, "merged": 0, "max_waiters": 0}
+
+    def _on_done(self, key: str, task: asyncio.Task) -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+            self._waiters.pop(key, None)
+        # 取出异常，避免所有等待者都已离开时出现 "exception was never retrieved"
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug(f"[{self.name}] 合并执行失败: {task.exception()!r}")
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        执行或加入相同键的执行
+
+        Args:
+            key: 合并键，键相同的调用共享结果
+            fn: 无参协程工厂，仅在没有进行中的执行时调用
+        """
+        self.stats["calls"] += 1
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            self._waiters[key] = 1
+            self.stats["executions"] += 1
+            task.add_done_callback(lambda t: self._on_done(key, t))
+        else:
+            self._waiters[key] += 1
+            self.stats["merged"] += 1
+            self.stats["max_waiters"] = max(self.stats["max_waiters"], self._waiters[key])
+        return await asyncio.shield(task)
+
+    def get_stats(self) -> Dict[str, Any]:
+        calls = self.stats["calls"]
+        return {
+            **self.stats,
+            "in_flight": len(self._tasks),
+            "merge_rate": round(self.stats["merged"] / calls, 4) if calls else 0.0,
+        }
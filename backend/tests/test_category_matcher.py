@@ -0,0 +1,35 @@
+"""分类关键词匹配：索引基于分类缓存的快照，随缓存失效重建"""
+import asyncio
+
+from app.services.category_cache import CategoryCache, CategorySnapshot
+from app.services.category_matcher import CategoryMatcher
+
+
+def _category(id, name, description=None):
+    return {"id": id, "name": name, "description": description, "icon": None, "created_at": None, "updated_at": None}
+
+
+def _cache(version, rows):
+    cache = CategoryCache(ttl=300)
+    cache.version = version
+    cache._snapshot = CategorySnapshot(version, rows)
+    return cache
+
+
+def test_match_uses_cache_snapshot():
+    cache = _cache(0, [_category(1, "电子产品"), _category(2, "手工艺品", "陶艺、编织、木雕等")])
+    matcher = CategoryMatcher(cache)
+    assert asyncio.run(matcher.match(["耳机"])) == [(1, "电子产品")]
+    assert asyncio.run(matcher.match(["木雕"])) == [(2, "手工艺品")]
+    assert matcher.stats["builds"] == 1
+
+
+def test_rebuilds_after_cache_invalidation():
+    cache = _cache(0, [_category(1, "电子产品")])
+    matcher = CategoryMatcher(cache)
+    assert asyncio.run(matcher.match(["绿植"])) == []
+
+    cache.invalidate()
+    cache._snapshot = CategorySnapshot(cache.version, [_category(1, "电子产品"), _category(3, "绿植花卉")])
+    assert asyncio.run(matcher.match(["绿植"])) == [(3, "绿植花卉")]
+    assert matcher.stats["builds"] == 2
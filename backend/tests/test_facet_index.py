@@ -0,0 +1,86 @@
+"""商品分面索引：价格分桶和增量刷新"""
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from app.services.facet_index import ProductFacetIndex
+from app.services.search_index import ProductSearchIndex
+
+NOW = datetime(2026, 10, 17, tzinfo=timezone.utc)
+
+
+def _row(id, price=None, changed=NOW, name="商品"):
+    return SimpleNamespace(
+        id=id, price=price, rating=None, sales_count=None, created_at=changed, updated_at=None,
+        suitable_gender=None, suitable_age_range=None, style=None, category_id=1, platform="jd",
+        tags=[], suitable_scenes=[], name=name, brand=None, description="",
+    )
+
+
+class _Query:
+    """模拟 db.query(...)：只支持增量刷新用到的 filter(changed_at >= since) 和 yield_per"""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def filter(self, condition):
+        since = condition.right.value
+        return _Query([r for r in self.rows if (r.updated_at or r.created_at) >= since])
+
+    def yield_per(self, _):
+        return iter(self.rows)
+
+
+class _Session:
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+
+    def query(self, *_):
+        return _Query(self.rows)
+
+
+def test_price_filter_works_after_loading_empty_catalog():
+    index = ProductFacetIndex()
+    index.load(_Session())
+    index.upsert(_row(1, price=99.0))
+    index.upsert(_row(2, price=500.0))
+    index.upsert(_row(3))
+    assert index.search(price_min=50, price_max=200) == [1]
+    assert index.search(price_min=300) == [2]
+
+
+def test_refresh_rebuilds_coarse_price_buckets():
+    db = _Session([_row(1, price=10.0)])
+    index = ProductFacetIndex()
+    index.load(db)
+    db.rows += [_row(i, price=float(i), changed=NOW + timedelta(seconds=i)) for i in range(2, 200)]
+    index.refresh(db)
+    assert len(index._state.price_edges) > 1
+    assert sorted(index.search(price_min=150, price_max=151, limit=10)) == [150, 151]
+
+
+def test_refresh_picks_up_late_commit_behind_watermark():
+    db = _Session([_row(1, price=10.0)])
+    index = ProductFacetIndex(refresh_overlap=60)
+    index.load(db)
+    db.rows.append(_row(2, price=20.0, changed=NOW + timedelta(seconds=30)))
+    assert index.refresh(db) == 1
+    # 事务开始较早、提交较晚：时间戳早于已推进的水位线
+    db.rows.append(_row(3, price=30.0, changed=NOW + timedelta(seconds=10)))
+    assert index.refresh(db) == 1
+    assert sorted(index.search(price_min=25)) == [3]
+    # 回看窗口内未变化的商品不会重复写入
+    assert index.refresh(db) == 0
+    assert not index._state.dirty - {1, 2}
+
+
+def test_search_index_refresh_overlap():
+    db = _Session([_row(1, name="蓝牙耳机")])
+    index = ProductSearchIndex(refresh_overlap=60)
+    index.load(db)
+    db.rows.append(_row(2, name="头戴耳机", changed=NOW + timedelta(seconds=30)))
+    assert index.refresh(db) == 1
+    db.rows.append(_row(3, name="耳机礼盒", changed=NOW + timedelta(seconds=10)))
+    assert index.refresh(db) == 1
+    assert index.refresh(db) == 0
+    hits, _ = index.search("耳机", 10)
+    assert sorted(pid for pid, _ in hits) == [1, 2, 3]
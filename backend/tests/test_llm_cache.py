@@ -0,0 +1,38 @@
+"""LLM结果缓存：Redis不可达时暂停访问"""
+import asyncio
+
+import redis.asyncio as aioredis
+
+from app.services.llm_cache import LLMCache
+
+
+class _DownRedis:
+    def __init__(self):
+        self.calls = 0
+
+    async def get(self, key):
+        self.calls += 1
+        raise aioredis.ConnectionError("connection refused")
+
+    async def set(self, key, value, ex=None):
+        self.calls += 1
+        raise aioredis.ConnectionError("connection refused")
+
+
+def test_redis_skipped_after_connection_error():
+    cache = LLMCache(namespace="test", ttl=60, local_size=8)
+    cache.redis_enabled = True
+    cache._redis = redis = _DownRedis()
+
+    assert asyncio.run(cache.get("a")) is None
+    assert asyncio.run(cache.get("b")) is None
+    asyncio.run(cache.set("c", {"v": 1}))
+    assert redis.calls == 1
+    assert cache.stats["redis_skipped"] == 2
+    # 进程内缓存照常可用
+    assert asyncio.run(cache.get("c")) == {"v": 1}
+
+    # 暂停期过后重新尝试
+    cache._redis_down_until = 0.0
+    assert asyncio.run(cache.get("d")) is None
+    assert redis.calls == 2
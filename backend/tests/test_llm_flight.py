@@ -0,0 +1,58 @@
+"""需求分析/推荐理由的请求合并：只合并同一优先级的并发调用"""
+import asyncio
+
+from app.services.llm_scheduler import PRIORITY_ANONYMOUS, PRIORITY_BATCH, PRIORITY_VIP
+from app.services.ollama_service import OllamaService
+
+PRODUCTS = [{"id": 1, "name": "蓝牙耳机", "price": 199.0, "style": "实用型", "description": ""}]
+USER_REQUEST = {"style": "实用型"}
+
+
+def _service():
+    service = OllamaService(base_url="http://primary:11434")
+    service.state = "ready"
+    service.analysis_cache.redis_enabled = False
+    service.reasoning_cache.redis_enabled = False
+    return service
+
+
+def test_analysis_flight_merges_only_within_priority():
+    service = _service()
+    calls = []
+
+    async def run_analysis(prompt, cache_key, priority):
+        calls.append(priority)
+        await asyncio.sleep(0.05)
+        return {"filters": {}, "sort_by": "relevance"}
+
+    service._run_analysis = run_analysis
+
+    async def run():
+        await asyncio.gather(*[
+            service.analyze_user_request(user_query="送给喜欢露营的朋友", priority=priority)
+            for priority in (PRIORITY_BATCH, PRIORITY_BATCH, PRIORITY_VIP)
+        ])
+
+    asyncio.run(run())
+    assert sorted(calls) == [PRIORITY_VIP, PRIORITY_BATCH]
+
+
+def test_reasoning_flight_merges_only_within_priority():
+    service = _service()
+    calls = []
+
+    async def run_reasoning(products, user_request, cache_key, priority):
+        calls.append(priority)
+        await asyncio.sleep(0.05)
+        return "推荐理由"
+
+    service._run_reasoning = run_reasoning
+
+    async def run():
+        return await asyncio.gather(*[
+            service.generate_recommendation_reasoning(PRODUCTS, USER_REQUEST, priority=priority)
+            for priority in (PRIORITY_ANONYMOUS, PRIORITY_ANONYMOUS, PRIORITY_VIP)
+        ])
+
+    assert asyncio.run(run()) == ["推荐理由"] * 3
+    assert sorted(calls) == [PRIORITY_VIP, PRIORITY_ANONYMOUS]
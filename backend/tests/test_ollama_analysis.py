@@ -0,0 +1,29 @@
+"""需求分析：缓存命中不依赖模型就绪"""
+import asyncio
+
+from app.services.llm_cache import request_signature
+from app.services.ollama_service import OllamaService
+
+REQUEST = {"user_query": "送给喜欢露营的朋友", "budget_max": 300}
+
+
+def test_cached_analysis_skips_waiting_for_model():
+    service = OllamaService(base_url="http://primary:11434")
+    service.state = "connecting"
+    service.analysis_cache.redis_enabled = False
+
+    async def never_ready():
+        raise AssertionError("缓存命中时不应等待模型就绪")
+
+    service.wait_until_ready = never_ready
+    fields = {
+        "recipient_type": None, "age_range": None, "gender": None, "relationship": None,
+        "occasion": None, "budget_min": None, "budget_max": 300, "style": None, "mbti": None,
+        "zodiac": None, "interests": None, "user_query": "送给喜欢露营的朋友",
+    }
+    cached = {"filters": {"tags": ["户外"]}, "sort_by": "rating_desc"}
+    service.analysis_cache.local.set(request_signature(fields), cached)
+
+    result = asyncio.run(service.analyze_user_request(**REQUEST))
+    assert result["filters"] == {"tags": ["户外"], "price_max": 300}
+    assert result["sort_by"] == "rating_desc"
@@ -0,0 +1,127 @@
+"""Ollama 节点故障切换：节点进行中请求数在任何退出路径上都要结算"""
+import asyncio
+from contextlib import aclosing
+
+import httpx
+import pytest
+
+from app.services.ollama_pool import LLMUnavailableError
+from app.services.ollama_service import OllamaService
+
+
+class _ConnectFailClient:
+    async def generate(self, **kwargs):
+        raise httpx.ConnectError("connection refused")
+
+
+class _BrokenStreamClient:
+    async def generate(self, **kwargs):
+        async def chunks():
+            raise RuntimeError("stream broken")
+            yield  # pragma: no cover
+
+        return chunks()
+
+
+class _OkClient:
+    async def generate(self, **kwargs):
+        async def chunks():
+            yield {"response": "你好", "done": False}
+            yield {"response": "！", "done": True, "eval_count": 2}
+
+        return chunks()
+
+
+def _service(*clients):
+    service = OllamaService(base_url="http://primary:11434")
+    pool = service.router.route("analysis").pool
+    pool.endpoints = pool.endpoints[:len(clients)]
+    for endpoint, client in zip(pool.endpoints, clients):
+        endpoint.client = client
+    return service, pool
+
+
+async def _collect(service, timeout=5.0):
+    return [c async for c in service._generate_stream_unscheduled("prompt", {}, timeout)]
+
+
+def test_stream_connect_failures_release_in_flight():
+    service, pool = _service(_ConnectFailClient(), _ConnectFailClient())
+    with pytest.raises(LLMUnavailableError):
+        asyncio.run(_collect(service))
+    assert [ep.in_flight for ep in pool.endpoints] == [0, 0]
+
+
+def test_stream_first_chunk_error_releases_in_flight():
+    service, pool = _service(_BrokenStreamClient())
+    with pytest.raises(RuntimeError):
+        asyncio.run(_collect(service))
+    assert pool.endpoints[0].in_flight == 0
+
+
+def test_stream_failover_then_success():
+    service, pool = _service(_ConnectFailClient(), _OkClient())
+    assert asyncio.run(_collect(service)) == ["你好", "！"]
+    assert [ep.in_flight for ep in pool.endpoints] == [0, 0]
+
+
+class _SlowClient:
+    def __init__(self, delay, fail=False):
+        self.delay = delay
+        self.fail = fail
+
+    async def generate(self, **kwargs):
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise httpx.ConnectError("connection refused")
+        return {"response": "ok", "done": True}
+
+
+def _call(service, timeout):
+    route = service.router.route("analysis")
+    return asyncio.run(service._call_with_failover(
+        route, lambda client, model: client.generate(model=model), timeout=timeout,
+    ))
+
+
+def test_failover_shares_one_deadline():
+    # 每个节点单独看都在超时之内，但合计超出
+    service, pool = _service(_SlowClient(0.2, fail=True), _SlowClient(0.2))
+    with pytest.raises(asyncio.TimeoutError):
+        _call(service, timeout=0.3)
+    assert [ep.in_flight for ep in pool.endpoints] == [0, 0]
+
+
+def test_failover_within_deadline_succeeds():
+    service, pool = _service(_SlowClient(0.05, fail=True), _SlowClient(0.05))
+    assert _call(service, timeout=1.0)["response"] == "ok"
+
+
+class _LongStreamClient:
+    async def generate(self, **kwargs):
+        async def chunks():
+            for i in range(100):
+                yield {"response": f"第{i}段", "done": False}
+            yield {"response": "", "done": True}
+
+        return chunks()
+
+
+def test_reasoning_stream_closed_early_releases_endpoint():
+    service = OllamaService(base_url="http://primary:11434")
+    service.state = "ready"
+    service.reasoning_cache.redis_enabled = False
+    pool = service.router.route("reasoning").pool
+    pool.endpoints = pool.endpoints[:1]
+    pool.endpoints[0].client = _LongStreamClient()
+    products = [{"id": 1, "name": "蓝牙耳机", "price": 199.0, "style": "实用型", "description": ""}]
+
+    async def read_first():
+        # 模拟客户端断开：只读一段就关闭生成器，关闭后立即释放节点（不等垃圾回收）
+        async with aclosing(service.stream_recommendation_reasoning(products, {})) as stream:
+            async for chunk in stream:
+                assert pool.endpoints[0].in_flight == 1
+                break
+        return chunk, pool.endpoints[0].in_flight
+
+    assert asyncio.run(read_first()) == ("第0段", 0)
@@ -0,0 +1,51 @@
+"""Ollama 节点池：健康探测、备用地址清理和节点选择"""
+import asyncio
+
+from app.services.ollama_pool import OPEN, OllamaPool
+
+
+def _pool(*urls, alternatives=()):
+    return OllamaPool(list(urls), alternatives=alternatives)
+
+
+def _set_probe(endpoint, ok):
+    async def probe():
+        return ok
+
+    endpoint.probe = probe
+
+
+def test_failed_probe_keeps_open_endpoint_rejecting():
+    pool = _pool("http://a:11434")
+    endpoint = pool.endpoints[0]
+    _set_probe(endpoint, False)
+    asyncio.run(pool.probe_all())
+    assert endpoint.breaker.state == OPEN
+    # 熔断恢复时间已过，但探测仍失败：重新计时，不进入 half_open
+    endpoint.breaker._opened_at -= endpoint.breaker.open_seconds + 1
+    asyncio.run(pool.probe_all())
+    assert endpoint.breaker.rejecting()
+    assert endpoint.breaker.stats["opened"] == 1
+
+
+def test_drop_unreachable_alternatives():
+    pool = _pool("http://configured:11434", "http://ollama:11434", "http://localhost:11434",
+                 alternatives=["http://ollama:11434", "http://localhost:11434"])
+    configured, alternate_dead, alternate_alive = pool.endpoints
+    _set_probe(configured, False)
+    _set_probe(alternate_dead, False)
+    _set_probe(alternate_alive, True)
+    asyncio.run(pool.probe_all())
+    pool.drop_unreachable()
+    assert pool.endpoints == [configured, alternate_alive]
+
+
+def test_acquire_prefers_endpoints_with_latency_data():
+    pool = _pool("http://new:11434", "http://known:11434")
+    new, known = pool.endpoints
+    known.begin()
+    known.end(2.0)
+    assert pool.acquire() is known
+    # 已知节点繁忙时新节点分到流量
+    known.begin()
+    assert pool.acquire() is new
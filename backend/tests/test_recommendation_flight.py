@@ -0,0 +1,31 @@
+"""推荐请求合并：只合并同一优先级的并发请求"""
+import asyncio
+from types import SimpleNamespace
+
+from app.api import recommendations
+from app.models.user import UserRole
+from app.schemas.recommendation import RecommendationRequest, RecommendationResponse
+from app.services.llm_scheduler import PRIORITY_ANONYMOUS, PRIORITY_VIP
+
+
+def test_flight_merges_only_within_priority(monkeypatch):
+    calls = []
+
+    async def recommend(request, priority):
+        calls.append(priority)
+        await asyncio.sleep(0.05)
+        return RecommendationResponse(categories=[], products=[], reasoning="")
+
+    monkeypatch.setattr(recommendations, "_recommend", recommend)
+    request = RecommendationRequest(style="浪漫型")
+    vip = SimpleNamespace(role=UserRole.VIP)
+
+    async def run():
+        await asyncio.gather(
+            recommendations.get_recommendations(request, None, None),
+            recommendations.get_recommendations(request, None, None),
+            recommendations.get_recommendations(request, None, vip),
+        )
+
+    asyncio.run(run())
+    assert sorted(calls) == [PRIORITY_VIP, PRIORITY_ANONYMOUS]
@@ -0,0 +1,72 @@
+"""推荐接口的数据库会话：只在查询期间占用连接，等待LLM时不持有"""
+import asyncio
+
+from app.api import recommendations
+from app.schemas.recommendation import BatchRecommendationRequest, RecommendationRequest
+
+PRODUCT = {"id": 1, "name": "蓝牙耳机", "price": 199.0, "style": "实用型", "description": ""}
+
+
+class _Sessions:
+    """模拟 AsyncSessionLocal，记录同时打开的会话数"""
+
+    def __init__(self):
+        self.open = 0
+        self.opened = 0
+
+    def __call__(self):
+        return self
+
+    async def __aenter__(self):
+        self.open += 1
+        self.opened += 1
+        return object()
+
+    async def __aexit__(self, *exc):
+        self.open -= 1
+
+
+def _patch(monkeypatch, sessions, held):
+    async def analyze(request, priority):
+        await asyncio.sleep(0)
+        return {"source": "llm", "filters": {}, "sort_by": "relevance", "reasoning": ""}
+
+    async def query_products(request, ai_analysis, db):
+        return [PRODUCT], ["电子产品"]
+
+    async def reasoning(products, user_request, priority):
+        held.append(sessions.open)
+        return "推荐理由"
+
+    monkeypatch.setattr(recommendations, "AsyncSessionLocal", sessions)
+    monkeypatch.setattr(recommendations, "_analyze_request", analyze)
+    monkeypatch.setattr(recommendations, "_query_products", query_products)
+    monkeypatch.setattr(recommendations.ollama_service, "generate_recommendation_reasoning", reasoning)
+
+
+def test_recommend_releases_session_before_reasoning(monkeypatch):
+    sessions, held = _Sessions(), []
+    _patch(monkeypatch, sessions, held)
+    response = asyncio.run(recommendations._recommend(RecommendationRequest(style="实用型")))
+    assert response.reasoning == "推荐理由"
+    assert held == [0]
+    assert sessions.open == 0 and sessions.opened == 2
+
+
+def test_batch_releases_session_before_reasoning(monkeypatch):
+    sessions, held = _Sessions(), []
+    _patch(monkeypatch, sessions, held)
+
+    async def search_ids(criteria_by_key, db):
+        return {key: [1] for key in criteria_by_key}
+
+    async def fetch_rows(db, query):
+        return [PRODUCT]
+
+    monkeypatch.setattr(recommendations.product_facet_index, "loaded", False)
+    monkeypatch.setattr(recommendations, "_search_ids_sql_batch", search_ids)
+    monkeypatch.setattr(recommendations, "fetch_rows", fetch_rows)
+    batch = BatchRecommendationRequest(requests=[RecommendationRequest(style="实用型"), RecommendationRequest(style="浪漫型")])
+    asyncio.run(recommendations.get_batch_recommendations(batch, None))
+    assert held == [0, 0]
+    assert sessions.open == 0 and sessions.opened == 1
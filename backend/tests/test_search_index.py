@@ -0,0 +1,66 @@
+"""商品搜索索引：分词、BM25 检索和高亮"""
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from app.services.search_index import _SearchState, highlight, tokenize
+
+NOW = datetime(2026, 10, 17, tzinfo=timezone.utc)
+
+
+def _row(id, name, description="", brand=None, tags=None, category_id=1, platform="jd"):
+    return SimpleNamespace(
+        id=id, name=name, description=description, brand=brand, tags=tags or [],
+        category_id=category_id, platform=platform, created_at=NOW, updated_at=None,
+    )
+
+
+def test_tokenize_bigrams_and_words():
+    assert tokenize("蓝牙耳机 Sony") == ["蓝牙", "牙耳", "耳机", "sony"]
+    assert tokenize("笔") == ["笔"]
+
+
+def test_highlight_single_char_at_end_of_text():
+    assert highlight("精致钢笔", "笔") == "精致钢<em>笔</em>"
+
+
+def test_highlight_bigram_at_end_of_text():
+    assert highlight("精致钢笔", "钢笔") == "精致<em>钢笔</em>"
+
+
+def test_highlight_escapes_and_marks_words():
+    assert highlight("蓝牙耳机<Sony>", "蓝牙 sony") == "<em>蓝牙</em>耳机&lt;<em>Sony</em>&gt;"
+
+
+def test_search_ranks_and_filters():
+    state = _SearchState()
+    state.add(_row(1, "蓝牙耳机", "无线蓝牙"))
+    state.add(_row(2, "头戴式耳机", platform="taobao"))
+    state.add(_row(3, "香水礼盒"))
+
+    hits, total = state.search(tokenize("蓝牙耳机"), 10)
+    assert [pid for pid, _ in hits] == [1, 2]
+    assert total == 2
+
+    hits, _ = state.search(tokenize("耳机"), 10, platform="taobao")
+    assert [pid for pid, _ in hits] == [2]
+
+
+def test_single_char_query_expands_to_bigrams():
+    state = _SearchState()
+    state.add(_row(1, "精致钢笔"))
+    state.add(_row(2, "香水礼盒"))
+    hits, _ = state.search(tokenize("笔"), 10)
+    assert [pid for pid, _ in hits] == [1]
+
+
+def test_update_replaces_old_slot():
+    state = _SearchState()
+    row = _row(1, "蓝牙耳机")
+    state.add(row)
+    state.add(row)
+    assert state.tombstones == 0
+
+    row.name, row.updated_at = "有线耳机", NOW.replace(day=18)
+    state.add(row)
+    assert state.tombstones == 1
+    assert state.search(tokenize("蓝牙"), 10) == ([], 0)
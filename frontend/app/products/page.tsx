@@ -35,7 +35,7 @@ export default function ProductsPage() {
       }
       
       const data = await response.json()
-      setProducts(data)
+      setProducts(data.items)
     } catch (err) {
       setError(err instanceof Error ? err.message : '未知错误')
     } finally {